@@ -1,16 +1,69 @@
-import os, time, tabulate, locale, datetime as dt
+import os, sys, time, tabulate, locale, itertools, functools, threading, datetime as dt
 
 from typing import *
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 from security_db_wrapper import *
+from portfolio import BuildPriceMatrix, BacktestPortfolio, ParseWeights, ValidateSchedule
+from jobs import BackgroundJob
+from http_cache import ResponseCache, CacheMode, SetCache, GetCache
+import metrics
 
 CURRENT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
 DATABASE_FILE_PATH = '/assets/securities_data.db'
+PRICE_STORE_PATH = '/assets/price_store'
+HTTP_CACHE_PATH = '/assets/http_cache'
 API_FILE_PATH = '/assets/api_keys.txt'
 LOG_FILE_PATH = '/assets/logs - {}.txt'
+METRICS_FILE_PATH = '/assets/metrics - {}.json'
 HELP_FILE_PATH = '/assets/program_help.txt'
 
+# Number of threads used to download data during an update
+UPDATE_WORKER_COUNT = 16
+# Number of processes used to run a backtest sweep
+BACKTEST_WORKER_COUNT = os.cpu_count()
+# Number of rows shown at a time by the view command
+VIEW_PAGE_SIZE = 50
+# Most bytes of downloaded responses kept on disk, see http_cache.py
+HTTP_CACHE_MAX_SIZE = 512 * 1024 ** 2
+
 security_db = None
 td_ameritrade_api_key = ""
+# Jobs started with `update -bg`, by id
+background_jobs = {}
+# (date, file) of the open log file, see WriteLog()
+log_file = None
+log_lock = threading.Lock()
+
+def WriteLog(message : str) -> None:
+  """
+  Adds a line to today's log file. The file is kept open and written to in buffered blocks until
+  CloseLog() is called or the day changes, instead of being reopened for every line
+  """
+
+  global log_file
+
+  with log_lock:
+    log_date = dt.datetime.now().date()
+
+    if log_file == None or log_file[0] != log_date:
+      if log_file != None:
+        log_file[1].close()
+
+      log_file = (log_date, open(CURRENT_DIRECTORY + LOG_FILE_PATH.format(log_date.strftime('%Y-%m-%d')), mode='a+'))
+
+    log_file[1].write(message + '\n')
+
+def CloseLog() -> None:
+  """
+  Writes any buffered log lines to the log file and closes it
+  """
+
+  global log_file
+
+  with log_lock:
+    if log_file != None:
+      log_file[1].close()
+      log_file = None
 
 def ProgramStatusUpdate(message : str, log = False) -> None:
   """
@@ -23,10 +76,7 @@ def ProgramStatusUpdate(message : str, log = False) -> None:
   print(f"{current_time} - {message}")
 
   if log:
-    current_log_file = CURRENT_DIRECTORY + LOG_FILE_PATH.format(dt.datetime.now().date().strftime('%Y-%m-%d'))
-    
-    with open(current_log_file, mode='a+') as log_file:
-      log_file.write(print_message + '\n')
+    WriteLog(print_message)
 
 def ProgressBar(iteration : int, total : int, start_time : dt.datetime, length = 75, message = "", log = False) -> None:
   """
@@ -53,139 +103,282 @@ def ProgressBar(iteration : int, total : int, start_time : dt.datetime, length =
     print("\r\n")
 
   if log:
-    current_log_file = CURRENT_DIRECTORY + LOG_FILE_PATH.format(dt.datetime.now().date().strftime('%Y-%m-%d'))
-    
-    with open(current_log_file, mode='a+') as log_file:
-      log_file.write(print_message + '\n')
+    WriteLog(print_message)
+
+def ConcurrentMap(func : Callable[[Any], Any], items : Iterable[Any], worker_count : int) -> Iterator[Tuple[Any, Any]]:
+  """
+  Calls func on every item using a pool of worker_count threads and yields (item, result) pairs
+  in the order they finish. Results are yielded on the calling thread, so anything done with them
+  (ex. writing to the database) stays on a single thread. Only 2 * worker_count items are queued at
+  a time, so if the caller stops early or func raises, the pool only has those left to finish
+  """
+
+  items = iter(items)
+  window_size = 2 * worker_count
+
+  with ThreadPoolExecutor(max_workers=worker_count) as executor:
+    futures = {executor.submit(func, item) : item for item in itertools.islice(items, window_size)}
 
-def UpdateEquitiesData(expire_date : Optional[dt.datetime] = dt.datetime.now()) -> None:
+    try:
+      while len(futures) > 0:
+        done_futures, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+        for future in done_futures:
+          item = futures.pop(future)
+
+          # Queue the next item before handing over the result so the workers are kept busy
+          for next_item in itertools.islice(items, 1):
+            futures[executor.submit(func, next_item)] = next_item
+
+          yield item, future.result()
+    finally:
+      # Items that have not started are dropped if the caller stops early (ex. a cancelled job)
+      executor.shutdown(cancel_futures=True)
+
+def UpdateEquitiesData(expire_date : Optional[dt.datetime] = dt.datetime.now(), worker_count = UPDATE_WORKER_COUNT,
+                       db : Optional[SecurityDatabaseWrapper] = None,
+                       status_func : Callable[[str], None] = ProgramStatusUpdate,
+                       progress_func : Callable[..., None] = ProgressBar,
+                       cancel_event : Optional[threading.Event] = None) -> None:
   """
   This function will add any equity that is in the ListedEquities table and not in the Equities table
-  to the Equities table and update any Equity who was last updated past the expire_date
+  to the Equities table and update any Equity who was last updated past the expire_date. The equities'
+  data is downloaded on worker_count threads at once. db is the database to update (default: security_db).
+  Once cancel_event is set, no more equities are downloaded and the ones already downloaded are saved
   """
   time_ranges_to_update = ['1D', '1W', '1M', '3M', '1Y', '5Y', '10Y', 'Max']
+  db = db if db != None else security_db
+  is_cancelled = lambda: cancel_event != None and cancel_event.is_set()
 
   # --- SECTION: Add any new equities to Equities table ---
-  ProgramStatusUpdate("Getting data for new companies...")
+  status_func("Getting data for new companies...")
 
-  all_equity_listings = security_db.GetSecurities(SecurityType.EquityListing)
+  with metrics.Timer('phase.update_equities.new_companies'):
+    all_equity_listings = db.GetSecurities(SecurityType.EquityListing, [('Delisted', RelationalOperator.EqualTo, 0)])
 
-  equities_with_data = [equity.Symbol for equity in security_db.GetSecurities(SecurityType.Equity)]
-  equities_without_data = list(filter(lambda equity: equity.Symbol not in equities_with_data, all_equity_listings))
+    equities_with_data = set([equity.Symbol for equity in db.GetSecurities(SecurityType.Equity)])
+    equities_without_data = list(filter(lambda equity: equity.Symbol not in equities_with_data, all_equity_listings))
 
-  start_time = dt.datetime.now()
+    start_time = dt.datetime.now()
+    get_new_data = lambda equity: Equity.GetPercentChangeOverTimeRanges(equity.Symbol, time_ranges_to_update)
+
+    def get_new_equities():
+      for (index, (equity_listing, new_data)) in enumerate(ConcurrentMap(get_new_data, equities_without_data, worker_count), start=0):
+        progress_func(index + 1, len(equities_without_data), start_time, message=f'Processing {equity_listing.Symbol}')
 
-  for (index, equity_listing) in enumerate(equities_without_data, start=0):
-    ProgressBar(index + 1, len(equities_without_data), start_time, message=f'Processing {equity_listing.Symbol}')
+        yield Equity(equity_listing.Symbol, equity_listing.CompanyName, *new_data)
 
-    new_data = Equity.GetPercentChangeOverTimeRanges(equity_listing.Symbol, time_ranges_to_update)
+        if is_cancelled():
+          return
 
-    new_equity = Equity(equity_listing.Symbol, equity_listing.CompanyName, *new_data)
-    security_db.AddNewSecurity(new_equity)
-    security_db.Save()
+    db.AddNewSecurities(get_new_equities())
   # --- END SECTION ----
 
+  if is_cancelled():
+    return
+
   # --- SECTION: Update expired equities ---
-  ProgramStatusUpdate("Updating old equities...")
+  status_func("Updating old equities...")
 
-  formatted_date = expire_date.strftime('%Y-%m-%d')
-  equities_to_update = security_db.GetSecurities(SecurityType.Equity, [('LastUpdated', RelationalOperator.LessThan, formatted_date)])
+  with metrics.Timer('phase.update_equities.old_equities'):
+    formatted_date = expire_date.strftime('%Y-%m-%d')
+    equities_to_update = db.GetSecurities(SecurityType.Equity, [('LastUpdated', RelationalOperator.LessThan, formatted_date)])
 
-  start_time = dt.datetime.now()
+    start_time = dt.datetime.now()
 
-  for (index, equity) in enumerate(equities_to_update, start=0):
-    ProgressBar(index + 1, len(equities_to_update), start_time, message=f'Processing {equity.Symbol}')
+    def get_updated_equities():
+      for (index, (equity, new_data)) in enumerate(ConcurrentMap(get_new_data, equities_to_update, worker_count), start=0):
+        progress_func(index + 1, len(equities_to_update), start_time, message=f'Processing {equity.Symbol}')
 
-    new_data = Equity.GetPercentChangeOverTimeRanges(equity.Symbol, time_ranges_to_update)
+        yield Equity(equity.Symbol, equity.CompanyName, *new_data)
 
-    new_equity = Equity(equity.Symbol, equity.CompanyName, *new_data)
-    security_db.ModifySecurities(new_equity, ('Symbol', RelationalOperator.EqualTo, new_equity.Symbol))
-    security_db.Save()
+        if is_cancelled():
+          return
+
+    db.UpsertSecurities(get_updated_equities())
   # --- END SECTION ---
 
-def UpdateSingleEquity(symbol : str) -> None:
+def UpdateSingleEquity(symbol : str, db : Optional[SecurityDatabaseWrapper] = None, **kwargs) -> None:
   """
-  This function updates a single equity's data
+  This function updates a single equity's data. Takes the same keyword arguments as UpdateEquitiesData()
   """
   
   time_ranges_to_update = ['1D', '1W', '1M', '3M', '1Y', '5Y', '10Y', 'Max']
+  db = db if db != None else security_db
   
   new_data = Equity.GetPercentChangeOverTimeRanges(symbol, time_ranges_to_update)
-  old_equity_entry = security_db.GetSecurities(SecurityType.Equity, ('Symbol', RelationalOperator.EqualTo, symbol))
+  old_equity_entry = db.GetSecurities(SecurityType.Equity, [('Symbol', RelationalOperator.EqualTo, symbol)])[0]
   new_equity = Equity(old_equity_entry.Symbol, old_equity_entry.CompanyName, *new_data)
 
-  security_db.ModifySecurities(new_equity, ('Symbol', RelationalOperator.EqualTo, new_equity.Symbol))
-  security_db.Save()
+  db.ModifySecurities(new_equity, ('Symbol', RelationalOperator.EqualTo, new_equity.Symbol))
+  db.Save()
+
+def UpdateOptionsData(expire_time : Optional[str] = '3m', worker_count = UPDATE_WORKER_COUNT,
+                      db : Optional[SecurityDatabaseWrapper] = None,
+                      status_func : Callable[[str], None] = ProgramStatusUpdate,
+                      progress_func : Callable[..., None] = ProgressBar,
+                      cancel_event : Optional[threading.Event] = None) -> None:
+  """
+  This function clears expired options and gets the options of every company without any, up to expire_time
+  from now. Takes the same arguments as UpdateEquitiesData()
+  """
+  db = db if db != None else security_db
 
-def UpdateOptionsData(expire_time : Optional[str] = '3m') -> None:
   #region Clear expired options
-  ProgramStatusUpdate("Clearing expired options...")
+  status_func("Clearing expired options...")
   
-  all_options = security_db.GetSecurities(SecurityType.Option)
-  start_time = dt.datetime.now()
-  for (index, option) in enumerate(all_options, start=0):
-    ProgressBar(index + 1, len(all_options), start_time, message=f'Processing {option.CompanySymbol}')
-    # expire date
-    month, day, year = re.search(r'.+?\s(\w{3})\s(\d+)\s(\d+)', option.Description).groups()
-
-    if dt.datetime.strptime(f'{month}-{day}-{year}', '%b-%d-%Y') < dt.datetime.now():
-      security_db.DeleteSecurity(option)
-      all_options.remove(option)
+  # Contracts expiring today can no longer be bought, so they are cleared too
+  with metrics.Timer('phase.update_options.clear_expired'):
+    deleted_count = db.DeleteExpiredOptions(dt.date.today() + dt.timedelta(days=1))
+  status_func(f"Cleared {deleted_count} expired options")
   #endregion
 
   #region Add any new option(s) to Options table
-  ProgramStatusUpdate("Getting new options...")
+  status_func("Getting new options...")
   
-  all_symbols = [equity_listing.Symbol for equity_listing in security_db.GetSecurities(SecurityType.EquityListing)]
-  companies_with_data = set([option.CompanySymbol for option in all_options])
-  companies_without_data = list(filter(lambda symbol: symbol not in companies_with_data, all_symbols))
+  with metrics.Timer('phase.update_options.new_options'):
+    all_symbols = [equity_listing.Symbol for equity_listing in db.GetSecurities(SecurityType.EquityListing, [('Delisted', RelationalOperator.EqualTo, 0)])]
+    companies_with_data = db.GetOptionCompanySymbols()
+    companies_without_data = list(filter(lambda symbol: symbol not in companies_with_data, all_symbols))
 
-  # Clear out lists no longer needed to save on memory
-  all_options = []
-  all_symbols = []
-  companies_with_data = []
-
-  start_time = dt.datetime.now()
+    start_time = dt.datetime.now()
+    get_new_options = lambda symbol: Option.GetOptionColumns(td_ameritrade_api_key, symbol, expire_time)
   
-  for (index, symbol) in enumerate(companies_without_data, start=0):
-    ProgressBar(index + 1, len(companies_without_data), start_time, message=f"Getting options for {symbol}")
-    new_options = Option.GetOptions(td_ameritrade_api_key, symbol, expire_time)
+    def get_all_new_options():
+      for (index, (symbol, new_option_columns)) in enumerate(ConcurrentMap(get_new_options, companies_without_data, worker_count), start=0):
+        progress_func(index + 1, len(companies_without_data), start_time, message=f"Getting options for {symbol}")
+
+        if new_option_columns != None:
+          yield new_option_columns
+
+        if cancel_event != None and cancel_event.is_set():
+          return
 
-    for option in new_options:
-      security_db.AddNewSecurity(option)
-      security_db.Save()
+    # Options are written straight from their columns, without an Option per contract
+    db.AddNewColumns(SecurityType.Option, get_all_new_options())
   #endregion
 
-def DisplayItems(items : List[Union[Equity, Option, EquityListing, Dict]]) -> None:
+def BacktestSweep(symbols : List[str], start_dates : List[str], principals : List[float], periodic_investments : List[float],
+                  periods : List[float], worker_count = BACKTEST_WORKER_COUNT) -> None:
   """
-  Takes list of a security and prints it 
+  This function backtests the DCA strategy on every symbol with every combination of the parameters
+  and saves the results to the Backtests table. Symbols are backtested in worker_count processes at once
   """
 
-  if len(items) == 0: 
-    return
+  ProgramStatusUpdate(f"Backtesting {len(symbols)} equities with {len(start_dates) * len(principals) * len(periodic_investments) * len(periods)} parameter sets each...")
+
+  start_time = dt.datetime.now()
+  get_prices = lambda symbol: Equity.GetPricesOverTimeRanges(symbol, start_dates)
+
+  def get_backtests():
+    # Prices are retrieved on this process, where the providers' rate limits are shared by every download, and
+    # the processes are only sent the price arrays to backtest
+    with ProcessPoolExecutor(max_workers=worker_count) as executor:
+      futures = {}
+      backtested_count = 0
+
+      def yield_completed(max_pending_count : int):
+        nonlocal backtested_count
+
+        while len(futures) > max_pending_count:
+          done, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+          for future in done:
+            backtested_count += 1
+            ProgressBar(backtested_count, len(symbols), start_time, message=f'Backtested {futures.pop(future)}')
+
+            yield from future.result()
+
+      for (symbol, prices) in ConcurrentMap(get_prices, symbols, UPDATE_WORKER_COUNT):
+        futures[executor.submit(Equity.SweepDollarCostAveragingOnPrices, symbol, start_dates, prices,
+                                principals, periodic_investments, periods)] = symbol
+
+        yield from yield_completed(2 * worker_count)
+
+      yield from yield_completed(0)
+
+  security_db.UpsertSecurities(get_backtests(), Backtest.KEY_COLUMNS)
+
+def __format_table_cell(cell : Any) -> Tuple[str, bool]:
+  """
+  Converts a table cell to text, and whether it is a number, which is aligned on the right like tabulate()
+  """
+
+  if cell == None:
+    return 'N/A', False
+  elif isinstance(cell, float):
+    return f'{cell:g}', True
+  elif isinstance(cell, int) and not isinstance(cell, bool):
+    return str(cell), True
+
+  return str(cell), False
+
+def __format_table_row(cells : List[Any], widths : List[int]) -> str:
+  """
+  Pads each cell to its column's width. Cells wider than their column are printed in full
+  """
+
+  formatted_cells = []
+
+  for (cell, width) in zip(cells, widths):
+    text, is_number = __format_table_cell(cell)
+    formatted_cells.append(text.rjust(width) if is_number else text.ljust(width))
+
+  return '  '.join(formatted_cells).rstrip()
+
+def DisplayItems(items : Iterable[Union[Equity, Option, EquityListing, Dict]], page_size = VIEW_PAGE_SIZE) -> bool:
+  """
+  Prints the items as a table, page_size rows at a time. Column widths are set from the first page, so it is
+  printed as soon as its rows are read, and the rest of the items are only read as the user asks for more pages.
+  Returns False if the user stopped before the last page
+  """
+
+  rows = iter(items)
+  first_page = list(itertools.islice(rows, page_size))
+
+  if len(first_page) == 0: 
+    return True
 
   ProgramStatusUpdate('Generating table...')
 
-  if isinstance(items[0], dict):
-    table = tabulate.tabulate(items, headers='keys')
-  else:
-    table = tabulate.tabulate([security.__dict__ for security in items], headers='keys')
-  
-  print(f'\n{table}\n')
+  to_dict = lambda item: item if isinstance(item, dict) else item.to_dict()
+  headers = list(to_dict(first_page[0]).keys())
+
+  widths = [len(header) for header in headers]
+
+  for item in first_page:
+    for (index, cell) in enumerate(to_dict(item).values(), start=0):
+      widths[index] = max(widths[index], len(__format_table_cell(cell)[0]))
+
+  header_lines = f"{__format_table_row(headers, widths)}\n{'  '.join(['-' * width for width in widths])}"
+  page = first_page
+  prompt_for_pages = sys.stdin.isatty()
+
+  while len(page) > 0:
+    print(f'\n{header_lines}')
+    print('\n'.join([__format_table_row(list(to_dict(item).values()), widths) for item in page]))
+
+    page = list(itertools.islice(rows, page_size))
+
+    if len(page) > 0 and prompt_for_pages:
+      if input('-- Enter for the next page, q to stop -- ').strip().lower() in ['q', 'quit']:
+        return False
 
-def __handle_init_command() -> None:
+  print()
+  return True
+
+def __handle_init_command(arguments : iter) -> None:
   """
   WARNING: Should only be called by CommandReader()\n
-  This function will scrape for listed equities then add them to the database
+  This function will scrape for listed equities then add the new ones to the database and update the changed ones
   """
   
+  flag_delisted = next(arguments, '').lower() in ['-d', '-delisted']
 
   equities = EquityListing.GetListedEquities(ProgramStatusUpdate, ProgressBar)
 
-  for equity in equities:
-    security_db.AddNewSecurity(equity)
-
-  security_db.Save()
+  changes = security_db.SyncListedEquities(equities, flag_delisted)
+  ProgramStatusUpdate(f"{changes['Added']} listings added, {changes['Changed']} changed, {changes['Delisted']} delisted")
 
 def __handle_update_command(arguments : iter) -> None:
   """
@@ -193,31 +386,195 @@ def __handle_update_command(arguments : iter) -> None:
   This function will update securities in the database according to the user's input
   """
 
+  worker_count = UPDATE_WORKER_COUNT
+  in_background = False
+  used_args = []
+
+  # Every update requested, called with the worker count, database and functions to report to once the options are all read
+  updates = []
+
   next_arg = next(arguments, None)
-      
-  if next_arg == None:
-    # If no additional options or arguments, assume user wants everything updated
-    UpdateEquitiesData()
-    UpdateOptionsData()
-  else:
-    while next_arg != None:
-      next_arg = next_arg.lower()
 
-      if next_arg in ['-a', '-all']:
-        UpdateEquitiesData()
-        UpdateOptionsData()
+  while next_arg != None:
+    next_arg = next_arg.lower()
+    used_args.append(next_arg)
 
-      elif next_arg in ['-s', '-single']:
-        equity_symbol = next(arguments)
-        UpdateSingleEquity(equity_symbol)
+    if next_arg in ['-w', '-workers']:
+      worker_arg = next(arguments, '')
 
-      elif next_arg in ['-e', '-equities', '-equity']:
-        UpdateEquitiesData()
-      
-      elif next_arg in ['-o', '-options', '-option']:
-        UpdateOptionsData()
-      
-      next_arg = next(arguments, None)
+      if not worker_arg.isdigit() or int(worker_arg) < 1:
+        ProgramStatusUpdate(f"Invalid worker count '{worker_arg}', expected a whole number of at least 1")
+        return
+
+      worker_count = int(worker_arg)
+      used_args.append(worker_arg)
+
+    elif next_arg in ['-bg', '-background']:
+      in_background = True
+
+    elif next_arg in ['-a', '-all']:
+      updates.append(UpdateEquitiesData)
+      updates.append(UpdateOptionsData)
+
+    elif next_arg in ['-s', '-single']:
+      equity_symbol = next(arguments)
+      used_args.append(equity_symbol)
+      updates.append(functools.partial(UpdateSingleEquity, equity_symbol))
+
+    elif next_arg in ['-e', '-equities', '-equity']:
+      updates.append(UpdateEquitiesData)
+    
+    elif next_arg in ['-o', '-options', '-option']:
+      updates.append(UpdateOptionsData)
+    
+    next_arg = next(arguments, None)
+
+  # If no updates were chosen, assume user wants everything updated
+  if len(updates) == 0:
+    updates.append(UpdateEquitiesData)
+    updates.append(UpdateOptionsData)
+
+  # The worker count applies to every update, wherever it was entered
+  updates = [functools.partial(update, worker_count=worker_count) for update in updates]
+
+  if not in_background:
+    try:
+      for update in updates:
+        update()
+    finally:
+      WriteMetricsSummary()
+    return
+
+  def run_updates(job : BackgroundJob) -> None:
+    # SQLite connections can only be used on the thread that made them
+    job_db = SecurityDatabaseWrapper(CURRENT_DIRECTORY + DATABASE_FILE_PATH)
+
+    try:
+      for update in updates:
+        if job.cancel_event.is_set():
+          break
+
+        update(db=job_db, status_func=job.UpdateStatus, progress_func=job.UpdateProgress, cancel_event=job.cancel_event)
+
+      job.UpdateStatus('Cancelled' if job.cancel_event.is_set() else 'Done')
+    finally:
+      job_db.Save()
+      job_db.CloseConnection()
+      WriteMetricsSummary()
+
+  job = BackgroundJob(' '.join(['update'] + used_args), run_updates)
+  background_jobs[job.Id] = job
+
+  ProgramStatusUpdate(f"Started job {job.Id}, use `jobs` to see its progress or `cancel {job.Id}` to stop it")
+
+def __handle_jobs_command() -> None:
+  """
+  WARNING: Should only be called by CommandReader()\n
+  This function will display every background job started this session
+  """
+
+  if len(background_jobs) == 0:
+    ProgramStatusUpdate("No background jobs have been started")
+    return
+
+  DisplayItems([job.Summary() for job in background_jobs.values()])
+
+def __handle_stats_command(arguments : iter) -> None:
+  """
+  WARNING: Should only be called by CommandReader()\n
+  This function will display the time spent on each provider, database operation, and update phase this session
+  """
+
+  if next(arguments, '').lower() in ['-r', '-reset']:
+    metrics.Reset()
+    ProgramStatusUpdate("Stats reset")
+    return
+
+  rows = metrics.GetSummaryRows()
+
+  if len(rows) == 0:
+    ProgramStatusUpdate("Nothing has been measured yet")
+    return
+
+  DisplayItems(rows)
+
+def __handle_cache_command(arguments : iter) -> None:
+  """
+  WARNING: Should only be called by CommandReader()\n
+  This function will display the state of the HTTP response cache, change its mode, or empty it
+  """
+
+  cache = GetCache()
+  option = next(arguments, '').lower()
+
+  if option in ['-m', '-mode']:
+    mode = next(arguments, '').lower()
+
+    if mode not in [cache_mode.value for cache_mode in CacheMode]:
+      ProgramStatusUpdate(f"Unknown cache mode '{mode}', expected one of: {', '.join(cache_mode.value for cache_mode in CacheMode)}")
+      return
+
+    cache.Mode = CacheMode(mode)
+    ProgramStatusUpdate(f"Cache mode set to '{mode}'")
+    return
+
+  elif option in ['-clear']:
+    cache.Clear()
+    ProgramStatusUpdate("Cache cleared")
+    return
+
+  DisplayItems([cache.Summary()])
+
+def __handle_top_command(arguments : iter) -> None:
+  """
+  WARNING: Should only be called by CommandReader()\n
+  This function will display the best equities or options of a leaderboard, or every leaderboard if none is given
+  """
+
+  board = next(arguments, '')
+
+  if board == '':
+    DisplayItems(security_db.GetLeaderboards())
+    return
+
+  count = next(arguments, '')
+
+  if count != '' and not count.isdigit():
+    ProgramStatusUpdate(f"Invalid count '{count}'")
+    return
+
+  try:
+    securities = security_db.GetLeaderboard(board, int(count) if count != '' else None)
+  except KeyError as error:
+    ProgramStatusUpdate(f"{error.args[0]}, use `top` to see every leaderboard")
+    return
+
+  if len(securities) == 0:
+    ProgramStatusUpdate(f"The '{board}' leaderboard is empty")
+    return
+
+  DisplayItems(securities)
+
+def __handle_cancel_command(arguments : iter) -> None:
+  """
+  WARNING: Should only be called by CommandReader()\n
+  This function will stop a background job after the security it is currently working on
+  """
+
+  job_id = next(arguments, None)
+
+  if job_id == None or not job_id.isdigit() or int(job_id) not in background_jobs:
+    ProgramStatusUpdate(f"No background job with the id '{job_id}'")
+    return
+
+  job = background_jobs[int(job_id)]
+
+  if not job.IsRunning():
+    ProgramStatusUpdate(f"Job {job.Id} has already stopped")
+    return
+
+  job.Cancel()
+  ProgramStatusUpdate(f"Cancelling job {job.Id}, everything it has finished so far is saved")
 
 def __handle_view_command(arguments : iter) -> None:
   """
@@ -336,6 +693,10 @@ def __handle_view_command(arguments : iter) -> None:
       elif next_arg in ['-o', '-options', '-option']:
         retrieve_securities_orders.append( [ (SecurityType.Option, None, None) ] )
 
+      # Handles case where user wants all backtest sweep results printed
+      elif next_arg in ['-bt', '-backtests', '-backtest']:
+        retrieve_securities_orders.append( [ (SecurityType.Backtest, None, None) ] )
+
       next_arg = next(arguments, None)
 
 
@@ -343,17 +704,19 @@ def __handle_view_command(arguments : iter) -> None:
   # we go through each GetSecurities() order in each chunk.
   for call_chunk in retrieve_securities_orders:
     for (security_type, sel_slice, ordering) in call_chunk:
+      # Rows are streamed from the database as pages are displayed
       if sel_slice != None:
         if ordering != None:
           primary_col_name,_ = ordering[0]
-          condition = [(primary_col_name, RelationalOperator.NotEqualTo, 'N/A')]
-          securities = security_db.GetSecurities(security_type, conditions=condition, order_by_cols=ordering)[sel_slice]
+          condition = [(primary_col_name, RelationalOperator.IsNot, None)]
+          securities = security_db.IterateSecurities(security_type, conditions=condition, order_by_cols=ordering, sel_slice=sel_slice)
         else:
-          securities = security_db.GetSecurities(security_type, order_by_cols=ordering)[sel_slice]
+          securities = security_db.IterateSecurities(security_type, order_by_cols=ordering, sel_slice=sel_slice)
       else:
-        securities = security_db.GetSecurities(security_type, order_by_cols=ordering)
+        securities = security_db.IterateSecurities(security_type, order_by_cols=ordering)
 
-      DisplayItems(securities)
+      if not DisplayItems(securities):
+        return
 
 def __handle_backtest_command(arguments : iter) -> None:
   """
@@ -367,6 +730,12 @@ def __handle_backtest_command(arguments : iter) -> None:
   if symbol == None:
     ProgramStatusUpdate("Please enter a trading symbol to backtest. For help, use command 'help' or 'h'")
     return
+  elif symbol.lower() in ['-sweep', '-sw']:
+    __handle_backtest_sweep_command(arguments)
+    return
+  elif symbol.lower() in ['-portfolio', '-p']:
+    __handle_backtest_portfolio_command(arguments)
+    return
   else:
     time_range = next(arguments, None)
 
@@ -398,6 +767,116 @@ def __handle_backtest_command(arguments : iter) -> None:
   table = tabulate.tabulate(backtest_data.items(), headers='keys')
   print(f'\n{table}\n')
 
+def __handle_backtest_sweep_command(arguments : iter) -> None:
+  """
+  WARNING: Should only be called by __handle_backtest_command()\n
+  This function will backtest many symbols using the DCA strategy with every combination of the
+  comma separated parameter lists provided by the user
+  """
+
+  worker_count = BACKTEST_WORKER_COUNT
+  parameter_lists = []
+
+  next_arg = next(arguments, None)
+  while next_arg != None:
+    if next_arg.lower() in ['-w', '-workers']:
+      worker_count = int(next(arguments))
+    elif next_arg != '':
+      parameter_lists.append(next_arg.split(','))
+
+    next_arg = next(arguments, None)
+
+  if len(parameter_lists) == 0:
+    ProgramStatusUpdate("Please enter the trading symbols to backtest. For help, use command 'help' or 'h'")
+    return
+
+  # Fill in the default of every parameter list the user did not enter
+  default_parameter_lists = [None, ['1Y', '5Y', '10Y', 'Max'], ['1000'], ['1000'], ['30']]
+  symbols_arg, start_dates, principals, periodic_investments, periods = parameter_lists + default_parameter_lists[len(parameter_lists):]
+
+  symbols = []
+  for symbol_arg in symbols_arg:
+    if symbol_arg == '*':
+      symbols.extend([equity.Symbol for equity in security_db.GetSecurities(SecurityType.Equity)])
+    elif '%' in symbol_arg:
+      symbols.extend([equity.Symbol for equity in security_db.GetSecurities(SecurityType.Equity, [('Symbol', RelationalOperator.Like, symbol_arg.upper())])])
+    else:
+      symbols.append(symbol_arg.upper())
+
+  BacktestSweep(list(dict.fromkeys(symbols)), start_dates, [float(principal) for principal in principals],
+                [float(periodic_investment) for periodic_investment in periodic_investments], [float(period) for period in periods], worker_count)
+
+def __handle_backtest_portfolio_command(arguments : iter) -> None:
+  """
+  WARNING: Should only be called by __handle_backtest_command()\n
+  This function will backtest a weighted portfolio of symbols with the parameters provided by the user
+  """
+
+  weights_arg = next(arguments, None)
+
+  if weights_arg == None:
+    ProgramStatusUpdate("Please enter the trading symbols of the portfolio. For help, use command 'help' or 'h'")
+    return
+
+  weights = ParseWeights(weights_arg)
+  time_range = next(arguments, None) or 'Max'
+
+  try:
+    principal = float(next(arguments, None) or 1000)
+    periodic_investment = float(next(arguments, None) or 1000)
+    period = float(next(arguments, None) or 30)
+    rebalance = next(arguments, None)
+
+    if rebalance != None and rebalance.replace('.', '', 1).isdigit():
+      rebalance = float(rebalance)
+
+    ValidateSchedule(period)
+    ValidateSchedule(rebalance)
+  except ValueError as error:
+    ProgramStatusUpdate(f"Invalid portfolio backtest parameters ({error}). For help, use command 'help' or 'h'")
+    return
+
+  ProgramStatusUpdate(f"Retrieving trading data for {len(weights)} equities...")
+
+  get_prices = lambda symbol: Equity.GetHistoricalData(symbol, time_range)
+  price_history = {}
+
+  for (symbol, df) in ConcurrentMap(get_prices, list(weights.keys()), UPDATE_WORKER_COUNT):
+    if type(df) != DataFrame:
+      ProgramStatusUpdate(f"Could not retrieve trading data for {symbol}, leaving it out of the portfolio")
+    else:
+      price_history[symbol] = df['Adj Close']
+
+  if len(price_history) == 0:
+    return
+
+  # Keep the symbols in the order the user entered them
+  price_history = {symbol : price_history[symbol] for symbol in weights if symbol in price_history}
+
+  dates, symbols, prices = BuildPriceMatrix(price_history)
+  results = BacktestPortfolio(dates, symbols, prices, weights, principal, periodic_investment, period, rebalance)
+
+  yearly_return = results['Yearly Return']
+
+  summary = {
+    'Symbols' : ', '.join(symbols),
+    'Start Date' : results['Start Date'],
+    'Investment Time' : f"{results['Investing Years']} years",
+    'Money Spent' : locale.currency(results['Money Spent'], grouping=True),
+    'Market Value' : locale.currency(results['Market Value'], grouping=True),
+    'Net Profit' : locale.currency(results['Net Profit'], grouping=True),
+    'Yearly Return' : f'{round(yearly_return * 100, 2)}%' if yearly_return != None else 'N/A'
+  }
+
+  holdings = [{
+    'Symbol' : symbol,
+    'Shares' : round(shares, 2),
+    'Market Value' : locale.currency(shares * prices[-1, index], grouping=True) if shares > 0 else locale.currency(0)
+    } for (index, (symbol, shares)) in enumerate(results['Holdings'].items(), start=0)]
+
+  print(f"\n{tabulate.tabulate(summary.items(), headers='keys')}\n")
+  print(f"{tabulate.tabulate(holdings, headers='keys')}\n")
+
 def __handle_help_command():
   """
   WARNING: Should only be called by CommandReader()\n
@@ -414,7 +893,7 @@ def CommandReader():
     first_arg = next(arguments).lower()
 
     if first_arg in ['init', 'initialize', 'i']:
-      __handle_init_command()
+      __handle_init_command(arguments)
 
     elif first_arg in ['update', 'u']:
       __handle_update_command(arguments)
@@ -425,17 +904,62 @@ def CommandReader():
     elif first_arg in ['backtest', 'bt']:
       __handle_backtest_command(arguments)
 
+    elif first_arg in ['jobs', 'j']:
+      __handle_jobs_command()
+
+    elif first_arg in ['cancel', 'c']:
+      __handle_cancel_command(arguments)
+
+    elif first_arg in ['stats']:
+      __handle_stats_command(arguments)
+
+    elif first_arg in ['cache']:
+      __handle_cache_command(arguments)
+
+    elif first_arg in ['top', 't']:
+      __handle_top_command(arguments)
+
     elif first_arg in ['help', 'h']:
       __handle_help_command()
 
     user_input = input('> ')
 
+def WriteMetricsSummary() -> None:
+  """
+  Saves the stats collected since the last summary to a JSON file next to the logs and starts collecting them
+  again, so every update gets its own summary
+  """
+
+  file_time = dt.datetime.now().strftime('%Y-%m-%d %H-%M-%S')
+  file_path = CURRENT_DIRECTORY + METRICS_FILE_PATH.format(file_time)
+
+  # Updates that finish in the same second (ex. a background job and a foreground update) each keep their summary
+  for summary_number in itertools.count(2):
+    if not os.path.exists(file_path):
+      break
+
+    file_path = CURRENT_DIRECTORY + METRICS_FILE_PATH.format(f'{file_time} ({summary_number})')
+
+  metrics.WriteSummary(file_path, reset=True)
+
+def WriteRunSummary() -> None:
+  """
+  Saves the stats collected since the last update finished, if there are any, and flushes the log
+  """
+
+  if metrics.HasMeasurements():
+    WriteMetricsSummary()
+
+  CloseLog()
+
 def main():
   global security_db
   global td_ameritrade_api_key
 
   locale.setlocale(locale.LC_ALL, '')
   security_db = SecurityDatabaseWrapper(CURRENT_DIRECTORY + DATABASE_FILE_PATH)
+  Equity.price_store = PriceStore(CURRENT_DIRECTORY + PRICE_STORE_PATH)
+  SetCache(ResponseCache(CURRENT_DIRECTORY + HTTP_CACHE_PATH, HTTP_CACHE_MAX_SIZE))
 
   with open(CURRENT_DIRECTORY + API_FILE_PATH, mode='r') as api_file:
     key_match = re.search('^td_ameritrade\=(.+)$', api_file.read(), flags=re.MULTILINE)
@@ -446,7 +970,16 @@ def main():
     td_ameritrade_api_key = key_match.group(1)
 
   CommandReader()
+
+  # Let background jobs save what they have finished before exiting
+  for job in background_jobs.values():
+    if job.IsRunning():
+      ProgramStatusUpdate(f"Waiting for job {job.Id} to stop...")
+      job.Cancel()
+      job.Join()
+
   security_db.CloseConnection()
+  WriteRunSummary()
 
 # TODO: Implement AlphaVantage intraday trading history
 
@@ -454,4 +987,5 @@ if __name__ == "__main__":
   try:
     main()
   except KeyboardInterrupt:
-    security_db.CloseConnection()
\ No newline at end of file
+    security_db.CloseConnection()
+    WriteRunSummary()
\ No newline at end of file
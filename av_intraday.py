@@ -1,6 +1,8 @@
-import json as js, datetime as dt, pandas as pd, math, time, os, re
+import json as js, datetime as dt, pandas as pd, numpy as np, math, time, os, re
+from typing import *
 from dateutil.relativedelta import relativedelta
 from alpha_vantage.timeseries import *
+from providers import Provider, Throttle
 
 CURRENT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
 API_KEYS_FILE = CURRENT_DIRECTORY + '/assets/api_keys.txt'
@@ -11,96 +13,97 @@ CURRENCY = '${:,.2f}'
 def GetCAGR(starting : float, ending : float, start_date : dt.datetime, stop_date : dt.datetime) -> float:
   return math.pow((ending / starting), 365 / (stop_date - start_date).days) - 1
 
-def GetPerformance(ticker : str, capital : float, interval : str):
-  def get_date(s : str) -> dt.date:
-    return dt.datetime.strptime(s, TIME_FORMAT).date()
-  def get_weight(n : int, i : int) -> float:
-    return (2 * (n - i + 1)) / (n * (n + 1))
-
-  #region Setup
-  # Get API Key
+def GetApiKey() -> str:
   with open(API_KEYS_FILE, mode='r+') as akf:
     key_match = re.search('^alpha_vantage\=(.+)$', akf.read(), flags=re.MULTILINE)
   
-  if type(key_match) == None:
+  if key_match == None:
     raise KeyError("Could not locate Alpha Vantage API key")
-  
-  # Use AlphaVantage to get Intraday Trading History
-  ts = TimeSeries(key= key_match.groups()[0], output_format='json')
-  data, meta_data = ts.get_intraday(ticker, interval=interval, outputsize='full')
-  
-  # Get Dates available to create model
-  available_times = list(reversed([x for x in data]))
 
-  # Setup for model computation
-  trading_days = []
-  date_history = []
-  start_date = get_date(available_times[0])
-  current_date = start_date
+  return key_match.groups()[0]
 
-  for datetime in available_times:
-    date = get_date(datetime)
-    
-    if date != current_date:
-      current_date = date
-      trading_days.append(date_history)
-      date_history = []
-    
-    date_history.append(data[datetime])
-  
+def GetIntradayPerformance(ticker : str, data : Dict[str, Dict[str, str]], capital : float) -> List[Any]:
+  """
+  Runs the weighted daily investment model over Alpha Vantage intraday bars (newest first, as returned
+  by TimeSeries.get_intraday()). Every day, the day's share of the capital and all cash so far is spread
+  evenly over that day's bars and sold at the day's last close. Earlier days get a larger share of the capital
+  """
+
+  # Oldest bar first
+  times = list(reversed(list(data.keys())))
+
+  timestamps = np.array(times, dtype='datetime64[s]')
+  opens = np.array([data[bar_time]['1. open'] for bar_time in times], dtype=float)
+  closes = np.array([data[bar_time]['4. close'] for bar_time in times], dtype=float)
+
+  days = timestamps.astype('datetime64[D]')
+  day_starts = np.flatnonzero(np.concatenate([[True], days[1:] != days[:-1]]))
+
+  # The most recent day may not be finished yet, so it is not traded
+  trading_day_count = len(day_starts) - 1
+  bars_per_day = np.diff(day_starts)
+
+  # How much each day multiplies the cash invested in it by
+  day_growth = np.add.reduceat(1 / opens, day_starts)[:trading_day_count] / bars_per_day * closes[day_starts[1:] - 1]
+
+  day_numbers = np.arange(1, trading_day_count + 1)
+  day_weights = (2 * (trading_day_count - day_numbers + 1)) / (trading_day_count * (trading_day_count + 1))
+
+  # Money invested on a day grows by that day and every day after it
+  remaining_growth = np.cumprod(day_growth[::-1])[::-1]
+  uninvested_cash = float(np.sum(capital * day_weights * remaining_growth))
   shares_outstanding = 0
-  uninvested_cash = 0
-  #endregion
 
-  for x in range(0, len(trading_days)):
-    uninvested_cash += capital * get_weight(trading_days.__len__(), x + 1)
-    split = uninvested_cash / len(trading_days[x])
+  start_date = days[0].astype(dt.date)
+  current_date = days[-1].astype(dt.date)
 
-    for y in range(0, len(trading_days[x])):
-      shares_outstanding += split / float(trading_days[x][y]['1. open'])
-    
-    portfolio_value = shares_outstanding * float(trading_days[x][y]['4. close'])
-
-    if portfolio_value > uninvested_cash:
-      shares_outstanding = 0
-      uninvested_cash = portfolio_value
-    else:
-      shares_outstanding = 0
-      uninvested_cash = portfolio_value
-    
   cagr = round(GetCAGR(capital, uninvested_cash, start_date, current_date), 3)
   return [ticker, start_date, current_date, uninvested_cash, shares_outstanding, cagr]
 
-title = f"Portfolio data for '{SYMBOLS_FILE}''"
-print(f"{title}\r\n{''.join(['-'] * len(title))}")
+def GetPerformance(ticker : str, capital : float, interval : str, api_key : Optional[str] = None) -> List[Any]:
+  """
+  Downloads the intraday trading history of the ticker from Alpha Vantage and runs GetIntradayPerformance() over it
+  """
 
-with open(SYMBOLS_FILE, mode='r+') as sf:
-  symbols = [line.strip('\n') for line in sf.readlines()]
-  
-starting_capital = 2000
-split = starting_capital / len(symbols)
-performances = []
-
-start_min = dt.datetime.now()
-counter = 0
-
-for x in symbols:
-  print(f'Getting Data for {x}{"".join([" "] * 5)}', end='\r')
-  if counter == 5 and (dt.datetime.now() - start_min).total_seconds() < 60:
-    time.sleep(60 - (dt.datetime.now() - start_min).total_seconds())
-    counter = 0
-    start_min = dt.datetime.now()
-
-  performances.append(GetPerformance(x, split, '15min'))
-  counter += 1
-  
-df = pd.DataFrame.from_records(performances, columns=['Ticker', 'Start Date', 'Stop Date', 'Portfolio Value', 'Outstanding Shares', 'CAGR'])
-total_portfolio_value = df['Portfolio Value'].sum()
+  if api_key == None:
+    api_key = GetApiKey()
+
+  # Use AlphaVantage to get Intraday Trading History
+  ts = TimeSeries(key=api_key, output_format='json')
+
+  with Throttle(Provider.AlphaVantage):
+    data, meta_data = ts.get_intraday(ticker, interval=interval, outputsize='full')
+
+  return GetIntradayPerformance(ticker, data, capital)
+
+def main():
+  title = f"Portfolio data for '{SYMBOLS_FILE}''"
+  print(f"{title}\r\n{''.join(['-'] * len(title))}")
+
+  with open(SYMBOLS_FILE, mode='r+') as sf:
+    symbols = [line.strip('\n') for line in sf.readlines()]
+    
+  api_key = GetApiKey()
+  starting_capital = 2000
+  split = starting_capital / len(symbols)
+  performances = []
+
+  # Alpha Vantage's rate limit is applied by GetPerformance()
+  for x in symbols:
+    print(f'Getting Data for {x}{"".join([" "] * 5)}', end='\r')
+    performances.append(GetPerformance(x, split, '15min', api_key))
+    
+  df = pd.DataFrame.from_records(performances, columns=['Ticker', 'Start Date', 'Stop Date', 'Portfolio Value', 'Outstanding Shares', 'CAGR'])
+  total_portfolio_value = df['Portfolio Value'].sum()
+
+  df['Portfolio Value'] = df.apply(lambda row: CURRENCY.format(row['Portfolio Value']), axis=1)
+  df['CAGR'] = df.apply(lambda row: f"{round(row['CAGR'] * 100,3)}%", axis=1)
 
-df['Portfolio Value'] = df.apply(lambda row: CURRENCY.format(row['Portfolio Value']), axis=1)
-df['CAGR'] = df.apply(lambda row: f"{round(row['CAGR'] * 100,3)}%", axis=1)
+  # The symbols' histories may not line up, so the portfolio spans all of them
+  portfolio_cagr = round(100 * GetCAGR(starting_capital, total_portfolio_value, df['Start Date'].min(), df['Stop Date'].max()), 3)
+  print(df)
+  print("Cash In Hand: ", CURRENCY.format(total_portfolio_value))
+  print("Portfolio CAGR: ", f"{portfolio_cagr}%")
 
-portfolio_cagr = round(100 * GetCAGR(starting_capital, total_portfolio_value, performances[0][1], performances[0][2]), 3)
-print(df)
-print("Cash In Hand: ", CURRENCY.format(total_portfolio_value))
-print("Portfolio CAGR: ", f"{portfolio_cagr}%")
\ No newline at end of file
+if __name__ == "__main__":
+  main()
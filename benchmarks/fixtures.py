@@ -0,0 +1,230 @@
+import zlib, requests, numpy as np, pandas as pd, json as js, datetime as dt
+
+from typing import *
+from urllib.parse import urlsplit, parse_qsl
+
+# Histories are generated for this many distinct seeds and shared between symbols with the same seed,
+# so thousands of symbols do not each need their own decades of prices in memory
+PRICE_HISTORY_POOL_SIZE = 64
+
+def SymbolSeed(symbol : str) -> int:
+  return zlib.crc32(symbol.encode())
+
+def MakeSymbols(count : int) -> List[str]:
+  """
+  Unique made up ticker symbols (ex. 'AAAB'), some of which have a '.' like real share classes
+  """
+
+  symbols = []
+
+  for index in range(count):
+    letters = ''
+    number = index
+
+    for _ in range(4):
+      letters = chr(ord('A') + number % 26) + letters
+      number //= 26
+
+    symbols.append(f'{letters}.B' if index % 50 == 0 else letters)
+
+  return symbols
+
+def MakePriceHistory(seed : int, start_date = dt.date(1990, 1, 2), end_date : Optional[dt.date] = None) -> pd.DataFrame:
+  """
+  Daily OHLCV trading data shaped like pandas_datareader's Yahoo DataFrames, following a random walk
+  """
+
+  dates = pd.bdate_range(pd.Timestamp(start_date), pd.Timestamp(end_date or dt.date.today()))
+  rng = np.random.default_rng(seed)
+
+  close = 20 * np.exp(np.cumsum(rng.normal(0.0003, 0.015, len(dates))))
+  open_ = close * np.exp(rng.normal(0, 0.005, len(dates)))
+
+  return pd.DataFrame({
+    'High' : np.maximum(open_, close) * 1.01,
+    'Low' : np.minimum(open_, close) * 0.99,
+    'Open' : open_,
+    'Close' : close,
+    'Volume' : rng.integers(10 ** 4, 10 ** 7, len(dates)).astype(float),
+    'Adj Close' : close
+  }, index=pd.DatetimeIndex(dates, name='Date'))
+
+class FakeDataReader:
+  """
+  Stand-in for pandas_datareader.DataReader that serves generated Yahoo histories. Every call is counted
+  """
+
+  def __init__(self, pool_size = PRICE_HISTORY_POOL_SIZE):
+    self.__histories = {}
+    self.__pool_size = pool_size
+    self.CallCount = 0
+
+  def __get_history(self, symbol : str) -> pd.DataFrame:
+    seed = SymbolSeed(symbol) % self.__pool_size
+
+    if seed not in self.__histories:
+      self.__histories[seed] = MakePriceHistory(seed)
+
+    return self.__histories[seed]
+
+  def Prepare(self, symbols : Iterable[str]) -> None:
+    """
+    Generates the histories of the symbols now, so the first timed call does not pay for making them
+    """
+
+    for symbol in symbols:
+      self.__get_history(symbol)
+
+  def __call__(self, symbol : str, data_source : str = 'yahoo', start : Any = None, end : Any = None, session : Any = None) -> pd.DataFrame:
+    self.CallCount += 1
+
+    return self.__get_history(symbol).loc[pd.Timestamp(start).strftime('%Y-%m-%d'):pd.Timestamp(end).strftime('%Y-%m-%d')]
+
+def MakeOptionChain(symbol : str, strike_count = 50, expiration_count = 8, seed = 0) -> Dict[str, Any]:
+  """
+  An option chain in the format of TD Ameritrade's /marketdata/chains, with strike_count strikes at
+  each of expiration_count expiration dates for both calls and puts
+  """
+
+  rng = np.random.default_rng(seed)
+  underlying_price = float(np.round(rng.uniform(10, 500), 2))
+  strikes = np.round(underlying_price * np.linspace(0.6, 1.4, strike_count), 1)
+  today = dt.date.today()
+
+  chain = {
+    'symbol' : symbol,
+    'status' : 'SUCCESS',
+    'underlyingPrice' : underlying_price,
+    'interestRate' : 0.1,
+    'volatility' : float(np.round(rng.uniform(15, 80), 2))
+  }
+
+  for (exp_date_map, put_call) in [('callExpDateMap', 'CALL'), ('putExpDateMap', 'PUT')]:
+    chain[exp_date_map] = {}
+
+    for expiration_index in range(expiration_count):
+      days_to_expiration = 2 + 7 * expiration_index
+      expiration_date = today + dt.timedelta(days=days_to_expiration)
+      expiration_ms = int(dt.datetime(expiration_date.year, expiration_date.month, expiration_date.day, 20).timestamp() * 1000)
+
+      contracts = {}
+      for strike in strikes:
+        intrinsic_value = max(underlying_price - strike, 0) if put_call == 'CALL' else max(strike - underlying_price, 0)
+        ask = round(intrinsic_value + rng.uniform(0.05, 0.05 * underlying_price), 2)
+
+        contracts[f'{strike:.1f}'] = [{
+          'putCall' : put_call,
+          'symbol' : f'{symbol}_{expiration_date:%m%d%y}{put_call[0]}{strike:g}',
+          'description' : f'{symbol} {expiration_date:%b} {expiration_date.day} {expiration_date.year} {strike:g} {put_call.title()}',
+          'exchangeName' : 'OPR',
+          'bid' : round(ask * 0.95, 2),
+          'ask' : ask,
+          'last' : ask,
+          'mark' : round(ask * 0.975, 2),
+          'bidSize' : 10,
+          'askSize' : 10,
+          'totalVolume' : int(rng.integers(0, 5000)),
+          'volatility' : float(np.round(rng.uniform(15, 80), 3)),
+          'delta' : 0.5,
+          'gamma' : 0.01,
+          'theta' : -0.05,
+          'vega' : 0.1,
+          'rho' : 0.01,
+          'openInterest' : int(rng.integers(0, 10000)),
+          'timeValue' : round(ask - intrinsic_value, 2),
+          'theoreticalOptionValue' : -999.0 if rng.random() < 0.1 else round(ask * rng.uniform(0.9, 1.1), 3),
+          'strikePrice' : float(strike),
+          'expirationDate' : expiration_ms,
+          'daysToExpiration' : days_to_expiration,
+          'multiplier' : 100.0,
+          'inTheMoney' : bool(intrinsic_value > 0),
+          'nonStandard' : False
+        }]
+
+      chain[exp_date_map][f'{expiration_date:%Y-%m-%d}:{days_to_expiration}'] = contracts
+
+  return chain
+
+def MakeIntradayBars(trading_day_count = 20, interval_minutes = 15, seed = 0) -> Dict[str, Dict[str, str]]:
+  """
+  Intraday bars in the format of Alpha Vantage's TimeSeries.get_intraday() with output_format='json', newest first
+  """
+
+  rng = np.random.default_rng(seed)
+  bars = {}
+  day = dt.date.today() - dt.timedelta(days=int(trading_day_count * 1.5) + 3)
+  price = 100.0
+
+  while len(bars) == 0 or len(set(bar_time[:10] for bar_time in bars)) < trading_day_count:
+    if day.weekday() < 5:
+      bar_time = dt.datetime.combine(day, dt.time(9, 30))
+
+      while bar_time.time() <= dt.time(16, 0):
+        open_price = price
+        price *= np.exp(rng.normal(0, 0.002))
+
+        bars[bar_time.strftime('%Y-%m-%d %H:%M:%S')] = {
+          '1. open' : f'{open_price:.4f}',
+          '2. high' : f'{max(open_price, price):.4f}',
+          '3. low' : f'{min(open_price, price):.4f}',
+          '4. close' : f'{price:.4f}',
+          '5. volume' : str(int(rng.integers(100, 100000)))
+        }
+        bar_time += dt.timedelta(minutes=interval_minutes)
+
+    day += dt.timedelta(days=1)
+
+  return dict(reversed(list(bars.items())))
+
+class FakeTimeSeries:
+  """
+  Stand-in for alpha_vantage.timeseries.TimeSeries that serves generated intraday bars
+  """
+
+  # Shared between instances since av_intraday.GetPerformance() makes a new TimeSeries for every symbol
+  __bars = {}
+
+  def __init__(self, key : Optional[str] = None, output_format : str = 'json', pool_size = PRICE_HISTORY_POOL_SIZE, **kwargs):
+    self.__pool_size = pool_size
+
+  @staticmethod
+  def Prepare(symbols : Iterable[str], interval : str = '15min', pool_size = PRICE_HISTORY_POOL_SIZE) -> None:
+    """
+    Generates the bars of the symbols now, so the first timed call does not pay for making them
+    """
+
+    for symbol in symbols:
+      FakeTimeSeries(pool_size=pool_size).get_intraday(symbol, interval=interval)
+
+  def get_intraday(self, symbol : str, interval : str = '15min', outputsize : str = 'compact') -> Tuple[Dict[str, Dict[str, str]], Dict[str, str]]:
+    seed = SymbolSeed(symbol) % self.__pool_size
+
+    if (seed, interval) not in FakeTimeSeries.__bars:
+      FakeTimeSeries.__bars[(seed, interval)] = MakeIntradayBars(interval_minutes=int(interval.replace('min', '')), seed=seed)
+
+    return FakeTimeSeries.__bars[(seed, interval)], {'2. Symbol' : symbol, '4. Interval' : interval}
+
+class FakeOptionChainAdapter(requests.adapters.BaseAdapter):
+  """
+  Transport adapter that answers TD Ameritrade's /marketdata/chains with the given chains by symbol, so
+  Option.GetOptions() can run without a network connection. Symbols without a chain get a 404 like an unknown symbol would
+  """
+
+  def __init__(self, chains : List[Dict[str, Any]]):
+    super().__init__()
+    self.__chains = {chain['symbol'] : chain for chain in chains}
+
+  def send(self, request : requests.PreparedRequest, **kwargs) -> requests.Response:
+    symbol = dict(parse_qsl(urlsplit(request.url).query)).get('symbol')
+
+    response = requests.Response()
+    response.url = request.url
+    response.request = request
+    response.status_code = 200 if symbol in self.__chains else 404
+    response._content = js.dumps(self.__chains[symbol]).encode() if symbol in self.__chains else b'{}'
+    response.headers['Content-Type'] = 'application/json'
+
+    return response
+
+  def close(self) -> None:
+    pass
@@ -0,0 +1,414 @@
+import os, sys, json as js, time, locale, itertools, argparse, platform, tempfile, statistics, subprocess, datetime as dt
+
+from typing import *
+
+CURRENT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+REPO_DIRECTORY = os.path.dirname(CURRENT_DIRECTORY)
+sys.path.insert(0, REPO_DIRECTORY)
+
+import tabulate, http_cache, av_intraday, fixtures, security_db_wrapper as sdw
+
+from price_store import PriceStore
+from providers import Provider, SetRateLimit, SetConcurrencyLimit
+
+RESULTS_DIRECTORY = CURRENT_DIRECTORY + '/results'
+
+# Sizes of the benchmarks at --scale 1, roughly the size of the real US listings and a full options update
+SYMBOL_COUNT = 10000
+CONTRACT_COUNT = 100000
+BACKTEST_SYMBOL_COUNT = 1000
+INTRADAY_SYMBOL_COUNT = 1000
+PRICE_STORE_SYMBOL_COUNT = 200
+
+# Contracts per option chain are 2 * STRIKE_COUNT * EXPIRATION_COUNT (calls and puts)
+STRIKE_COUNT = 50
+EXPIRATION_COUNT = 8
+
+TIME_RANGES = ['1d', '1w', '1m', '3m', '1y', '5y', '10y', 'max']
+
+# A benchmark whose median time grows by more than this fraction is reported as a regression
+REGRESSION_THRESHOLD = 0.10
+
+#region Setup
+
+def UseFakeProviders() -> None:
+  """
+  Points the modules at the local stand-ins so no request leaves the machine, and lifts the
+  providers' rate limits so the benchmarks time the code instead of the throttling
+  """
+
+  sdw.DataReader = fixtures.FakeDataReader()
+  av_intraday.TimeSeries = fixtures.FakeTimeSeries
+
+  for provider in Provider:
+    SetRateLimit(provider, 10 ** 9, 10 ** 9)
+    SetConcurrencyLimit(provider, 10 ** 6)
+
+def SetCurrencyLocale() -> Optional[str]:
+  """
+  BacktestDollarCostAveraging() formats with locale.currency(), which the C locale does not support.
+  If no locale on this machine does, a plain formatter is used instead and a note is returned
+  """
+
+  for locale_name in ['', 'en_US.UTF-8', 'en_US.utf8']:
+    try:
+      locale.setlocale(locale.LC_ALL, locale_name)
+      locale.currency(1.0, grouping=True)
+      return None
+    except (locale.Error, ValueError):
+      continue
+
+  locale.currency = lambda value, grouping=False: f'${value:,.2f}' if grouping else f'${value:.2f}'
+  return 'No locale supports currency formatting, locale.currency() was replaced with a plain formatter'
+
+def GetVersionLabel() -> str:
+  try:
+    return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIRECTORY, capture_output=True, text=True, check=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return 'unversioned'
+
+#endregion
+
+#region Benchmarks
+
+def TimeBenchmark(func : Callable[[], int], repeat : int) -> Dict[str, Any]:
+  """
+  Runs func repeat times. func returns the number of items it processed
+  """
+
+  times = []
+
+  for _ in range(repeat):
+    start = time.perf_counter()
+    item_count = func()
+    times.append(time.perf_counter() - start)
+
+  median = statistics.median(times)
+
+  return {
+    'Items' : item_count,
+    'Seconds' : [round(seconds, 6) for seconds in times],
+    'Min (s)' : round(min(times), 6),
+    'Median (s)' : round(median, 6),
+    'Items/s' : round(item_count / median, 1) if median > 0 else None
+  }
+
+def BenchmarkPercentChange(symbols : List[str]) -> Callable[[], int]:
+  def run() -> int:
+    for symbol in symbols:
+      sdw.Equity.GetPercentChangeOverTimeRanges(symbol, TIME_RANGES)
+
+    return len(symbols)
+
+  return run
+
+def BenchmarkParseChains(chain_contents : List[bytes]) -> Callable[[], int]:
+  def run() -> int:
+    contract_count = 0
+
+    for content in chain_contents:
+      contract_count += len(sdw.Option.ParseChain(content)['symbol'])
+
+    return contract_count
+
+  return run
+
+def BenchmarkGetOptionColumns(symbols : List[str]) -> Callable[[], int]:
+  """
+  Downloads (or replays), parses and values every contract of each symbol's chain
+  """
+
+  def run() -> int:
+    contract_count = 0
+
+    for symbol in symbols:
+      contract_count += len(sdw.Option.GetOptionColumns('benchmark', symbol, '1y', get_valuable=False)['Symbol'])
+
+    return contract_count
+
+  return run
+
+def BenchmarkGetOptions(symbols : List[str], options : Optional[List[sdw.Option]] = None) -> Callable[[], int]:
+  """
+  Fills options with the options of the last pass, if given
+  """
+
+  def run() -> int:
+    new_options = list(itertools.chain.from_iterable(sdw.Option.GetOptions('benchmark', symbol, '1y') for symbol in symbols))
+
+    if options != None:
+      options[:] = new_options
+
+    return len(symbols)
+
+  return run
+
+def BenchmarkBacktest(symbols : List[str]) -> Callable[[], int]:
+  def run() -> int:
+    for symbol in symbols:
+      sdw.Equity.BacktestDollarCostAveraging(symbol, '10y', 1000, 100, 30)
+
+    return len(symbols)
+
+  return run
+
+def BenchmarkIntradayPerformance(symbols : List[str]) -> Callable[[], int]:
+  def run() -> int:
+    for symbol in symbols:
+      av_intraday.GetPerformance(symbol, 2000 / len(symbols), '15min', api_key='benchmark')
+
+    return len(symbols)
+
+  return run
+
+def MakeEquities(symbols : List[str]) -> List[sdw.Equity]:
+  equities = []
+
+  for (index, symbol) in enumerate(symbols, start=0):
+    percent_changes = [None if (index + offset) % 17 == 0 else round((index * 7919 + offset * 104729) % 20000 / 100 - 100, 2)
+                       for offset in range(len(TIME_RANGES))]
+
+    equities.append(sdw.Equity(symbol, f'{symbol} Holdings Inc.', *percent_changes))
+
+  return equities
+
+def BenchmarkAddNewSecurity(database_path : str, equities : List[sdw.Equity]) -> Callable[[], int]:
+  def run() -> int:
+    if os.path.exists(database_path):
+      os.remove(database_path)
+
+    db = sdw.SecurityDatabaseWrapper(database_path)
+
+    for equity in equities:
+      db.AddNewSecurity(equity)
+
+    db.Save()
+    db.CloseConnection()
+
+    return len(equities)
+
+  return run
+
+def BenchmarkAddNewSecurities(database_path : str, options : List[sdw.Option]) -> Callable[[], int]:
+  def run() -> int:
+    if os.path.exists(database_path):
+      os.remove(database_path)
+
+    db = sdw.SecurityDatabaseWrapper(database_path)
+    db.AddNewSecurities(options)
+    db.CloseConnection()
+
+    return len(options)
+
+  return run
+
+def BenchmarkAddNewColumns(database_path : str, column_sets : List[Dict[str, List[Any]]]) -> Callable[[], int]:
+  def run() -> int:
+    if os.path.exists(database_path):
+      os.remove(database_path)
+
+    db = sdw.SecurityDatabaseWrapper(database_path)
+    row_count = db.AddNewColumns(sdw.SecurityType.Option, column_sets)
+    db.CloseConnection()
+
+    return row_count
+
+  return run
+
+def BenchmarkGetSecurities(database_path : str, security_type : sdw.SecurityType, **kwargs) -> Callable[[], int]:
+  def run() -> int:
+    db = sdw.SecurityDatabaseWrapper(database_path)
+    item_count = len(db.GetSecurities(security_type, **kwargs))
+    db.CloseConnection()
+
+    return item_count
+
+  return run
+
+def BenchmarkGetLeaderboard(database_path : str, board : str, count : int) -> Callable[[], int]:
+  def run() -> int:
+    db = sdw.SecurityDatabaseWrapper(database_path)
+    item_count = len(db.GetLeaderboard(board, count))
+    db.CloseConnection()
+
+    return item_count
+
+  return run
+
+#endregion
+
+def RunBenchmarks(scale : float, repeat : int, only : Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+  """
+  Builds the fixtures and runs every benchmark whose name contains only. Returns the results by benchmark name
+  """
+
+  symbols = fixtures.MakeSymbols(max(1, int(SYMBOL_COUNT * scale)))
+  chain_count = max(1, int(CONTRACT_COUNT * scale / (2 * STRIKE_COUNT * EXPIRATION_COUNT)))
+
+  results = {}
+  temp_directory = tempfile.TemporaryDirectory(prefix='benchmarks-')
+
+  def run(name : str, make_func : Callable[[], Callable[[], int]], repeat = repeat) -> None:
+    if only != None and only not in name:
+      return
+
+    print(f'Running {name}...', end='\r')
+    results[name] = TimeBenchmark(make_func(), repeat)
+    print(f"{name}: {results[name]['Median (s)']:.3f}s for {results[name]['Items']} items")
+
+  try:
+    # Generating a symbol's history takes longer than most of what is timed, so every one the benchmarks use
+    # is made now instead of in the first timed pass
+    print('Generating fixtures...', end='\r')
+    sdw.DataReader.Prepare(symbols)
+    fixtures.FakeTimeSeries.Prepare(symbols[:max(1, int(INTRADAY_SYMBOL_COUNT * scale))])
+
+    sdw.Equity.price_store = None
+    run('equity.percent_change', lambda: BenchmarkPercentChange(symbols))
+
+    def fill_price_store() -> Callable[[], int]:
+      # The first pass fills the price store, so only the passes after it are timed
+      store_symbols = symbols[:max(1, int(PRICE_STORE_SYMBOL_COUNT * scale))]
+      BenchmarkPercentChange(store_symbols)()
+      return BenchmarkPercentChange(store_symbols)
+
+    sdw.Equity.price_store = PriceStore(temp_directory.name + '/price_store')
+    run('equity.percent_change.price_store', fill_price_store)
+    sdw.Equity.price_store = None
+
+    run('equity.backtest_dca', lambda: BenchmarkBacktest(symbols[:max(1, int(BACKTEST_SYMBOL_COUNT * scale))]))
+    run('av_intraday.performance', lambda: BenchmarkIntradayPerformance(symbols[:max(1, int(INTRADAY_SYMBOL_COUNT * scale))]))
+
+    chains = [fixtures.MakeOptionChain(chain_symbol, STRIKE_COUNT, EXPIRATION_COUNT, seed=index)
+              for (index, chain_symbol) in enumerate(fixtures.MakeSymbols(chain_count), start=0)]
+    run('option.parse_chain', lambda: BenchmarkParseChains([js.dumps(chain).encode() for chain in chains]))
+
+    # The chains are downloaded from the fake endpoint once to record them, then every timed pass replays them from the cache
+    chain_symbols = [chain['symbol'] for chain in chains]
+    http_cache.SetCache(http_cache.ResponseCache(temp_directory.name + '/http_cache', mode=http_cache.CacheMode.Record))
+    http_cache.GetSession(Provider.TDAmeritrade).mount('https://api.tdameritrade.com/', fixtures.FakeOptionChainAdapter(chains))
+    BenchmarkGetOptions(chain_symbols)()
+    del chains
+
+    http_cache.GetCache().Mode = http_cache.CacheMode.Replay
+    run('option.get_option_columns.replay', lambda: BenchmarkGetOptionColumns(chain_symbols))
+
+    options = []
+    run('option.get_options.replay', lambda: BenchmarkGetOptions(chain_symbols, options))
+
+    if len(options) == 0:
+      BenchmarkGetOptions(chain_symbols, options)()
+
+    option_column_sets = [sdw.Option.GetOptionColumns('benchmark', symbol, '1y') for symbol in chain_symbols]
+
+    equities_path = temp_directory.name + '/equities.db'
+    options_path = temp_directory.name + '/options.db'
+
+    run('db.add_new_security', lambda: BenchmarkAddNewSecurity(equities_path, MakeEquities(symbols)))
+    run('db.add_new_securities.options', lambda: BenchmarkAddNewSecurities(options_path, options))
+    run('db.add_new_columns.options', lambda: BenchmarkAddNewColumns(options_path, [column_set for column_set in option_column_sets if column_set != None]))
+
+    # The read benchmarks need the databases even when the write benchmarks are not run
+    if not os.path.exists(equities_path):
+      BenchmarkAddNewSecurity(equities_path, MakeEquities(symbols))()
+    if not os.path.exists(options_path):
+      BenchmarkAddNewSecurities(options_path, options)()
+
+    del options, option_column_sets
+
+    run('db.get_securities.equities', lambda: BenchmarkGetSecurities(equities_path, sdw.SecurityType.Equity))
+    run('db.get_securities.equities.top_100', lambda: BenchmarkGetSecurities(equities_path, sdw.SecurityType.Equity,
+                                                                             conditions=[('1Y', sdw.RelationalOperator.IsNot, None)],
+                                                                             order_by_cols=[('1Y', sdw.Ordering.Descending)],
+                                                                             limit=100))
+    run('db.get_leaderboard.1y', lambda: BenchmarkGetLeaderboard(equities_path, '1Y', 100))
+    run('db.get_securities.options', lambda: BenchmarkGetSecurities(options_path, sdw.SecurityType.Option))
+  finally:
+    sdw.Equity.price_store = None
+    http_cache.SetCache(None)
+    temp_directory.cleanup()
+
+  return results
+
+def FindPreviousResults(label : str) -> Optional[str]:
+  """
+  The most recently written results file of any other version
+  """
+
+  if not os.path.isdir(RESULTS_DIRECTORY):
+    return None
+
+  file_paths = [os.path.join(RESULTS_DIRECTORY, file_name) for file_name in os.listdir(RESULTS_DIRECTORY)
+                if file_name.endswith('.json') and file_name != f'{label}.json']
+
+  return max(file_paths, key=os.path.getmtime) if len(file_paths) > 0 else None
+
+def CompareResults(results : Dict[str, Dict[str, Any]], previous_results : Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+  rows = []
+
+  for (name, result) in results.items():
+    row = {'Benchmark' : name, 'Items' : result['Items'], 'Median (s)' : result['Median (s)'], 'Items/s' : result['Items/s']}
+    previous_result = previous_results.get(name)
+
+    # Runs at a different scale do not take comparable amounts of time
+    if previous_result != None and previous_result['Items'] == result['Items'] and previous_result['Median (s)'] > 0:
+      change = result['Median (s)'] / previous_result['Median (s)'] - 1
+
+      row['Previous (s)'] = previous_result['Median (s)']
+      row['Change'] = f'{100 * change:+.1f}%'
+      row['Status'] = 'REGRESSION' if change > REGRESSION_THRESHOLD else 'Faster' if change < -REGRESSION_THRESHOLD else ''
+
+    rows.append(row)
+
+  return rows
+
+def main():
+  parser = argparse.ArgumentParser(description='Times the hot paths against synthetic market data, without any API requests')
+  parser.add_argument('-s', '--scale', type=float, default=1.0, help='Multiplies the number of symbols and contracts (1 is 10k symbols and 100k contracts)')
+  parser.add_argument('-r', '--repeat', type=int, default=3, help='Times each benchmark is run, the median is reported')
+  parser.add_argument('-l', '--label', default=None, help='Name the results are saved under. Defaults to the current git commit')
+  parser.add_argument('-c', '--compare', default=None, help='Results file to compare against. Defaults to the most recent one of another label')
+  parser.add_argument('-o', '--only', default=None, help='Only runs the benchmarks whose name contains this')
+  arguments = parser.parse_args()
+
+  label = arguments.label or GetVersionLabel()
+  notes = []
+
+  UseFakeProviders()
+  locale_note = SetCurrencyLocale()
+
+  if locale_note != None:
+    print(f'Note: {locale_note}')
+    notes.append(locale_note)
+
+  results = RunBenchmarks(arguments.scale, arguments.repeat, arguments.only)
+
+  os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+  results_path = os.path.join(RESULTS_DIRECTORY, f'{label}.json')
+
+  with open(results_path, mode='w') as results_file:
+    js.dump({
+      'Label' : label,
+      'Time' : dt.datetime.now().isoformat(timespec='seconds'),
+      'Python' : platform.python_version(),
+      'Platform' : platform.platform(),
+      'Scale' : arguments.scale,
+      'Repeat' : arguments.repeat,
+      'Notes' : notes,
+      'Results' : results
+    }, results_file, indent=2)
+
+  previous_path = arguments.compare or FindPreviousResults(label)
+  previous_results = {}
+
+  if previous_path != None:
+    with open(previous_path, mode='r') as previous_file:
+      previous_results = js.load(previous_file)['Results']
+
+    print(f"\nCompared to '{os.path.basename(previous_path)}':")
+
+  print(tabulate.tabulate(CompareResults(results, previous_results), headers='keys'))
+  print(f"\nResults saved to '{results_path}'")
+
+if __name__ == "__main__":
+  main()
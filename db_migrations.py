@@ -0,0 +1,340 @@
+import re, sqlite3, datetime as dt
+
+from typing import *
+
+# Every step of the database schema, in the order they were added. A database's PRAGMA user_version is the
+# number of steps it has been through. Databases made before versioning are at version 0 but may already have
+# some of the first steps' changes, so those steps must be safe to run again
+#
+# New steps are only ever added to the end of MIGRATIONS (see bottom of file)
+
+def __add_column_if_missing(cursor : sqlite3.Cursor, table_name : str, col_name : str, col_type : str) -> None:
+  cursor.execute(f"PRAGMA table_info({table_name})")
+
+  if col_name not in [column[1] for column in cursor.fetchall()]:
+    cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {col_name} {col_type}")
+
+def __create_tables(cursor : sqlite3.Cursor) -> None:
+  cursor.execute("""CREATE TABLE IF NOT EXISTS ListedEquities (
+                      Symbol CHAR(10),
+                      CompanyName CHAR(255))""")
+
+  cursor.execute("""CREATE TABLE IF NOT EXISTS Equities (
+                      Symbol CHAR(10),
+                      CompanyName CHAR(255),
+                      '1D' FLOAT(5),
+                      '1W' FLOAT(5),
+                      '1M' FLOAT(5),
+                      '3M' FLOAT(5),
+                      '1Y' FLOAT(5),
+                      '5Y' FLOAT(5),
+                      '10Y' FLOAT(5),
+                      Max FLOAT(5),
+                      LastUpdated DATETIME DEFAULT CURRENT_TIMESTAMP)""")
+
+  cursor.execute("""CREATE TABLE IF NOT EXISTS Options (
+                      CompanySymbol CHAR(10),
+                      Type CHAR(4),
+                      Description CHAR(255),
+                      Symbol CHAR(255),
+                      BlackScholesValue FLOAT(10),
+                      TDAmeritrade FLOAT(10),
+                      Premium FLOAT(10),
+                      ContractRating FLOAT(20),
+                      LastUpdated DATETIME DEFAULT CURRENT_TIMESTAMP)""")
+
+  cursor.execute("""CREATE TRIGGER IF NOT EXISTS Update_Equities_LastUpdated
+                    AFTER UPDATE ON Equities
+                    FOR EACH ROW
+                    BEGIN
+                        UPDATE Equities SET LastUpdated = CURRENT_TIMESTAMP WHERE Symbol=old.Symbol;
+                    END""")
+
+  cursor.execute("""CREATE TRIGGER IF NOT EXISTS Update_Options_LastUpdated
+                    AFTER UPDATE ON Options
+                    FOR EACH ROW
+                    BEGIN
+                        UPDATE Options SET LastUpdated = CURRENT_TIMESTAMP WHERE Symbol=old.Symbol;
+                    END""")
+
+def __add_implied_volatility(cursor : sqlite3.Cursor) -> None:
+  __add_column_if_missing(cursor, 'Options', 'ImpliedVolatility', 'FLOAT(10)')
+
+def __create_backtests_table(cursor : sqlite3.Cursor) -> None:
+  cursor.execute("""CREATE TABLE IF NOT EXISTS Backtests (
+                      Symbol CHAR(10),
+                      StartRange CHAR(10),
+                      Principal FLOAT(10),
+                      PeriodicInvestment FLOAT(10),
+                      Period FLOAT(5),
+                      StartDate DATE,
+                      InvestmentYears FLOAT(5),
+                      MoneySpent FLOAT(10),
+                      SharesPurchased FLOAT(10),
+                      MarketValue FLOAT(10),
+                      NetProfit FLOAT(10),
+                      YearlyReturn FLOAT(10),
+                      InvestmentRating CHAR(3),
+                      LastUpdated DATETIME DEFAULT CURRENT_TIMESTAMP)""")
+
+  cursor.execute("""CREATE TRIGGER IF NOT EXISTS Update_Backtests_LastUpdated
+                    AFTER UPDATE ON Backtests
+                    FOR EACH ROW
+                    BEGIN
+                        UPDATE Backtests SET LastUpdated = CURRENT_TIMESTAMP WHERE rowid=old.rowid;
+                    END""")
+
+def __make_listing_symbols_unique(cursor : sqlite3.Cursor) -> None:
+  # Listings used to be added again on every init, so duplicates have to go before Symbol can be unique
+  __add_column_if_missing(cursor, 'ListedEquities', 'Delisted', 'BOOLEAN DEFAULT 0')
+
+  cursor.execute("""DELETE FROM ListedEquities
+                    WHERE rowid NOT IN (SELECT MAX(rowid) FROM ListedEquities GROUP BY Symbol)""")
+  cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS ListedEquities_Symbol ON ListedEquities (Symbol)")
+
+def __index_hot_columns(cursor : sqlite3.Cursor) -> None:
+  # Only the most recently added entry of an equity is kept
+  cursor.execute("""DELETE FROM Equities
+                    WHERE rowid NOT IN (SELECT MAX(rowid) FROM Equities GROUP BY Symbol)""")
+
+  cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS Equities_Symbol ON Equities (Symbol)")
+  cursor.execute("CREATE INDEX IF NOT EXISTS Equities_LastUpdated ON Equities (LastUpdated)")
+  cursor.execute("CREATE INDEX IF NOT EXISTS Options_CompanySymbol ON Options (CompanySymbol)")
+  cursor.execute("CREATE INDEX IF NOT EXISTS Options_Symbol ON Options (Symbol)")
+  cursor.execute("CREATE INDEX IF NOT EXISTS Backtests_Key ON Backtests (Symbol, StartRange, Principal, PeriodicInvestment, Period)")
+
+def __add_option_expiration_and_strike(cursor : sqlite3.Cursor) -> None:
+  __add_column_if_missing(cursor, 'Options', 'ExpirationDate', 'DATE')
+  __add_column_if_missing(cursor, 'Options', 'Strike', 'FLOAT(10)')
+
+  # Existing options only have them in their description (ex. 'MSFT May 22 2020 162.5 Call (Weekly)')
+  cursor.execute("SELECT rowid, Description FROM Options WHERE ExpirationDate IS NULL")
+  backfilled_rows = []
+
+  for (rowid, description) in cursor.fetchall():
+    description_match = re.search(r'\s(\w{3})\s(\d+)\s(\d{4})\s([\d.]+)\s', description or '')
+
+    if description_match != None:
+      month, day, year, strike = description_match.groups()
+      expiration_date = dt.datetime.strptime(f'{month}-{day}-{year}', '%b-%d-%Y').date().isoformat()
+
+      backfilled_rows.append((expiration_date, float(strike), rowid))
+
+  # Filling in the new columns should not count as the options being updated
+  cursor.execute("DROP TRIGGER IF EXISTS Update_Options_LastUpdated")
+  cursor.executemany("UPDATE Options SET ExpirationDate = ?, Strike = ? WHERE rowid = ?", backfilled_rows)
+  cursor.execute("""CREATE TRIGGER Update_Options_LastUpdated
+                    AFTER UPDATE ON Options
+                    FOR EACH ROW
+                    BEGIN
+                        UPDATE Options SET LastUpdated = CURRENT_TIMESTAMP WHERE Symbol=old.Symbol;
+                    END""")
+
+  cursor.execute("CREATE INDEX IF NOT EXISTS Options_ExpirationDate ON Options (ExpirationDate)")
+
+def __store_missing_performance_as_null(cursor : sqlite3.Cursor) -> None:
+  performance_columns = ['1D', '1W', '1M', '3M', '1Y', '5Y', '10Y', 'Max']
+
+  # Missing data used to be stored as 'N/A' text next to the numbers, which made the columns sort as text
+  cursor.execute("DROP TRIGGER IF EXISTS Update_Equities_LastUpdated")
+
+  for col_name in performance_columns:
+    cursor.execute(f"""UPDATE Equities
+                       SET "{col_name}" = CASE WHEN "{col_name}" = 'N/A' OR trim("{col_name}") = '' THEN NULL ELSE CAST("{col_name}" AS REAL) END
+                       WHERE typeof("{col_name}") = 'text'""")
+
+  cursor.execute("""CREATE TRIGGER Update_Equities_LastUpdated
+                    AFTER UPDATE ON Equities
+                    FOR EACH ROW
+                    BEGIN
+                        UPDATE Equities SET LastUpdated = CURRENT_TIMESTAMP WHERE Symbol=old.Symbol;
+                    END""")
+
+  # Sorting by a performance column or taking the top few can now be read straight from an index
+  for col_name in performance_columns:
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS Equities_{col_name} ON Equities ("{col_name}")')
+
+  cursor.execute("CREATE INDEX IF NOT EXISTS Options_ContractRating ON Options (ContractRating)")
+
+def __get_refill_sql(board : str, table_name : str, col_name : str, descending : bool, type_filter : Optional[str], size : int) -> str:
+  """
+  Takes the best rows that are not on the board until it is full again, straight from the column's index
+  """
+
+  table_filter = f"AND Type = '{type_filter}'" if type_filter != None else ''
+
+  return f"""INSERT INTO Leaderboards
+             SELECT '{board}', rowid, "{col_name}" FROM {table_name}
+             WHERE "{col_name}" IS NOT NULL {table_filter}
+               AND rowid NOT IN (SELECT SourceRowId FROM Leaderboards WHERE Board = '{board}')
+             ORDER BY "{col_name}" {'DESC' if descending else 'ASC'}
+             LIMIT max({size} - (SELECT COUNT(*) FROM Leaderboards WHERE Board = '{board}'), 0);"""
+
+def __get_count_sql(board : str) -> str:
+  return f"""UPDATE LeaderboardDefinitions SET Entries = (SELECT COUNT(*) FROM Leaderboards WHERE Board = '{board}')
+             WHERE Board = '{board}';"""
+
+def __create_leaderboards(cursor : sqlite3.Cursor) -> None:
+  # Each board keeps the rowids of the LEADERBOARD_SIZE best rows of a table by one column, so they can be read
+  # without sorting the table. The triggers below keep the boards up to date in the same transaction as the change
+  LEADERBOARD_SIZE = 100
+
+  cursor.execute("""CREATE TABLE LeaderboardDefinitions (
+                      Board CHAR(32) PRIMARY KEY,
+                      TableName CHAR(32),
+                      ColumnName CHAR(32),
+                      Descending BOOLEAN,
+                      TypeFilter CHAR(4),
+                      Size INTEGER,
+                      Entries INTEGER DEFAULT 0)""")
+
+  cursor.execute("""CREATE TABLE Leaderboards (
+                      Board CHAR(32),
+                      SourceRowId INTEGER,
+                      Value FLOAT,
+                      PRIMARY KEY (Board, SourceRowId))""")
+  cursor.execute("CREATE INDEX Leaderboards_Value ON Leaderboards (Board, Value)")
+  cursor.execute("CREATE INDEX IF NOT EXISTS Options_Type_ContractRating ON Options (Type, ContractRating)")
+
+  # (board, table, column, descending, type filter). A '-' board has the lowest values
+  definitions = [(col_name, 'Equities', col_name, True, None) for col_name in ['1D', '1W', '1M', '3M', '1Y', '5Y', '10Y', 'Max']]
+  definitions += [(f'-{col_name}', 'Equities', col_name, False, None) for (_, _, col_name, _, _) in definitions]
+  definitions += [('Calls', 'Options', 'ContractRating', True, 'CALL'), ('Puts', 'Options', 'ContractRating', True, 'PUT')]
+
+  cursor.executemany("INSERT INTO LeaderboardDefinitions (Board, TableName, ColumnName, Descending, TypeFilter, Size) VALUES (?, ?, ?, ?, ?, ?)",
+                     [definition + (LEADERBOARD_SIZE,) for definition in definitions])
+
+  for (board, table_name, col_name, descending, type_filter) in definitions:
+    direction = 'DESC' if descending else 'ASC'
+    table_filter = f"AND Type = '{type_filter}'" if type_filter != None else ''
+
+    # Only an index lookup each, so rows that do not belong on the board skip its triggers cheaply
+    is_on_board = f"EXISTS (SELECT 1 FROM Leaderboards WHERE Board = '{board}' AND SourceRowId = old.rowid)"
+    belongs_on_board = f"""(new."{col_name}" IS NOT NULL {table_filter.replace('Type', 'new.Type')}
+                            AND ((SELECT Entries FROM LeaderboardDefinitions WHERE Board = '{board}') < {LEADERBOARD_SIZE}
+                                 OR new."{col_name}" {'>' if descending else '<'} (SELECT {'MIN' if descending else 'MAX'}(Value) FROM Leaderboards WHERE Board = '{board}')))"""
+
+    remove = f"DELETE FROM Leaderboards WHERE Board = '{board}' AND SourceRowId = old.rowid;"
+
+    refill = __get_refill_sql(board, table_name, col_name, descending, type_filter, LEADERBOARD_SIZE)
+
+    add = f"""INSERT OR IGNORE INTO Leaderboards
+              SELECT '{board}', new.rowid, new."{col_name}" WHERE {belongs_on_board};"""
+
+    trim = f"""DELETE FROM Leaderboards
+               WHERE Board = '{board}' AND SourceRowId IN (SELECT SourceRowId FROM Leaderboards WHERE Board = '{board}'
+                                                           ORDER BY Value {direction} LIMIT -1 OFFSET {LEADERBOARD_SIZE});"""
+
+    count = __get_count_sql(board)
+
+    watched_columns = f'"{col_name}", Type' if type_filter != None else f'"{col_name}"'
+
+    cursor.execute(f"""CREATE TRIGGER "Leaderboard {board} Insert"
+                       AFTER INSERT ON {table_name}
+                       FOR EACH ROW WHEN {belongs_on_board}
+                       BEGIN
+                         {add} {trim} {count}
+                       END""")
+
+    # An update is the old value leaving the board and the new value entering it
+    cursor.execute(f"""CREATE TRIGGER "Leaderboard {board} Update"
+                       AFTER UPDATE OF {watched_columns} ON {table_name}
+                       FOR EACH ROW WHEN {is_on_board} OR {belongs_on_board}
+                       BEGIN
+                         {remove} {refill} {add} {trim} {count}
+                       END""")
+
+    cursor.execute(f"""CREATE TRIGGER "Leaderboard {board} Delete"
+                       AFTER DELETE ON {table_name}
+                       FOR EACH ROW WHEN {is_on_board}
+                       BEGIN
+                         {remove} {refill} {count}
+                       END""")
+
+    # Fill the board from the rows already in the table
+    cursor.execute(refill)
+    cursor.execute(count.replace(';', ''))
+
+def __add_row_id_key(cursor : sqlite3.Cursor, table_name : str) -> None:
+  """
+  Rebuilds the table with an Id INTEGER PRIMARY KEY column holding each row's current rowid, along with its indexes and triggers
+  """
+
+  cursor.execute(f"PRAGMA table_info({table_name})")
+  columns = cursor.fetchall()
+
+  col_definitions = ", ".join(f'"{col_name}" {col_type}' + (f' DEFAULT {default}' if default != None else '')
+                              for (_, col_name, col_type, _, default, _) in columns)
+  col_names = ", ".join(f'"{col_name}"' for (_, col_name, _, _, _, _) in columns)
+
+  cursor.execute("SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL", (table_name,))
+  dependent_statements = [row[0] for row in cursor.fetchall()]
+
+  cursor.execute(f"CREATE TABLE {table_name}_Rebuilt (Id INTEGER PRIMARY KEY, {col_definitions})")
+  cursor.execute(f"INSERT INTO {table_name}_Rebuilt (Id, {col_names}) SELECT rowid, {col_names} FROM {table_name}")
+  cursor.execute(f"DROP TABLE {table_name}")
+  cursor.execute(f"ALTER TABLE {table_name}_Rebuilt RENAME TO {table_name}")
+
+  for statement in dependent_statements:
+    cursor.execute(statement)
+
+def __key_leaderboard_tables(cursor : sqlite3.Cursor) -> None:
+  # The boards point at rows by rowid, which VACUUM may renumber unless it is an INTEGER PRIMARY KEY. Once it is, the
+  # rowid is the Id column, so the boards and their triggers keep pointing at the same rows
+  for table_name in ['Equities', 'Options']:
+    __add_row_id_key(cursor, table_name)
+
+MIGRATIONS = [
+  __create_tables,
+  __add_implied_volatility,
+  __create_backtests_table,
+  __make_listing_symbols_unique,
+  __index_hot_columns,
+  __add_option_expiration_and_strike,
+  __store_missing_performance_as_null,
+  __create_leaderboards,
+  __key_leaderboard_tables
+]
+
+def GetSchemaVersion(connection : sqlite3.Connection) -> int:
+  return connection.execute("PRAGMA user_version").fetchone()[0]
+
+def Migrate(connection : sqlite3.Connection) -> int:
+  """
+  Runs every migration step the database has not been through yet. Each step and the version
+  it brings the database to are saved together, so a failed step leaves the database at the version before it.
+  Returns the number of steps run
+  """
+
+  current_version = GetSchemaVersion(connection)
+
+  if current_version > len(MIGRATIONS):
+    raise RuntimeError(f"Database is at version {current_version}, this program only knows up to version {len(MIGRATIONS)}")
+
+  cursor = connection.cursor()
+
+  for (version, migration) in enumerate(MIGRATIONS[current_version:], start=current_version + 1):
+    cursor.execute("BEGIN")
+
+    try:
+      migration(cursor)
+      cursor.execute(f"PRAGMA user_version = {version}")
+    except:
+      connection.rollback()
+      raise
+
+    connection.commit()
+
+  return len(MIGRATIONS) - current_version
+
+def RefillLeaderboards(cursor : sqlite3.Cursor, table_name : str) -> None:
+  """
+  Fills every board of the table back up to its size and recounts its entries. Used after rows were
+  taken off the boards in bulk, so each board is refilled once instead of once per row
+  """
+
+  cursor.execute("SELECT Board, ColumnName, Descending, TypeFilter, Size FROM LeaderboardDefinitions WHERE TableName = ?", (table_name,))
+
+  for (board, col_name, descending, type_filter, size) in cursor.fetchall():
+    cursor.execute(__get_refill_sql(board, table_name, col_name, descending, type_filter, size))
+    cursor.execute(__get_count_sql(board))
@@ -0,0 +1,333 @@
+import os, re, enum, zlib, time, hashlib, tempfile, threading, collections, requests, metrics, json as js, datetime as dt
+
+from typing import *
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from providers import Provider, Throttle, PauseIfRateLimited
+
+
+class CacheMode(enum.Enum):
+  Off = 'off'         # Every request goes to the provider and nothing is cached
+  Normal = 'normal'   # Cached responses are used until they expire, everything else is downloaded and cached
+  Record = 'record'   # Every request goes to the provider and its response is cached
+  Replay = 'replay'   # Only cached responses are used, however old. Anything not cached gets a 504 without a request being made
+
+# Seconds a response is used for, by a pattern matched against the host and path of its URL. The first matching pattern is used
+DEFAULT_TTLS = {
+  r'^(www|api)\.nasdaq\.com/api/(v1/)?screener' : 24 * 60 * 60,
+  r'^api\.tdameritrade\.com/v1/marketdata/chains' : 15 * 60,
+  r'(^|\.)finance\.yahoo\.com/' : 6 * 60 * 60
+}
+# Responses of any other URL are still cached for replaying, but are never used in Normal mode
+DEFAULT_TTL = 0
+
+DEFAULT_MAX_SIZE = 512 * 1024 ** 2
+
+# Params that do not change the response (ex. credentials), so requests that only differ in them share a cache entry
+IGNORED_PARAMS = {'apikey', 'api_key', 'crumb'}
+# Params that are timestamps of a day to download data from or to. They are compared by date, since they are
+# usually made from the current time and would otherwise never match
+DATE_PARAMS = {'fromDate', 'toDate', 'period1', 'period2'}
+# Params of DATE_PARAMS that are the last day to download data for
+END_DATE_PARAMS = {'toDate', 'period2'}
+
+# Patterns of URLs with a price per day, up to the day of the request's end date param. When that is the current day, its
+# prices keep changing until the market closes, so the response is cached for replaying but never used in Normal mode.
+# Otherwise prices downloaded during the day could be used after the close as if they were the day's final prices
+DAILY_PRICE_PATTERNS = [r'(^|\.)finance\.yahoo\.com/']
+
+def __normalize_param(name : str, value : Any) -> str:
+  if name in DATE_PARAMS:
+    if isinstance(value, (dt.datetime, dt.date)):
+      return value.strftime('%Y-%m-%d')
+    elif re.fullmatch(r'\d+', str(value)):
+      return dt.datetime.fromtimestamp(int(value), dt.timezone.utc).strftime('%Y-%m-%d')
+    else:
+      return str(value)[:10]
+
+  return str(value)
+
+def __get_param_pairs(url : str, params : Any) -> List[Tuple[Any, Any]]:
+  """
+  The (name, value) pairs of the request's params and its URL's query string
+  """
+
+  pairs = parse_qsl(urlsplit(url).query, keep_blank_values=True)
+
+  if isinstance(params, dict):
+    pairs += [(name, value) for (name, value) in params.items() if value != None]
+  elif params != None:
+    pairs += list(params)
+
+  return pairs
+
+def GetCacheKey(method : str, url : str, params : Any = None) -> str:
+  """
+  Identifies a request by its method, URL and params, in any order and including those in the URL's query string
+  """
+
+  split_url = urlsplit(url)
+  pairs = __get_param_pairs(url, params)
+
+  normalized_pairs = sorted((str(name), __normalize_param(str(name), value)) for (name, value) in pairs if str(name) not in IGNORED_PARAMS)
+  request_description = f'{method.upper()} {split_url.netloc.lower()}{split_url.path}?{urlencode(normalized_pairs)}'
+
+  return hashlib.sha256(request_description.encode()).hexdigest()
+
+def EndsToday(url : str, params : Any = None) -> bool:
+  """
+  Checks whether the request's end date param (see END_DATE_PARAMS) is the current day or later
+  """
+
+  # The day is not the same everywhere, so it is the current day if it is in either local time or UTC
+  today = min(dt.date.today(), dt.datetime.now(dt.timezone.utc).date()).strftime('%Y-%m-%d')
+
+  return any(__normalize_param(str(name), value) >= today for (name, value) in __get_param_pairs(url, params) if str(name) in END_DATE_PARAMS)
+
+class ResponseCache:
+  """
+  The ResponseCache class keeps HTTP responses on disk, compressed, with one file per request. When the
+  files take up more than max_size bytes, the least recently used ones are deleted
+  """
+
+  # Headers that describe how the body was sent, which no longer apply once it is decoded and cached
+  __transfer_headers = {'content-encoding', 'content-length', 'transfer-encoding', 'connection'}
+
+  def __init__(self, directory_path : str, max_size = DEFAULT_MAX_SIZE, ttls : Optional[Dict[str, float]] = None,
+               default_ttl = DEFAULT_TTL, mode = CacheMode.Normal):
+    os.makedirs(directory_path, exist_ok=True)
+
+    self.Mode = mode
+    self.MaxSize = max_size
+    self.TTLs = dict(DEFAULT_TTLS if ttls == None else ttls)
+    self.DefaultTTL = default_ttl
+
+    self.__directory_path = directory_path
+    self.__lock = threading.Lock()
+
+    # Size of every cached file by key, least recently used first
+    self.__entry_sizes = collections.OrderedDict()
+    self.__total_size = 0
+
+    with os.scandir(directory_path) as entries:
+      cache_files = sorted((entry for entry in entries if entry.name.endswith('.z')), key=lambda entry: entry.stat().st_mtime)
+
+    for cache_file in cache_files:
+      self.__entry_sizes[cache_file.name[:-2]] = cache_file.stat().st_size
+      self.__total_size += cache_file.stat().st_size
+
+  @staticmethod
+  def __build_response(url : str, status_code : int, reason : str, headers : Dict[str, str], content : bytes, encoding : Optional[str] = None) -> requests.Response:
+    response = requests.Response()
+    response.url = url
+    response.status_code = status_code
+    response.reason = reason
+    response.headers = requests.structures.CaseInsensitiveDict(headers)
+    response.encoding = encoding
+    response._content = content
+
+    return response
+
+  def __get_file_path(self, key : str) -> str:
+    return os.path.join(self.__directory_path, f'{key}.z')
+
+  def GetTTL(self, url : str, params : Any = None) -> float:
+    """
+    Seconds a response of the URL and params is used for
+    """
+
+    split_url = urlsplit(url)
+    host_and_path = f'{split_url.netloc.lower()}{split_url.path}'
+
+    if any(re.search(pattern, host_and_path) for pattern in DAILY_PRICE_PATTERNS) and EndsToday(url, params):
+      return 0
+
+    for (pattern, ttl) in self.TTLs.items():
+      if re.search(pattern, host_and_path):
+        return ttl
+
+    return self.DefaultTTL
+
+  def Get(self, key : str, max_age : Optional[float] = None) -> Optional[requests.Response]:
+    """
+    Returns the cached response, or None if there is none or it is older than max_age seconds
+    """
+
+    with self.__lock:
+      if key not in self.__entry_sizes:
+        return None
+
+      self.__entry_sizes.move_to_end(key)
+
+    try:
+      with open(self.__get_file_path(key), mode='rb') as cache_file:
+        header, content = zlib.decompress(cache_file.read()).split(b'\n', 1)
+
+      # Marks the file as recently used for the next time the cache is opened
+      os.utime(self.__get_file_path(key))
+    except (OSError, zlib.error, ValueError): # Evicted by another thread, or unreadable
+      return None
+
+    entry = js.loads(header)
+
+    if max_age != None and time.time() - entry['stored'] > max_age:
+      return None
+
+    return ResponseCache.__build_response(entry['url'], entry['status_code'], entry['reason'], entry['headers'], content, entry['encoding'])
+
+  def Put(self, key : str, response : requests.Response) -> None:
+    """
+    Caches the response under the key, then evicts the least recently used responses until the cache fits in MaxSize
+    """
+
+    header = js.dumps({
+      'url' : response.url,
+      'status_code' : response.status_code,
+      'reason' : response.reason,
+      'headers' : {name : value for (name, value) in response.headers.items() if name.lower() not in ResponseCache.__transfer_headers},
+      'encoding' : response.encoding,
+      'stored' : time.time()
+    })
+
+    # Write to a temporary file first so a reader never sees a half written file
+    file_descriptor, temp_path = tempfile.mkstemp(dir=self.__directory_path, suffix='.tmp')
+
+    with os.fdopen(file_descriptor, mode='wb') as temp_file:
+      temp_file.write(zlib.compress(header.encode() + b'\n' + response.content))
+      file_size = temp_file.tell()
+
+    os.replace(temp_path, self.__get_file_path(key))
+
+    with self.__lock:
+      self.__total_size += file_size - self.__entry_sizes.pop(key, 0)
+      self.__entry_sizes[key] = file_size
+
+      evicted_keys = []
+      while self.__total_size > self.MaxSize and len(self.__entry_sizes) > 1:
+        evicted_key, evicted_size = self.__entry_sizes.popitem(last=False)
+        self.__total_size -= evicted_size
+        evicted_keys.append(evicted_key)
+
+    for evicted_key in evicted_keys:
+      try:
+        os.remove(self.__get_file_path(evicted_key))
+      except FileNotFoundError:
+        pass
+
+    if len(evicted_keys) > 0:
+      metrics.IncrementCounter('http_cache.evicted', len(evicted_keys))
+
+  def Fetch(self, method : str, url : str, params : Any, send_func : Callable[[], requests.Response]) -> requests.Response:
+    """
+    Answers the request from the cache or with send_func(), depending on the mode. Only successful GET requests are cached
+    """
+
+    if self.Mode == CacheMode.Off or method.upper() != 'GET':
+      return send_func()
+
+    key = GetCacheKey(method, url, params)
+
+    if self.Mode in [CacheMode.Normal, CacheMode.Replay]:
+      cached_response = self.Get(key, max_age=self.GetTTL(url, params) if self.Mode == CacheMode.Normal else None)
+
+      if cached_response != None:
+        metrics.IncrementCounter('http_cache.hit')
+        return cached_response
+
+      metrics.IncrementCounter('http_cache.miss')
+
+      if self.Mode == CacheMode.Replay:
+        return ResponseCache.__build_response(url, 504, 'Not Cached', {}, b'')
+
+    response = send_func()
+
+    if response.status_code == 200:
+      self.Put(key, response)
+
+    return response
+
+  def Clear(self) -> None:
+    with self.__lock:
+      keys = list(self.__entry_sizes.keys())
+      self.__entry_sizes.clear()
+      self.__total_size = 0
+
+    for key in keys:
+      try:
+        os.remove(self.__get_file_path(key))
+      except FileNotFoundError:
+        pass
+
+  def Summary(self) -> Dict[str, Any]:
+    with self.__lock:
+      return {
+        'Mode' : self.Mode.value,
+        'Responses' : len(self.__entry_sizes),
+        'Size (MB)' : round(self.__total_size / 1024 ** 2, 2),
+        'Max Size (MB)' : round(self.MaxSize / 1024 ** 2, 2),
+        'Location' : self.__directory_path
+      }
+
+__cache = None
+__sessions = {}
+__session_lock = threading.Lock()
+
+def SetCache(cache : Optional[ResponseCache]) -> None:
+  """
+  Sets the cache used by every CachedSession. None turns caching off
+  """
+
+  global __cache
+  __cache = cache
+
+def GetCache() -> Optional[ResponseCache]:
+  return __cache
+
+class CachedSession(requests.Session):
+  """
+  A requests.Session whose requests go through the cache set with SetCache(), if there is one. If the session
+  sends requests to a provider, the requests that are not answered from the cache are throttled to the provider's
+  limits (see providers.Throttle()), and an HTTP 429 response to any of them pauses every request to the provider
+  """
+
+  def __init__(self, provider : Optional[Provider] = None):
+    super().__init__()
+    self.Provider = provider
+
+  def request(self, method : str, url : str, params : Any = None, **kwargs) -> requests.Response:
+    def send_func():
+      if self.Provider == None:
+        return super(CachedSession, self).request(method, url, params=params, **kwargs)
+
+      # Only requests that are sent wait on the provider's limits, cached responses are returned right away
+      with Throttle(self.Provider):
+        response = super(CachedSession, self).request(method, url, params=params, **kwargs)
+
+      PauseIfRateLimited(self.Provider, response)
+      return response
+
+    cache = GetCache()
+
+    if cache == None:
+      return send_func()
+
+    return cache.Fetch(method, url, params, send_func)
+
+class SharedSession(CachedSession):
+  """
+  A CachedSession used by many threads at once (see GetSession()). Closing it does nothing, since readers that close
+  the session they are given once they are done (ex. pandas_datareader) would drop the pooled connections of every other thread
+  """
+
+  def close(self) -> None:
+    pass
+
+def GetSession(provider : Optional[Provider] = None) -> SharedSession:
+  """
+  A CachedSession shared by every request to the provider that does not need its own, so connections are reused between them
+  """
+
+  with __session_lock:
+    if provider not in __sessions:
+      __sessions[provider] = SharedSession(provider)
+
+  return __sessions[provider]
@@ -0,0 +1,100 @@
+import time, itertools, threading, datetime as dt
+
+from typing import *
+
+
+class BackgroundJob:
+  """
+  The BackgroundJob class runs a long command (ex. an update) on its own thread. The command is given the job,
+  whose UpdateStatus() and UpdateProgress() can be used as its status_func and progress_func so its progress
+  is recorded for the user to look at instead of being printed over the prompt, and whose cancel_event it
+  should check between securities to stop early
+  """
+
+  __job_ids = itertools.count(1)
+
+  def __init__(self, description : str, func : Callable[['BackgroundJob'], None]):
+    self.Id = next(BackgroundJob.__job_ids)
+    self.Description = description
+    self.Status = 'Starting'
+    self.Message = ''
+    self.Progress = None
+    self.StartTime = dt.datetime.now()
+    self.EndTime = None
+    self.Error = None
+
+    self.cancel_event = threading.Event()
+
+    self.__thread = threading.Thread(target=self.__run, args=(func,), name=f'Job {self.Id}', daemon=True)
+    self.__thread.start()
+
+  def __run(self, func : Callable[['BackgroundJob'], None]) -> None:
+    try:
+      func(self)
+    except Exception as error:
+      self.Error = error
+    finally:
+      self.EndTime = dt.datetime.now()
+
+  def UpdateStatus(self, message : str, log = False) -> None:
+    """
+    Same arguments as ProgramStatusUpdate()
+    """
+
+    self.Status = message
+    self.Message = ''
+    self.Progress = None
+
+  def UpdateProgress(self, iteration : int, total : int, start_time : dt.datetime, length = 75, message = "", log = False) -> None:
+    """
+    Same arguments as ProgressBar()
+    """
+
+    self.Progress = (iteration, total, start_time)
+    self.Message = message
+
+  def Cancel(self) -> None:
+    """
+    Asks the job to stop. Whatever it has finished so far is kept
+    """
+
+    self.cancel_event.set()
+
+  def IsRunning(self) -> bool:
+    return self.__thread.is_alive()
+
+  def Join(self, timeout : Optional[float] = None) -> None:
+    self.__thread.join(timeout)
+
+  def GetState(self) -> str:
+    if self.IsRunning():
+      return 'Cancelling' if self.cancel_event.is_set() else 'Running'
+    elif self.Error != None:
+      return 'Failed'
+
+    return 'Cancelled' if self.cancel_event.is_set() else 'Finished'
+
+  def Summary(self) -> Dict[str, Any]:
+    """
+    Describes the job for the jobs command
+    """
+
+    progress = ''
+    time_remaining = ''
+
+    if self.Progress != None and self.IsRunning():
+      iteration, total, start_time = self.Progress
+      progress = f'{100 * iteration / total:.2f}% ({iteration}/{total})'
+      time_remaining = time.strftime("%H:%M:%S", time.gmtime((dt.datetime.now() - start_time).total_seconds() * (total / iteration - 1)))
+
+    end_time = self.EndTime or dt.datetime.now()
+
+    return {
+      'Id' : self.Id,
+      'Command' : self.Description,
+      'State' : self.GetState(),
+      'Status' : f'{self.Status} {self.Message}'.strip() if self.Error == None else f'{type(self.Error).__name__}: {self.Error}',
+      'Progress' : progress,
+      'Time Remaining' : time_remaining,
+      'Run Time' : str(end_time - self.StartTime).split('.')[0]
+    }
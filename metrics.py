@@ -0,0 +1,153 @@
+import time, json as js, bisect, functools, threading, contextlib, datetime as dt
+
+from typing import *
+
+# Upper bounds in seconds of the latency histogram buckets, 1ms doubling up to about 2 minutes
+LATENCY_BUCKETS = [0.001 * 2 ** power for power in range(18)]
+
+class Histogram:
+  """
+  The Histogram class counts how many measurements fall in each of LATENCY_BUCKETS, so percentiles can be
+  estimated without keeping every measurement
+  """
+
+  def __init__(self):
+    self.Count = 0
+    self.Errors = 0
+    self.Total = 0.0
+    self.Min = float('inf')
+    self.Max = 0.0
+    self.BucketCounts = [0] * (len(LATENCY_BUCKETS) + 1)
+
+  def Observe(self, seconds : float) -> None:
+    self.Count += 1
+    self.Total += seconds
+    self.Min = min(self.Min, seconds)
+    self.Max = max(self.Max, seconds)
+    self.BucketCounts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+  def Percentile(self, percent : float) -> float:
+    """
+    Upper bound of the bucket the percentile falls in, or the slowest measurement if that is lower
+    """
+
+    if self.Count == 0:
+      return 0.0
+
+    target_count = percent / 100 * self.Count
+    running_count = 0
+
+    for (index, bucket_count) in enumerate(self.BucketCounts, start=0):
+      running_count += bucket_count
+
+      if running_count >= target_count:
+        return min(LATENCY_BUCKETS[index], self.Max) if index < len(LATENCY_BUCKETS) else self.Max
+
+    return self.Max
+
+  def Summary(self) -> Dict[str, Any]:
+    return {
+      'Count' : self.Count,
+      'Errors' : self.Errors,
+      'Total (s)' : round(self.Total, 3),
+      'Mean (ms)' : round(1000 * self.Total / self.Count, 2) if self.Count > 0 else 0.0,
+      'P50 (ms)' : round(1000 * self.Percentile(50), 2),
+      'P95 (ms)' : round(1000 * self.Percentile(95), 2),
+      'Max (ms)' : round(1000 * self.Max, 2)
+    }
+
+__lock = threading.Lock()
+__counters = {}
+__histograms = {}
+__start_time = dt.datetime.now()
+
+def IncrementCounter(name : str, amount = 1) -> None:
+  with __lock:
+    __counters[name] = __counters.get(name, 0) + amount
+
+def ObserveLatency(name : str, seconds : float, failed = False) -> None:
+  with __lock:
+    histogram = __histograms.setdefault(name, Histogram())
+    histogram.Observe(seconds)
+
+    if failed:
+      histogram.Errors += 1
+
+@contextlib.contextmanager
+def Timer(name : str) -> Iterator[None]:
+  """
+  Records how long the wrapped code takes in the name histogram. Exceptions are counted as errors and raised again
+  """
+
+  start = time.perf_counter()
+
+  try:
+    yield
+  except:
+    ObserveLatency(name, time.perf_counter() - start, failed=True)
+    raise
+
+  ObserveLatency(name, time.perf_counter() - start)
+
+def Timed(name : str) -> Callable[[Callable], Callable]:
+  """
+  Decorator version of Timer()
+  """
+
+  def decorator(func : Callable) -> Callable:
+    @functools.wraps(func)
+    def timed_func(*args, **kwargs):
+      with Timer(name):
+        return func(*args, **kwargs)
+
+    return timed_func
+
+  return decorator
+
+def GetSummaryRows() -> List[Dict[str, Any]]:
+  """
+  One row per histogram, then one per counter, sorted by name
+  """
+
+  with __lock:
+    histogram_rows = [{'Name' : name, **histogram.Summary()} for (name, histogram) in sorted(__histograms.items())]
+    counter_rows = [{'Name' : name, 'Count' : count} for (name, count) in sorted(__counters.items())]
+
+  return histogram_rows + counter_rows
+
+def HasMeasurements() -> bool:
+  with __lock:
+    return len(__counters) > 0 or len(__histograms) > 0
+
+def WriteSummary(file_path : str, reset = False) -> None:
+  """
+  Writes every counter and histogram collected since the program started or was last reset to a JSON file.
+  With reset, they are cleared in the same step, so nothing recorded while the file is written is lost
+  """
+
+  global __start_time
+
+  with __lock:
+    summary = {
+      'Start Time' : __start_time.isoformat(timespec='seconds'),
+      'End Time' : dt.datetime.now().isoformat(timespec='seconds'),
+      'Counters' : dict(sorted(__counters.items())),
+      'Latencies' : {name : {**histogram.Summary(), 'Buckets' : dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ['inf'], histogram.BucketCounts))}
+                     for (name, histogram) in sorted(__histograms.items())}
+    }
+
+    if reset:
+      __counters.clear()
+      __histograms.clear()
+      __start_time = dt.datetime.now()
+
+  with open(file_path, mode='w') as summary_file:
+    js.dump(summary, summary_file, indent=2)
+
+def Reset() -> None:
+  global __start_time
+
+  with __lock:
+    __counters.clear()
+    __histograms.clear()
+    __start_time = dt.datetime.now()
@@ -0,0 +1,125 @@
+import numpy as np
+
+from typing import *
+from scipy.special import ndtr
+
+ArrayLike = Union[float, Sequence[float], np.ndarray]
+
+def __normal_pdf(x : np.ndarray) -> np.ndarray:
+  return np.exp(-0.5 * np.square(x)) / np.sqrt(2 * np.pi)
+
+def __call_value_and_vega(s : np.ndarray, x : np.ndarray, r : np.ndarray, t : np.ndarray, o : np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+  """
+  Unrounded Black-Scholes call value and vega
+  """
+
+  with np.errstate(divide='ignore', invalid='ignore'):
+    sqrt_t = np.sqrt(t)
+    d1 = (np.log(s / x) + t * (r + np.square(o) * 0.5)) / (o * sqrt_t)
+
+    call_value = s * ndtr(d1) - x * np.exp(-r * t) * ndtr(d1 - o * sqrt_t)
+    vega = s * __normal_pdf(d1) * sqrt_t
+
+  return call_value, vega
+
+def BlackScholes(underlying_price : ArrayLike, strike_price : ArrayLike, interest_rate : ArrayLike,
+                 time : ArrayLike, volatility : ArrayLike) -> Dict[str, np.ndarray]:
+  """
+  Prices every contract described by the arrays with the Black-Scholes model in one pass. Any
+  argument may be a single value that is shared by all contracts (ex. the interest rate of a chain),
+  so whole option chains, or many chains concatenated together, can be priced at once.
+  Args:
+    underlying_price  - current price of the underlying equity
+    strike_price      - exercise price of the contract
+    interest_rate     - risk free interest rate as a decimal (ex. 0.05 for 5%)
+    time              - time until expiration in years
+    volatility        - annual volatility of the underlying as a decimal
+  Returns a dictionary of arrays with the call and put values (rounded to 3 decimals) and their greeks.
+  Theta is per year, vega and rho are per 1.0 change of volatility and interest rate
+  """
+
+  s, x, r, t, o = np.broadcast_arrays(*[np.asarray(arg, dtype=float) for arg in [underlying_price, strike_price, interest_rate, time, volatility]])
+
+  with np.errstate(divide='ignore', invalid='ignore'):
+    sqrt_t = np.sqrt(t)
+    discounted_strike = x * np.exp(-r * t)
+
+    d1 = (np.log(s / x) + t * (r + np.square(o) * 0.5)) / (o * sqrt_t)
+    d2 = d1 - o * sqrt_t
+
+    n1 = ndtr(d1)
+    n2 = ndtr(d2)
+    pdf_d1 = __normal_pdf(d1)
+
+    call_value = np.round(s * n1 - discounted_strike * n2, 3)
+    put_value = np.round(call_value + discounted_strike - s, 3)
+
+    gamma = pdf_d1 / (s * o * sqrt_t)
+    vega = s * pdf_d1 * sqrt_t
+    theta_decay = -s * pdf_d1 * o / (2 * sqrt_t)
+
+    return {
+      'CallValue' : call_value,
+      'PutValue'  : put_value,
+      'CallDelta' : n1,
+      'PutDelta'  : n1 - 1,
+      'Gamma'     : gamma,
+      'Vega'      : vega,
+      'CallTheta' : theta_decay - r * discounted_strike * n2,
+      'PutTheta'  : theta_decay + r * discounted_strike * (1 - n2),
+      'CallRho'   : discounted_strike * t * n2,
+      'PutRho'    : -discounted_strike * t * (1 - n2)
+    }
+
+def ImpliedVolatility(option_price : ArrayLike, underlying_price : ArrayLike, strike_price : ArrayLike, interest_rate : ArrayLike,
+                      time : ArrayLike, is_call : Union[bool, Sequence[bool], np.ndarray],
+                      tolerance = 1e-6, max_iterations = 100) -> np.ndarray:
+  """
+  Finds the volatility that makes the Black-Scholes value of every contract equal to its option_price.
+  All contracts are solved together with Newton's method. Any contract whose Newton step leaves the
+  range its volatility is known to be in is bisected instead, so every contract converges.
+  Arguments are the same as BlackScholes(). Returns the volatilities as decimals, with NaN wherever the
+  option price is outside the range any volatility could produce
+  """
+
+  price, s, x, r, t, is_call = np.broadcast_arrays(*[np.atleast_1d(np.asarray(arg, dtype=float)) for arg in [option_price, underlying_price, strike_price, interest_rate, time, is_call]])
+
+  with np.errstate(divide='ignore', invalid='ignore'):
+    # Puts are solved as calls using put-call parity
+    discounted_strike = x * np.exp(-r * t)
+    target = np.where(is_call.astype(bool), price, price + s - discounted_strike)
+
+    solvable = (target > np.maximum(s - discounted_strike, 0)) & (target < s) & (t > 0) & (x > 0)
+
+  low = np.full(target.shape, 1e-4)
+  high = np.full(target.shape, 10.0)
+  volatility = np.full(target.shape, 0.3)
+  active = solvable.copy()
+
+  for _ in range(max_iterations):
+    if not active.any():
+      break
+
+    call_value, vega = __call_value_and_vega(s[active], x[active], r[active], t[active], volatility[active])
+    difference = call_value - target[active]
+
+    converged = np.abs(difference) < tolerance
+
+    # The call value always rises with volatility, so the sign of the difference narrows the range
+    too_high = difference > 0
+    low[active] = np.where(too_high, low[active], volatility[active])
+    high[active] = np.where(too_high, volatility[active], high[active])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+      newton_step = volatility[active] - difference / vega
+
+    in_range = np.isfinite(newton_step) & (newton_step > low[active]) & (newton_step < high[active])
+    next_volatility = np.where(in_range, newton_step, (low[active] + high[active]) / 2)
+
+    volatility[active] = np.where(converged, volatility[active], next_volatility)
+
+    active_indices = np.flatnonzero(active)
+    active[active_indices[converged]] = False
+
+  volatility[~solvable] = np.nan
+  return volatility
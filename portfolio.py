@@ -0,0 +1,178 @@
+import re, numpy as np, datetime as dt
+
+from typing import *
+from pandas import Series
+
+# Most rows of the price matrix processed at once when valuing a portfolio
+CHUNK_ROW_COUNT = 2048
+
+def BuildPriceMatrix(price_history : Dict[str, Series], chunk_column_count = 64) -> Tuple[np.ndarray, List[str], np.ndarray]:
+  """
+  Aligns the price history of every symbol onto one trading calendar, which is every date that
+  any of the symbols traded on. Returns the calendar, the symbols, and a (date x symbol) matrix of prices.
+  A symbol's price carries forward over dates it did not trade and is NaN before its first trading day
+  """
+
+  symbols = list(price_history.keys())
+  dates = np.unique(np.concatenate([series.index.values.astype('datetime64[D]') for series in price_history.values()]))
+
+  prices = np.full((len(dates), len(symbols)), np.nan)
+
+  for (index, symbol) in enumerate(symbols, start=0):
+    series = price_history[symbol]
+    prices[np.searchsorted(dates, series.index.values.astype('datetime64[D]')), index] = series.values
+
+  # Carry prices forward a block of columns at a time so only a block sized index array exists at once
+  row_numbers = np.arange(len(dates))[:, np.newaxis]
+
+  for column_start in range(0, len(symbols), chunk_column_count):
+    block = prices[:, column_start:column_start + chunk_column_count]
+
+    last_traded_row = np.maximum.accumulate(np.where(np.isnan(block), 0, row_numbers), axis=0)
+    prices[:, column_start:column_start + chunk_column_count] = np.take_along_axis(block, last_traded_row, axis=0)
+
+  return dates, symbols, prices
+
+def ValidateSchedule(schedule : Optional[Union[str, float]]) -> None:
+  """
+  Raises a ValueError if the schedule is not None, a positive number of days or one of 'w', 'm', 'q' or 'y'
+  """
+
+  if schedule == None:
+    return
+
+  if isinstance(schedule, str):
+    if schedule.lower() not in ['w', 'm', 'q', 'y']:
+      raise ValueError(f"Unknown schedule '{schedule}'")
+  elif not np.isfinite(schedule) or schedule <= 0:
+    raise ValueError(f"A schedule must be a positive number of days, not {schedule}")
+
+def __get_scheduled_rows(dates : np.ndarray, schedule : Optional[Union[str, float]]) -> np.ndarray:
+  """
+  Finds the rows of the trading calendar that a schedule lands on. The schedule is either a number of days,
+  in which case the first trading day on or after every scheduled day is used, or 'w', 'm', 'q' or 'y'
+  for the first trading day of every week, month, quarter or year. A fractional number of days lands on
+  the day its multiples fall in (ex. 7.5 lands 7, 15, 22, 30... days in)
+  """
+
+  ValidateSchedule(schedule)
+
+  if schedule == None:
+    return np.array([], dtype=np.int64)
+
+  if isinstance(schedule, str):
+    schedule = schedule.lower()
+
+    if schedule in ['w', 'm', 'y']:
+      periods = dates.astype(f'datetime64[{schedule.upper()}]').astype(np.int64)
+    else:
+      periods = dates.astype('datetime64[M]').astype(np.int64) // 3
+
+    return np.flatnonzero(np.diff(periods) != 0) + 1
+
+  day_count = int((dates[-1] - dates[0]).astype('timedelta64[D]').astype(np.int64))
+  scheduled_offsets = np.unique(np.floor(np.arange(1, int(day_count / schedule) + 1) * schedule).astype(np.int64))
+  scheduled_days = dates[0].astype('datetime64[D]') + scheduled_offsets.astype('timedelta64[D]')
+
+  return np.unique(np.searchsorted(dates, scheduled_days))
+
+def BacktestPortfolio(dates : np.ndarray, symbols : List[str], prices : np.ndarray, weights : Dict[str, float],
+                      principal : float, periodic_investment = 0.0, period : Optional[float] = None,
+                      rebalance : Optional[Union[str, float]] = None) -> Dict[str, Any]:
+  """
+  This function backtests a portfolio of the symbols in a price matrix from BuildPriceMatrix().
+  Args:
+    weights               - target share of the portfolio for each symbol, normalized to add up to 1
+    principal             - money invested across the symbols on the first day
+    periodic_investment   - money added every period days (negative to withdraw). A withdrawal is capped at the
+                            portfolio's value and sells every holding by the same share
+    period                - days between each periodic investment (may be fractional), None for no periodic investments
+    rebalance             - schedule (see __get_scheduled_rows()) to sell and rebuy the symbols back to
+                            their target weights, None to let the weights drift
+  Until a symbol starts trading, its weight is shared by the symbols that are trading.
+  Returns the results of the backtest along with the portfolio value on every trading day. Yearly Return is
+  the profit made per dollar spent per year, the same measure DCA backtests are rated on
+  """
+
+  target_weights = np.array([weights.get(symbol, 0.0) for symbol in symbols], dtype=float)
+  target_weights /= target_weights.sum()
+
+  investment_rows = __get_scheduled_rows(dates, period) if period != None else np.array([], dtype=np.int64)
+  rebalance_rows = __get_scheduled_rows(dates, rebalance)
+
+  # The holdings only change on these rows, so they are all that needs to be walked through
+  event_rows = np.union1d(np.union1d(investment_rows, rebalance_rows), [0])
+  is_investment_row = np.isin(event_rows, investment_rows)
+  is_rebalance_row = np.isin(event_rows, rebalance_rows)
+
+  holdings = np.zeros((len(event_rows), len(symbols)))
+  current_holdings = np.zeros(len(symbols))
+  money_spent = 0.0
+
+  for (index, row) in enumerate(event_rows, start=0):
+    row_prices = prices[row]
+    is_trading = ~np.isnan(row_prices)
+
+    # Only buy symbols that have started trading
+    row_weights = np.where(is_trading, target_weights, 0.0)
+    row_weights /= row_weights.sum() if row_weights.sum() > 0 else 1
+
+    if index == 0:
+      cash_flow = principal
+    else:
+      cash_flow = periodic_investment if is_investment_row[index] else 0.0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+      holdings_value = np.nansum(current_holdings * row_prices)
+
+      # Nothing more than the portfolio is worth can be withdrawn
+      cash_flow = max(cash_flow, -holdings_value)
+
+      if index == 0 or is_rebalance_row[index]:
+        current_holdings = np.where(is_trading, (holdings_value + cash_flow) * row_weights / row_prices, 0.0)
+      elif cash_flow < 0:
+        current_holdings = current_holdings * (1 + cash_flow / holdings_value)
+      else:
+        current_holdings = current_holdings + np.where(is_trading, cash_flow * row_weights / row_prices, 0.0)
+
+    money_spent += cash_flow
+    holdings[index] = current_holdings
+
+  # Value every day against the holdings of the last event on or before it, in chunks of rows
+  values = np.empty(len(dates))
+  row_events = np.searchsorted(event_rows, np.arange(len(dates)), side='right') - 1
+
+  for row_start in range(0, len(dates), CHUNK_ROW_COUNT):
+    row_stop = row_start + CHUNK_ROW_COUNT
+    values[row_start:row_stop] = np.einsum('ij,ij->i', np.nan_to_num(prices[row_start:row_stop]), holdings[row_events[row_start:row_stop]])
+
+  start_date = dates[0].astype(dt.date)
+  end_date = dates[-1].astype(dt.date)
+  investing_years = round((end_date - start_date).days / 365, 2)
+
+  market_value = values[-1]
+  yearly_return = (market_value - money_spent) / money_spent / investing_years if investing_years > 0 and money_spent > 0 else None
+
+  return {
+    'Start Date' : start_date,
+    'End Date' : end_date,
+    'Investing Years' : investing_years,
+    'Money Spent' : money_spent,
+    'Market Value' : market_value,
+    'Net Profit' : market_value - money_spent,
+    'Yearly Return' : yearly_return,
+    'Holdings' : dict(zip(symbols, holdings[-1])),
+    'Daily Values' : values
+  }
+
+def ParseWeights(weights_arg : str) -> Dict[str, float]:
+  """
+  Converts a string of symbols and weights (ex. 'MSFT:2,AAPL:1,SPY') to a dictionary. Symbols without a weight get a weight of 1
+  """
+
+  weights = {}
+
+  for (symbol, weight) in re.findall(r'([^,:]+)(?::([\d.]+))?', weights_arg):
+    weights[symbol.upper()] = float(weight) if weight else 1.0
+
+  return weights
@@ -0,0 +1,104 @@
+import os, re, tempfile, numpy as np, datetime as dt
+
+from typing import *
+
+from pandas import DataFrame, DatetimeIndex, concat
+
+
+class PriceStore:
+  """
+  The PriceStore class keeps the daily trading data (OHLCV) of every symbol on disk. Each symbol
+  is saved in its own NumPy file so reads can be memory-mapped instead of downloaded or parsed again.
+  """
+
+  __columns = ['High', 'Low', 'Open', 'Close', 'Volume', 'Adj Close']
+  __dtype = np.dtype([('Date', 'datetime64[D]')] + [(col_name, 'f8') for col_name in __columns])
+
+  def __init__(self, directory_path : str):
+    os.makedirs(directory_path, exist_ok=True)
+    self.__directory_path = directory_path
+
+  def __get_file_path(self, symbol : str) -> str:
+    """
+    Finds the file that the symbol's trading data is saved in
+    """
+
+    file_name = re.sub(r'[^\w.\-^]', '_', symbol.upper())
+    return os.path.join(self.__directory_path, f'{file_name}.npy')
+
+  def __load(self, symbol : str) -> Optional[np.ndarray]:
+    """
+    Memory-maps the symbol's trading data. Returns None if nothing is stored for the symbol
+    """
+
+    try:
+      return np.load(self.__get_file_path(symbol), mmap_mode='r')
+    except (FileNotFoundError, ValueError):
+      return None
+
+  def GetLastDate(self, symbol : str) -> Optional[dt.datetime]:
+    """
+    Returns the date of the most recent trading day stored for the symbol
+    """
+
+    data = self.__load(symbol)
+
+    if data is None or len(data) == 0:
+      return None
+
+    return dt.datetime.combine(data['Date'][-1].astype(dt.date), dt.time())
+
+  def GetLastWriteTime(self, symbol : str) -> Optional[dt.datetime]:
+    """
+    Returns when the symbol's trading data was last written (in UTC), or None if nothing is stored for the symbol
+    """
+
+    try:
+      return dt.datetime.fromtimestamp(os.path.getmtime(self.__get_file_path(symbol)), dt.timezone.utc)
+    except FileNotFoundError:
+      return None
+
+  def Read(self, symbol : str) -> Optional[DataFrame]:
+    """
+    Returns all trading data stored for the symbol in the same format that pandas_datareader uses
+    """
+
+    data = self.__load(symbol)
+
+    if data is None:
+      return None
+
+    return DataFrame({col_name : data[col_name] for col_name in self.__columns},
+                     index=DatetimeIndex(data['Date'], name='Date'))
+
+  def Write(self, symbol : str, df : DataFrame) -> None:
+    """
+    Replaces the trading data stored for the symbol with the DataFrame's contents
+    """
+
+    data = np.empty(len(df.index), dtype=self.__dtype)
+    data['Date'] = df.index.values.astype('datetime64[D]')
+
+    for col_name in self.__columns:
+      data[col_name] = df[col_name].values
+
+    # Write to a temporary file first so a reader never sees a half written file
+    file_descriptor, temp_path = tempfile.mkstemp(dir=self.__directory_path, suffix='.npy')
+
+    with os.fdopen(file_descriptor, mode='wb') as temp_file:
+      np.save(temp_file, data)
+
+    os.replace(temp_path, self.__get_file_path(symbol))
+
+  def Append(self, symbol : str, df : DataFrame) -> None:
+    """
+    Adds newer trading days to the symbol's stored data. Days that are already stored are
+    overwritten by the values in df
+    """
+
+    stored_df = self.Read(symbol)
+
+    if stored_df is not None:
+      df = concat([stored_df[~stored_df.index.isin(df.index)], df[self.__columns]]).sort_index()
+
+    self.Write(symbol, df)
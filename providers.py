@@ -0,0 +1,202 @@
+import enum, time, asyncio, threading, contextlib, metrics, datetime as dt
+
+from typing import *
+from email.utils import parsedate_to_datetime
+
+
+class Provider(enum.Enum):
+  Yahoo = 'yahoo'
+  Nasdaq = 'nasdaq'
+  TDAmeritrade = 'td_ameritrade'
+  AlphaVantage = 'alpha_vantage'
+
+class TokenBucket:
+  """
+  The TokenBucket class hands out one token per request at a steady rate, and lets up to burst tokens
+  build up while nothing is requested. Callers that arrive when the bucket is empty reserve the next
+  token and sleep exactly until it is theirs, so requests go out at the rate limit and never faster.
+  It is safe to share between threads and asyncio tasks, but not between processes, which each get their
+  own copy. Requests to a provider should all be sent from one process (see analyze.BacktestSweep())
+  """
+
+  def __init__(self, requests_per_minute : float, burst : int):
+    self.__rate = requests_per_minute / 60
+    self.__capacity = burst
+    self.__tokens = float(burst)
+    self.__last_refill = time.monotonic()
+    self.__paused_until = 0.0
+    self.__lock = threading.Lock()
+
+  def __reserve(self) -> float:
+    """
+    Takes a token, borrowing against future tokens if none are left. Returns how many seconds
+    until the borrowed token would have been added to the bucket
+    """
+
+    with self.__lock:
+      now = time.monotonic()
+      self.__tokens = min(self.__capacity, self.__tokens + (now - self.__last_refill) * self.__rate)
+      self.__last_refill = now
+
+      self.__tokens -= 1
+      return max(0.0, -self.__tokens / self.__rate)
+
+  def __get_pause_time(self) -> float:
+    """
+    Seconds left until the bucket is no longer paused
+    """
+
+    with self.__lock:
+      return max(0.0, self.__paused_until - time.monotonic())
+
+  def Acquire(self) -> None:
+    wait_time = self.__reserve()
+
+    if wait_time > 0:
+      time.sleep(wait_time)
+
+    # A token taken before a pause started is held until the pause is over, however many times it is extended
+    pause_time = self.__get_pause_time()
+
+    while pause_time > 0:
+      time.sleep(pause_time)
+      pause_time = self.__get_pause_time()
+
+  async def AcquireAsync(self) -> None:
+    wait_time = self.__reserve()
+
+    if wait_time > 0:
+      await asyncio.sleep(wait_time)
+
+    pause_time = self.__get_pause_time()
+
+    while pause_time > 0:
+      await asyncio.sleep(pause_time)
+      pause_time = self.__get_pause_time()
+
+  def Pause(self, seconds : float) -> None:
+    """
+    Empties the bucket so no token is handed out for the next number of seconds, and holds back callers
+    that already have one until then. Used when the provider says it is being sent too many requests
+    """
+
+    with self.__lock:
+      self.__tokens = min(self.__tokens, -seconds * self.__rate)
+      self.__paused_until = max(self.__paused_until, time.monotonic() + seconds)
+
+# Most requests that may be waiting on each provider at the same time
+DEFAULT_CONCURRENCY_LIMITS = {
+  Provider.Yahoo : 8,
+  Provider.Nasdaq : 4,
+  Provider.TDAmeritrade : 4,
+  Provider.AlphaVantage : 1
+}
+
+# (requests per minute, burst) that each provider allows
+DEFAULT_RATE_LIMITS = {
+  Provider.Yahoo : (300, 10),
+  Provider.Nasdaq : (300, 10),
+  Provider.TDAmeritrade : (120, 10),
+  Provider.AlphaVantage : (5, 5)
+}
+
+__concurrency_semaphores = {provider : threading.BoundedSemaphore(limit) for (provider, limit) in DEFAULT_CONCURRENCY_LIMITS.items()}
+__token_buckets = {provider : TokenBucket(*limits) for (provider, limits) in DEFAULT_RATE_LIMITS.items()}
+
+def SetConcurrencyLimit(provider : Provider, limit : int) -> None:
+  """
+  Changes how many requests may be waiting on the provider at once. Requests already
+  in flight are not affected
+  """
+
+  if limit < 1:
+    raise ValueError("Concurrency limit must be at least 1")
+
+  __concurrency_semaphores[provider] = threading.BoundedSemaphore(limit)
+
+def SetRateLimit(provider : Provider, requests_per_minute : float, burst : int) -> None:
+  """
+  Changes how many requests per minute may be sent to the provider, and how many may be sent at once after it has been idle
+  """
+
+  if requests_per_minute <= 0 or burst < 1:
+    raise ValueError("Rate limit and burst must be positive")
+
+  __token_buckets[provider] = TokenBucket(requests_per_minute, burst)
+
+def PauseProvider(provider : Provider, seconds : float) -> None:
+  """
+  Holds back every request to the provider for a number of seconds (ex. after an HTTP 429 response)
+  """
+
+  __token_buckets[provider].Pause(seconds)
+
+def ParseRetryAfter(retry_after : Optional[str], default = 60.0) -> float:
+  """
+  Converts a Retry-After header, which is either a number of seconds or an HTTP date, to a number of seconds from now.
+  Returns default if there is no header or it cannot be read
+  """
+
+  if retry_after == None:
+    return default
+
+  try:
+    return max(0.0, float(retry_after))
+  except ValueError:
+    pass
+
+  try:
+    retry_time = parsedate_to_datetime(retry_after)
+  except (TypeError, ValueError):
+    return default
+
+  # Dates without a time zone are in UTC, like every HTTP date should be
+  if retry_time.tzinfo == None:
+    retry_time = retry_time.replace(tzinfo=dt.timezone.utc)
+
+  return max(0.0, (retry_time - dt.datetime.now(dt.timezone.utc)).total_seconds())
+
+def PauseIfRateLimited(provider : Provider, response : Any) -> bool:
+  """
+  Pauses the provider for as long as its response's Retry-After header asks if it is an HTTP 429 response,
+  so the other requests waiting on the provider are not refused too. Returns whether it was
+  """
+
+  if response.status_code != 429:
+    return False
+
+  metrics.IncrementCounter(f'provider.{provider.value}.rate_limited')
+  PauseProvider(provider, ParseRetryAfter(response.headers.get('Retry-After')))
+
+  return True
+
+@contextlib.contextmanager
+def Throttle(provider : Provider) -> Iterator[None]:
+  """
+  Wrap every request to a provider with this so the provider's concurrency and rate limits are respected.
+  The time spent waiting on the limits and on the request itself are recorded in the provider's metrics
+  """
+
+  semaphore = __concurrency_semaphores[provider]
+  wait_start = time.perf_counter()
+
+  with semaphore:
+    __token_buckets[provider].Acquire()
+    metrics.ObserveLatency(f'provider.{provider.value}.wait', time.perf_counter() - wait_start)
+
+    with metrics.Timer(f'provider.{provider.value}.request'):
+      yield
+
+@contextlib.asynccontextmanager
+async def ThrottleAsync(provider : Provider) -> AsyncIterator[None]:
+  """
+  Same as Throttle() for asyncio tasks. Only the rate limit is applied, since tasks on one event loop
+  do not run requests in parallel unless they are gathered, in which case the caller caps how many
+  """
+
+  wait_start = time.perf_counter()
+  await __token_buckets[provider].AcquireAsync()
+  metrics.ObserveLatency(f'provider.{provider.value}.wait', time.perf_counter() - wait_start)
+
+  with metrics.Timer(f'provider.{provider.value}.request'):
+    yield
@@ -1,98 +1,256 @@
-import enum, locale, re, requests, math, scipy.stats, sqlite3, json as js, datetime as dt
+import enum, locale, re, requests, math, itertools, sqlite3, threading, metrics, numpy as np, json as js, datetime as dt
 
 from typing import *
-from dateutil import relativedelta
+from dateutil import relativedelta, tz
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from pandas import read_sql, DataFrame
+from pandas import read_sql, DataFrame, Timestamp
+from pandas.tseries.holiday import (AbstractHolidayCalendar, Holiday, GoodFriday, USMartinLutherKingJr, USPresidentsDay, USMemorialDay,
+                                    USLaborDay, USThanksgivingDay, nearest_workday, sunday_to_monday)
 from pandas_datareader import DataReader, _utils
 
+from price_store import PriceStore
+from option_pricing import BlackScholes, ImpliedVolatility
+from providers import Provider
+from http_cache import CachedSession, GetSession
+from db_migrations import Migrate, RefillLeaderboards
+
+try:
+  import orjson
+except ImportError: # Option chains are parsed with the standard library's slower json module instead
+  orjson = None
+
 
 class SecurityType(enum.Enum):
   Equity = 0 
   Option = 1
   EquityListing = 2
+  Backtest = 3
+
+class Record:
+  """
+  The Record class is the base of every security class. A record's values are kept in a single list
+  in the order of the class's _properties, which are the columns of its table, and each property can
+  be read and set as an attribute (use getattr() for names like '1D'). Properties that were never given
+  a value raise AttributeError and are left out of to_dict(), so the database fills them in (ex. LastUpdated)
+  """
+
+  __slots__ = ('_values',)
+  __unset = object()
+
+  _properties : Tuple[str, ...] = ()
+
+  def __init_subclass__(cls, **kwargs):
+    super().__init_subclass__(**kwargs)
+
+    cls._property_indices = {name : index for (index, name) in enumerate(cls._properties, start=0)}
 
-class EquityListing:
-  __properties = ['Symbol', 'CompanyName']
+    for (index, name) in enumerate(cls._properties, start=0):
+      setattr(cls, name, property(Record.__getter(index, name), Record.__setter(index)))
+
+  @staticmethod
+  def __getter(index : int, name : str) -> Callable[['Record'], Any]:
+    def get_value(record : 'Record') -> Any:
+      value = record._values[index]
+
+      if value is Record.__unset:
+        raise AttributeError(f"'{type(record).__name__}' has no value for '{name}'")
+      return value
+
+    return get_value
+
+  @staticmethod
+  def __setter(index : int) -> Callable[['Record', Any], None]:
+    def set_value(record : 'Record', value : Any) -> None:
+      record._values[index] = value
+
+    return set_value
 
   def __init__(self, *args, **kwargs):
-    if len(args) > 0:
-      self.__dict__ = {self.__properties[index] : arg for (index, arg) in enumerate(args, start=0)}
-    else:
-      self.__dict__ = kwargs
+    values = list(args) + [Record.__unset] * (len(self._properties) - len(args))
+
+    for (name, value) in kwargs.items():
+      values[self._property_indices[name]] = value
+
+    self._values = values
+
+  @classmethod
+  def FromRow(cls, row : Sequence[Any]) -> 'Record':
+    """
+    Creates a record from a database row whose columns are in the order of _properties
+    """
+
+    record = cls.__new__(cls)
+    record._values = list(row)
+
+    return record
+
+  def to_dict(self) -> Dict[str, Any]:
+    return {name : value for (name, value) in zip(self._properties, self._values) if value is not Record.__unset}
+
+  def __repr__(self) -> str:
+    return f"{type(self).__name__}({self.to_dict()})"
+
+  # Pickled records (ex. backtests sent back from worker processes) keep which properties were never given a value
+  def __getstate__(self) -> Dict[str, Any]:
+    return self.to_dict()
+
+  def __setstate__(self, state : Dict[str, Any]) -> None:
+    Record.__init__(self, **state)
+
+class EquityListing(Record):
+  _properties = ('Symbol', 'CompanyName', 'Delisted')
+
+  __slots__ = ()
+
+  # Connections kept open to NASDAQ while scraping
+  SCRAPE_POOL_SIZE = 8
+
+  @staticmethod
+  def __create_session(pool_size : int) -> requests.Session:
+    """
+    Creates an HTTP session that keeps up to pool_size connections open, so pages
+    fetched at the same time do not each make a new connection
+    """
+
+    # We use this header for HTTP requests to NASDAQ because they do not
+    # allow automated HTTP requests. This header will simulate a real user
+    # accessing their API.
+    fake_header = { 
+      'user-agent' : 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_4) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/81.0.4044.138 Safari/537.36'
+    }
+
+    session = CachedSession(Provider.Nasdaq)
+    session.headers.update(fake_header)
+
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+
+    return session
+
+  @staticmethod
+  def __get_json(session : requests.Session, url : str) -> Any:
+    # The session throttles the requests to NASDAQ
+    return js.loads(session.get(url).text)
+
+  @staticmethod
+  def __scrape_pages(session : requests.Session, executor : ThreadPoolExecutor, page_urls : List[str],
+                     parse_func : Callable[[Any], List['EquityListing']],
+                     page_done_func : Callable[[], None]) -> List['EquityListing']:
+    """
+    Downloads every page at once on the executor and parses them. The listings are returned in page order
+    """
+
+    page_futures = {executor.submit(EquityListing.__get_json, session, url) : index for (index, url) in enumerate(page_urls, start=0)}
+    pages = [None] * len(page_urls)
+
+    for future in as_completed(page_futures):
+      pages[page_futures[future]] = parse_func(future.result())
+      page_done_func()
+
+    return list(itertools.chain.from_iterable(pages))
 
   @staticmethod
   def GetListedEquities(status_func : Optional[Callable[[str], None]] = None,
                         progress_func : Optional[Callable[[int, int, dt.datetime], None]] = None) -> List['EquityListing']:
     """
-    This function will use the NASDAQ API to retrieve data on stocks and ETFs
+    This function will use the NASDAQ API to retrieve data on stocks and ETFs. Stocks and ETFs
+    are scraped at the same time, and all pages of each are downloaded at once over pooled connections
     """
-    all_equities = []
     
     page_size = 200
     stocks_url = 'https://www.nasdaq.com/api/v1/screener?page={}&pageSize={}'
     etfs_url = 'https://api.nasdaq.com/api/screener/etf?offset={}'
-    
-    # We use this variable for HTTP requests to NASDAQ because they do not
-    # allow automated HTTP requests. This header will simulate a real user
-    # accessing their API.
-    fake_header = { 
-      'user-agent' : 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_4) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/81.0.4044.138 Safari/537.36'
-    }
 
-    # --- SECTION: Get basic info for stocks ---i
+    session = EquityListing.__create_session(EquityListing.SCRAPE_POOL_SIZE)
+
     if status_func:
-      status_func("Scraping web for listed stocks")
+      status_func("Scraping web for listed stocks and ETFs")
     start_time = dt.datetime.now()
 
-    # Retrieve the total count of pages to access
-    first_page_text = requests.get(stocks_url.format(1, 1), headers=fake_header).text
-    total_page_count = int(js.loads(first_page_text)['count'] / page_size + 0.9)
+    # Pages of both kinds count toward the progress bar as soon as their page count is known
+    progress_lock = threading.Lock()
+    progress = { 'done' : 0, 'total' : 0 }
 
-    for page_index in range(1, total_page_count):
-      # Download JSON file from NASDAQ
-      current_page_text = requests.get(stocks_url.format(page_index, page_size), headers=fake_header).text
-      current_page_json = js.loads(current_page_text)
+    def add_pages(page_count : int) -> None:
+      with progress_lock:
+        progress['total'] += page_count
 
-      # Add all stocks into all_securities
-      all_equities.extend([EquityListing(stock['ticker'], stock['company']) for stock in current_page_json['data']])
+    def page_done() -> None:
+      with progress_lock:
+        progress['done'] += 1
 
-      if progress_func:
-        progress_func(page_index, total_page_count - 1, start_time)
-    # --- END SECTION ---
+        if progress_func:
+          progress_func(progress['done'], progress['total'], start_time)
 
-    # --- SECTION: Get basic info for etfs ---
-    if status_func:
-      status_func("Scraping web for listed ETFs")
-    start_time = dt.datetime.now()
+    # --- SECTION: Get basic info for stocks ---
+    def scrape_stocks(executor : ThreadPoolExecutor) -> List['EquityListing']:
+      # Retrieve the total count of pages to access
+      first_page_json = EquityListing.__get_json(session, stocks_url.format(1, 1))
+      total_page_count = int(first_page_json['count'] / page_size + 0.9)
+
+      page_urls = [stocks_url.format(page_index, page_size) for page_index in range(1, total_page_count)]
+      add_pages(len(page_urls))
 
-    # Retrieve the total count of pages to access
-    first_page_text = requests.get(etfs_url.format(0), headers=fake_header).text
-    total_page_count = int(js.loads(first_page_text)['data']['records']['totalrecords'] / 50 + 0.9)
+      return EquityListing.__scrape_pages(session, executor, page_urls,
+        lambda page_json: [EquityListing(stock['ticker'], stock['company']) for stock in page_json['data']], page_done)
+    # --- END SECTION ---
 
-    for page_index in range(1, total_page_count):
-      # Download JSON file from NASDAQ
-      current_page_text = requests.get(etfs_url.format((page_index - 1) * 50), headers=fake_header).text
-      current_page_json = js.loads(current_page_text)
+    # --- SECTION: Get basic info for etfs ---
+    def scrape_etfs(executor : ThreadPoolExecutor) -> List['EquityListing']:
+      # Retrieve the total count of pages to access
+      first_page_json = EquityListing.__get_json(session, etfs_url.format(0))
+      total_page_count = int(first_page_json['data']['records']['totalrecords'] / 50 + 0.9)
 
-      # Add all ETFs into all_securities
-      all_equities.extend([EquityListing(etf['symbol'], etf['companyName'] if etf['companyName'] != None else "N/A") for etf in current_page_json['data']['records']['data']['rows']])
+      page_urls = [etfs_url.format((page_index - 1) * 50) for page_index in range(1, total_page_count)]
+      add_pages(len(page_urls))
 
-      if progress_func:
-        progress_func(page_index, total_page_count - 1, start_time)
+      return EquityListing.__scrape_pages(session, executor, page_urls,
+        lambda page_json: [EquityListing(etf['symbol'], etf['companyName'] if etf['companyName'] != None else "N/A") for etf in page_json['data']['records']['data']['rows']], page_done)
     # --- END SECTION --- 
-    
-    return all_equities
-
 
-class Equity:
-  __properties = ['Symbol', 'CompanyName', '1D', '1W', '1M', '3M', '1Y', '5Y', '10Y', 'Max', 'LastUpdated']
+    # The page downloads share one pool, the two scrapers only wait on them
+    with session, ThreadPoolExecutor(max_workers=EquityListing.SCRAPE_POOL_SIZE) as page_executor, ThreadPoolExecutor(max_workers=2) as scrape_executor:
+      stocks_future = scrape_executor.submit(scrape_stocks, page_executor)
+      etfs_future = scrape_executor.submit(scrape_etfs, page_executor)
+
+      return stocks_future.result() + etfs_future.result()
+
+
+class MarketHolidayCalendar(AbstractHolidayCalendar):
+  """
+  The weekdays the US stock market is closed on. Closings for one-off events are not included
+  """
+
+  rules = [
+    Holiday('New Years Day', month=1, day=1, observance=sunday_to_monday),
+    USMartinLutherKingJr,
+    USPresidentsDay,
+    GoodFriday,
+    USMemorialDay,
+    Holiday('Juneteenth', month=6, day=19, start_date='2022-06-19', observance=nearest_workday),
+    Holiday('Independence Day', month=7, day=4, observance=nearest_workday),
+    USLaborDay,
+    USThanksgivingDay,
+    Holiday('Christmas', month=12, day=25, observance=nearest_workday)
+  ]
+
+class Equity(Record):
+  _properties = ('Symbol', 'CompanyName', '1D', '1W', '1M', '3M', '1Y', '5Y', '10Y', 'Max', 'LastUpdated')
+
+  # When set, trading data is read from this store and only the days missing from it are downloaded
+  price_store : Optional[PriceStore] = None
+
+  # A day's trading data from Yahoo is final once the market has closed
+  MARKET_TIME_ZONE = tz.gettz('America/New_York')
+  MARKET_OPEN_TIME = dt.time(9, 30)
+  MARKET_CLOSE_TIME = dt.time(16, 0)
+
+  # Relative difference between a stored price and the same price downloaded again past which Yahoo
+  # is taken to have adjusted the history again (ex. for a split or dividend)
+  ADJUSTMENT_TOLERANCE = 1e-5
   
-  def __init__(self, *args, **kwargs):
-    if len(args) > 0:
-      self.__dict__ = {self.__properties[index] : arg for (index, arg) in enumerate(args, start=0)}
-    else:
-      self.__dict__ = kwargs
+  __slots__ = ()
 
   @staticmethod
   def __time_range_to_date(time_range : str) -> dt.datetime:
@@ -112,21 +270,16 @@ class Equity:
     elif period == 'y': return dt.datetime.now() + relativedelta.relativedelta(years=-multiplier)
 
   @staticmethod
-  def GetHistoricalData(symbol : str, time_range : str) -> Optional[DataFrame]: 
+  def __download_historical_data(symbol : str, start_date : dt.datetime, end_date : dt.datetime) -> Optional[DataFrame]:
+    """
+    Downloads the raw trading data for the symbol from Yahoo. Returns None if Yahoo has no data for it
     """
-    This function will retrieve historical trading data for the symbol and over the time 
-    range specified in a pandas DataFrame object. Returns None if the data is not retrievable
-    """ 
-
-    time_format = "%Y-%m-%d"
-    start_date = Equity.__time_range_to_date(time_range)
-    end_date = dt.datetime.now()
 
     symbol_could_not_be_fixed = False
     while True:
       try:
-        df = DataReader(symbol, data_source='yahoo', start=start_date, end=end_date)
-        break
+        # The Yahoo session throttles every request the reader makes, including its retries
+        return DataReader(symbol, data_source='yahoo', start=start_date, end=end_date, session=GetSession(Provider.Yahoo))
       except KeyError: # Yahoo does not recognize the inputted equity symbol
         if symbol_could_not_be_fixed:
           return None
@@ -138,146 +291,374 @@ class Equity:
       except ConnectionError: # Most likely just a timeout. Retry the request
         continue
 
+  @staticmethod
+  def __is_final(day : dt.datetime, written_time : Optional[dt.datetime]) -> bool:
+    """
+    Checks whether trading data written at written_time had the day's final prices, which is once the market closed that day.
+    Downloads that end on the current day are never answered from the response cache (see http_cache.DAILY_PRICE_PATTERNS),
+    so the data was downloaded right before it was written
+    """
+
+    if written_time == None:
+      return False
+
+    return written_time >= dt.datetime.combine(day.date(), Equity.MARKET_CLOSE_TIME, tzinfo=Equity.MARKET_TIME_ZONE)
+
+  @staticmethod
+  def GetLastSessionDate(now : Optional[dt.datetime] = None) -> dt.date:
+    """
+    Finds the most recent trading day whose session has opened, which is the last day Yahoo can have trading data for.
+    On weekends and market holidays it is the trading day before, and before the market opens it is the previous trading day
+    """
+
+    now = dt.datetime.now(Equity.MARKET_TIME_ZONE) if now == None else now.astimezone(Equity.MARKET_TIME_ZONE)
+    session_date = now.date() if now.time() >= Equity.MARKET_OPEN_TIME else now.date() - dt.timedelta(days=1)
+
+    # No stretch of days without trading is longer than a long weekend
+    holidays = set(MarketHolidayCalendar().holidays(session_date - dt.timedelta(days=7), session_date).date)
+
+    while session_date.weekday() >= 5 or session_date in holidays:
+      session_date -= dt.timedelta(days=1)
+
+    return session_date
+
+  @staticmethod
+  def __update_stored_data(symbol : str, stored_df : DataFrame, last_day_is_final : bool, end_date : dt.datetime) -> None:
+    """
+    Downloads the days after the symbol's stored trading data along with its last two stored days. Yahoo adjusts the
+    whole history for splits and dividends, so if the prices of a stored day that was final have changed, the full
+    history is downloaded again instead of adding the new days to prices that were adjusted the old way
+    """
+
+    overlap_start_date = stored_df.index[max(len(stored_df.index) - 2, 0)].to_pydatetime()
+    new_df = Equity.__download_historical_data(symbol, overlap_start_date, end_date)
+
+    if type(new_df) != DataFrame or len(new_df.index) == 0:
+      return
+
+    final_df = stored_df if last_day_is_final else stored_df.iloc[:-1]
+    overlap_dates = final_df.index.intersection(new_df.index)
+    compared_columns = ['Close', 'Adj Close']
+
+    if np.allclose(final_df.loc[overlap_dates, compared_columns].values, new_df.loc[overlap_dates, compared_columns].values,
+                   rtol=Equity.ADJUSTMENT_TOLERANCE, atol=0, equal_nan=True):
+      Equity.price_store.Append(symbol, new_df)
+      return
+
+    metrics.IncrementCounter('price_store.readjusted')
+    full_df = Equity.__download_historical_data(symbol, dt.datetime(1900,1,1), end_date)
+
+    if type(full_df) == DataFrame:
+      Equity.price_store.Write(symbol, full_df)
+
+  @staticmethod
+  def __get_trading_data(symbol : str, start_date : dt.datetime, end_date : dt.datetime) -> Optional[DataFrame]:
+    """
+    Retrieves the trading data for the symbol between the dates. If a price store is in use, the
+    symbol's full history is downloaded the first time and only the newer days after that
+    """
+
+    if Equity.price_store == None:
+      return Equity.__download_historical_data(symbol, start_date, end_date)
+
+    stored_df = Equity.price_store.Read(symbol)
+
+    if stored_df is None or len(stored_df.index) == 0:
+      df = Equity.__download_historical_data(symbol, dt.datetime(1900,1,1), end_date)
+
+      if type(df) != DataFrame:
+        return None
+
+      Equity.price_store.Write(symbol, df)
+
+    else:
+      last_stored_date = stored_df.index[-1].to_pydatetime()
+      last_day_is_final = Equity.__is_final(last_stored_date, Equity.price_store.GetLastWriteTime(symbol))
+
+      # The last stored day is downloaded again until it has been stored after the market closed. Nothing is downloaded
+      # when the last session is stored and final, such as on weekends and market holidays
+      if last_stored_date.date() < Equity.GetLastSessionDate() or not last_day_is_final:
+        Equity.__update_stored_data(symbol, stored_df, last_day_is_final, end_date)
+
+    return Equity.price_store.Read(symbol).loc[start_date.strftime("%Y-%m-%d"):]
+
+  @staticmethod
+  def __covers_time_range(df : DataFrame, start_date : dt.datetime, end_date : dt.datetime) -> bool:
+    """
+    Checks that the first or last trading day in the DataFrame lines up with the requested time range
+    """
+
+    time_format = "%Y-%m-%d"
+
+    if len(df.index) == 0:
+      return False
+
     start_dates_match = abs((dt.datetime.strptime(df.index[0]._date_repr, time_format)  - start_date).days) < 5
     end_dates_match   = abs((dt.datetime.strptime(df.index[-1]._date_repr, time_format) - end_date).days) < 5
 
-    if not(start_dates_match or end_dates_match):
+    return start_dates_match or end_dates_match
+
+  @staticmethod
+  def GetHistoricalData(symbol : str, time_range : str) -> Optional[DataFrame]: 
+    """
+    This function will retrieve historical trading data for the symbol and over the time 
+    range specified in a pandas DataFrame object. Returns None if the data is not retrievable
+    """ 
+
+    start_date = Equity.__time_range_to_date(time_range)
+    end_date = dt.datetime.now()
+
+    df = Equity.__get_trading_data(symbol, start_date, end_date)
+
+    if type(df) != DataFrame or not Equity.__covers_time_range(df, start_date, end_date):
       return None
     
     return df
 
   @staticmethod
-  def GetPercentChangeOverTimeRanges(symbol : str, time_ranges : List[str]) -> List[dict]:
+  def GetHistoricalDataOverTimeRanges(symbol : str, time_ranges : List[str]) -> List[Optional[DataFrame]]:
+    """
+    This function will download the trading data for the longest of the time ranges once, then slice
+    out every time range from it. Each slice is validated the same way GetHistoricalData() validates
+    a download, so an entry is None wherever GetHistoricalData() would have returned None
+    """
+
+    time_format = "%Y-%m-%d"
+    end_date = dt.datetime.now()
+    start_dates = [Equity.__time_range_to_date(time_range) for time_range in time_ranges]
+
+    df = Equity.__get_trading_data(symbol, min(start_dates), end_date)
+
+    if type(df) != DataFrame:
+      return [None] * len(time_ranges)
+
+    historical_data = []
+    for start_date in start_dates:
+      time_range_df = df.loc[start_date.strftime(time_format):]
+
+      if Equity.__covers_time_range(time_range_df, start_date, end_date):
+        historical_data.append(time_range_df)
+      else:
+        historical_data.append(None)
+
+    return historical_data
+
+  @staticmethod
+  def GetPercentChangeOverTimeRanges(symbol : str, time_ranges : List[str], single_fetch = True) -> List[dict]:
     """
     This function will get the percent change of equity share price
-    of a set of different time ranges.
+    of a set of different time ranges. With single_fetch, the trading data is
+    downloaded once and sliced for every time range instead of once per time range.
+    Time ranges without trading data have a percent change of None
     """
     
     def get_percent_change(pd_dataframe):
       """
       This will calculate the percent change of a share over some time frame by reading DataFrame values
       """
-      time_format = "%Y-%m-%d"
 
       open_val = pd_dataframe.iloc[0]['Open']
       close_val = pd_dataframe.iloc[-1]['Adj Close']
 
       if open_val == 0:
-        return "N/A"
+        return None
       else:
         return round((close_val - open_val) / open_val * 100, 2)
 
-    symbol_requires_formatting = False
+    if single_fetch:
+      historical_data_sets = Equity.GetHistoricalDataOverTimeRanges(symbol, time_ranges)
+    else:
+      historical_data_sets = [Equity.GetHistoricalData(symbol, time_range) for time_range in time_ranges]
+
     percent_changes = []
 
-    for time_range in time_ranges:
-      historical_data = Equity.GetHistoricalData(symbol, time_range)
-    
+    for historical_data in historical_data_sets:
       if not isinstance(historical_data, DataFrame):
-        percent_changes.append('N/A')
+        percent_changes.append(None)
       else:
         percent_changes.append(get_percent_change(historical_data))
 
     return percent_changes
 
   @staticmethod
-  def BacktestDollarCostAveraging(symbol : str, start_date : str, principal : float, periodic_investment : float, period : int) -> Dict:
+  def __get_purchase_rows(dates : np.ndarray, start_date : dt.datetime, period : float, end_date : dt.datetime) -> np.ndarray:
+    """
+    Finds the rows of the trading days that the DCA strategy makes a periodic investment on. Starting at start_date,
+    an investment is attempted every period days until end_date. When that day is not a trading day, the
+    investment is skipped and the schedule is pushed back a day.
+    """
+
+    # Trading days as the number of days since start_date
+    trading_days = (dates.astype('datetime64[D]') - np.datetime64(start_date.date(), 'D')).astype(np.int64)
+
+    is_trading_day = np.zeros(max(trading_days[-1] + 1, 0), dtype=bool)
+    is_trading_day[trading_days[trading_days >= 0]] = True
+    is_trading_day = is_trading_day.tolist()
+
+    # Days are tracked as fractions so periods that are not whole days land on the same dates as datetime math
+    start_time_of_day = (start_date - dt.datetime.combine(start_date.date(), dt.time())).total_seconds() / 86400
+    last_offset = (end_date - start_date).total_seconds() / 86400
+
+    purchase_days = []
+    offset = 0.0
+
+    while offset < last_offset:
+      offset += period
+      day = int(start_time_of_day + offset)
+
+      if day < len(is_trading_day) and is_trading_day[day]:
+        purchase_days.append(day)
+      else:
+        offset += 1
+
+    return np.searchsorted(trading_days, np.array(purchase_days, dtype=np.int64))
+
+  @staticmethod
+  def __get_investment_rating(yearly_return : float) -> str:
+    """
+    Maps the profit made per dollar spent per year to a rating from 'AAA' (best) to 'D' (worst)
+    """
+
     ratings = [letter * x for letter in ['A', 'B', 'C', 'D'] for x in range(1,4)]
     
     def remap(value : float, old_low : float, old_high : float, new_low : float, new_high : float) -> float:
       return new_low + (value - old_low) * (new_high - new_low) / (old_high - old_low)
 
-    def get_rating(x : float) -> float:
-      e_X = pow(math.e, x)
-      new_val = e_X / (e_X + 1)
-
-      return ratings[int(len(ratings) - remap(new_val, 0, 1, 0, len(ratings)))]
+    e_X = pow(math.e, yearly_return)
+    new_val = e_X / (e_X + 1)
 
-    df = Equity.GetHistoricalData(symbol, start_date)
+    return ratings[int(len(ratings) - remap(new_val, 0, 1, 0, len(ratings)))]
 
-    if type(df) != DataFrame:
-      return None
-    
-    total_shares_purchased = principal / df.iloc[0, :]['Adj Close']
-    total_money_spent = principal
+  @staticmethod
+  def __backtest_dca(dates : np.ndarray, prices : np.ndarray, start_date : dt.datetime, principal : float, periodic_investment : float, period : float) -> Dict[str, Any]:
+    """
+    Runs the DCA strategy over the trading days and adjusted closing prices already retrieved for a symbol and returns the unformatted results
+    """
 
-    current_date = Equity.__time_range_to_date(start_date)
+    purchase_rows = Equity.__get_purchase_rows(dates, start_date, period, dt.datetime.now())
 
-    while current_date < dt.datetime.now():
-      current_date += relativedelta.relativedelta(days=period)
+    total_shares_purchased = principal / prices[0] + np.sum(periodic_investment / prices[purchase_rows])
+    total_money_spent = principal + periodic_investment * len(purchase_rows)
+    
+    value = total_shares_purchased * prices[-1]
+
+    return {
+      'Start Date' : Timestamp(dates[0]),
+      'Investing Years' : round(int((dates[-1] - dates[0]).astype('timedelta64[D]').astype(np.int64)) / 365, 2),
+      'Money Spent' : total_money_spent,
+      'Shares Purchased' : total_shares_purchased,
+      'Market Value' : value,
+      'Net Profit' : value - total_money_spent
+    }
 
-      try: 
-        total_shares_purchased += (periodic_investment / float(df.loc[current_date.strftime('%Y-%m-%d'), :]['Adj Close']))
-        total_money_spent += periodic_investment
+  @staticmethod
+  def BacktestDollarCostAveraging(symbol : str, start_date : str, principal : float, periodic_investment : float, period : int) -> Dict:
+    df = Equity.GetHistoricalData(symbol, start_date)
 
-      except KeyError:
-        current_date += relativedelta.relativedelta(days=1)
+    if type(df) != DataFrame:
+      return None
     
-    value = total_shares_purchased * df.iloc[-1, :]['Adj Close']
-    profit = value - total_money_spent
+    results = Equity.__backtest_dca(df.index.values, df['Adj Close'].values, Equity.__time_range_to_date(start_date), principal, periodic_investment, period)
 
-    investing_years = round((df.index[-1] - df.index[0]).days / 365, 2)
+    investing_years = results['Investing Years']
 
     return_obj = {
       'Symbol' : symbol.upper(),
-      'Start Date' : df.index[0],
+      'Start Date' : results['Start Date'],
       'Investment Time' : f'{investing_years} years',
-      'Money Spent' : locale.currency(total_money_spent, grouping=True),
-      'Shares Purchased' : round(total_shares_purchased, 2),
-      'Market Value' : locale.currency(value, grouping=True),
-      'Net Profit' : locale.currency(profit, grouping=True),
-      'Investment Rating' : get_rating(profit / total_money_spent / investing_years)
+      'Money Spent' : locale.currency(results['Money Spent'], grouping=True),
+      'Shares Purchased' : round(results['Shares Purchased'], 2),
+      'Market Value' : locale.currency(results['Market Value'], grouping=True),
+      'Net Profit' : locale.currency(results['Net Profit'], grouping=True),
+      'Investment Rating' : Equity.__get_investment_rating(results['Net Profit'] / results['Money Spent'] / investing_years)
     }
 
     return return_obj
 
-class Option:
-  class OptionType(enum.Enum):
-    Call = "CALL"
-    Put = "PUT"
-
-  class Contract:
+  @staticmethod
+  def GetPricesOverTimeRanges(symbol : str, time_ranges : List[str]) -> List[Optional[Tuple[np.ndarray, np.ndarray]]]:
     """
-    The Contract class is a wrapper class for the JSON objects retrieved from the TD-Ameritrade API
-    and additional information for the user.
+    Same as GetHistoricalDataOverTimeRanges(), but each time range is only its trading days and adjusted closing
+    prices as arrays, which are all a backtest needs and are cheap to send to another process
     """
 
-    def __init__(self, *args, **kwargs):
-      self.__dict__ = kwargs
+    return [(df.index.values, df['Adj Close'].values) if type(df) == DataFrame else None
+            for df in Equity.GetHistoricalDataOverTimeRanges(symbol, time_ranges)]
 
-  __properties = ['CompanySymbol', 'Type', 'Description', 'Symbol', 'BlackScholesValue', 'TDAmeritrade', 'Premium', 'ContractRating', 'LastUpdated']
+  @staticmethod
+  def SweepDollarCostAveraging(symbol : str, start_dates : List[str], principals : List[float],
+                               periodic_investments : List[float], periods : List[float]) -> List['Backtest']:
+    """
+    This function backtests the DCA strategy on the symbol with every combination of the parameters given.
+    The symbol's trading data is retrieved once and shared by every backtest. Start dates that the trading
+    data does not cover are skipped
+    """
 
-  def __init__(self, *args, **kwargs):
-    if len(args) > 0:
-      self.__dict__ = {self.__properties[index] : arg for (index, arg) in enumerate(args, start=0)}
-    else:
-      self.__dict__ = kwargs
+    return Equity.SweepDollarCostAveragingOnPrices(symbol, start_dates, Equity.GetPricesOverTimeRanges(symbol, start_dates),
+                                                   principals, periodic_investments, periods)
 
   @staticmethod
-  def __d1(s, x, r, t, o):
-    return (math.log(s / x, math.e) + t * (r + pow(o, 2) * 0.5)) / (o * math.sqrt(t))
+  def SweepDollarCostAveragingOnPrices(symbol : str, start_dates : List[str], prices : List[Optional[Tuple[np.ndarray, np.ndarray]]],
+                                       principals : List[float], periodic_investments : List[float], periods : List[float]) -> List['Backtest']:
+    """
+    Same as SweepDollarCostAveraging(), over the prices of every start date from GetPricesOverTimeRanges() instead
+    of retrieving them. Nothing is downloaded, so this can run in a process without the providers' rate limits
+    """
 
-  @staticmethod
-  def __d2(d1, o, t):
-    return d1 - o * math.sqrt(t)
+    backtests = []
 
-  @staticmethod
-  def __call_value(current_price, exercise_price, interest_rate, time, log_std_dev):
-    d1 = Option.__d1(current_price, exercise_price, interest_rate, time, log_std_dev)
-    d2 = Option.__d2(d1, log_std_dev, time)
-    
-    n1 = scipy.stats.norm.cdf(d1)
-    n2 = scipy.stats.norm.cdf(d2)
+    for (start_date, start_date_prices) in zip(start_dates, prices):
+      if start_date_prices == None:
+        continue
 
-    v_0 = round(current_price * n1 - exercise_price / pow(math.e, interest_rate*time) * n2, 3)
-    return v_0
+      dates, adjusted_closes = start_date_prices
+      start_datetime = Equity.__time_range_to_date(start_date)
 
-  @staticmethod
-  def __put_value(current_price, exercise_price, interest_rate, time, log_std_dev):
-    v_c = Option.__call_value(current_price, exercise_price, interest_rate, time, log_std_dev)
+      for (principal, periodic_investment, period) in itertools.product(principals, periodic_investments, periods):
+        results = Equity.__backtest_dca(dates, adjusted_closes, start_datetime, principal, periodic_investment, period)
+
+        if results['Investing Years'] > 0:
+          yearly_return = results['Net Profit'] / results['Money Spent'] / results['Investing Years']
+          rating = Equity.__get_investment_rating(yearly_return)
+          yearly_return = round(yearly_return * 100, 2)
+        else:
+          yearly_return = None
+          rating = None
+
+        backtests.append(Backtest(
+          symbol.upper(),
+          start_date.upper(),
+          principal,
+          periodic_investment,
+          period,
+          results['Start Date'].strftime('%Y-%m-%d'),
+          results['Investing Years'],
+          round(results['Money Spent'], 2),
+          round(results['Shares Purchased'], 2),
+          round(results['Market Value'], 2),
+          round(results['Net Profit'], 2),
+          yearly_return,
+          rating
+          ))
+
+    return backtests
+
+class Option(Record):
+  class OptionType(enum.Enum):
+    Call = "CALL"
+    Put = "PUT"
+
+  _properties = ('CompanySymbol', 'Type', 'Description', 'Symbol', 'BlackScholesValue', 'TDAmeritrade', 'Premium', 'ContractRating', 'LastUpdated',
+                 'ImpliedVolatility', 'ExpirationDate', 'Strike')
 
-    v_0 = round(v_c + exercise_price / pow(math.e, interest_rate * time) - current_price, 3)
-    return v_0
+  __slots__ = ()
+
+  # Fields read from the TD Ameritrade JSON object of a contract, the rest of the object is dropped
+  JSON_FIELDS = ('putCall', 'symbol', 'description', 'ask', 'mark', 'strikePrice', 'expirationDate',
+                 'daysToExpiration', 'theoreticalOptionValue')
+
+  # Fields of JSON_FIELDS that ParseChain() reads into float arrays
+  __numeric_json_fields = ('ask', 'mark', 'strikePrice', 'expirationDate', 'daysToExpiration', 'theoreticalOptionValue')
 
   @staticmethod
   def __time_range_to_date(time_range : str) -> dt.datetime:
@@ -297,62 +678,119 @@ class Option:
     elif period == 'y': return dt.datetime.now() + relativedelta.relativedelta(years=multiplier)
 
   @staticmethod
-  def __json_to_options(contract_type : 'OptionType', json : str, get_valuable = True) -> List['Option']:
-    contract_location = "callExpDateMap" if contract_type == Option.OptionType.Call else 'putExpDateMap'
+  def ParseChain(content : bytes) -> Optional[Dict[str, Any]]:
+    """
+    Reads a TD Ameritrade option chain response straight into one column per field of JSON_FIELDS, without
+    an object per contract. Text fields are lists, numeric fields are arrays (NaN where missing), putCall is an
+    IsCall boolean array. The chain's symbol, underlying price, interest rate and volatility are single values.
+    Returns None if the chain has no contracts or no underlying price
+    """
 
-    contracts = []
-    for exp_date in json[contract_location]:
-      for contract in json[contract_location][exp_date]:
-        new_opt = Option.Contract(**json[contract_location][exp_date][contract][0])
-        
-        if new_opt.daysToExpiration <= 0.0 or json['underlyingPrice'] == 0:
-          continue
-        
-        new_opt.CompanySymbol = json['symbol']
-        new_opt.interestRate = json['interestRate']
-        new_opt.volatility = json['volatility']
-        new_opt.underlyingPrice = json['underlyingPrice']
-        new_opt.BlackScholes = Option.CallValue(new_opt) if contract_type == Option.OptionType.Call else Option.PutValue(new_opt)
-        new_opt.theoreticalOptionValue = float(new_opt.theoreticalOptionValue)
-        new_opt.ask = float(new_opt.ask)
+    chain = orjson.loads(content) if orjson != None else js.loads(content)
 
-        try:
-          if new_opt.theoreticalOptionValue == 'nan' or new_opt.theoreticalOptionValue == -999.0:
-            new_opt.ContractRating = round((new_opt.BlackScholes - new_opt.ask) / new_opt.BlackScholes * 100, 2)
-          else:
-            new_opt.ContractRating = round(100 * ((new_opt.BlackScholes + new_opt.theoreticalOptionValue) / (2 * new_opt.ask) - 1), 2)
-        except RuntimeWarning:
-          new_opt.ContractRating = new_opt.BlackScholes - new_opt.ask
+    if not chain.get('underlyingPrice'):
+      return None
 
-        if get_valuable:
-          if (float(new_opt.BlackScholes) > float(new_opt.ask) or (new_opt.theoreticalOptionValue != 'NaN' and float(new_opt.theoreticalOptionValue) > float(new_opt.ask))):
-            contracts.append(new_opt)
-        else: contracts.append(new_opt)
-    return contracts
+    # Every strike maps to a list holding its one contract
+    contracts = [strike_contracts[0]
+                 for exp_date_map in ['callExpDateMap', 'putExpDateMap']
+                 for exp_date_contracts in chain.get(exp_date_map, {}).values()
+                 for strike_contracts in exp_date_contracts.values()]
 
-  @staticmethod
-  def CallValue(contract : 'Contract') -> float:
-    """
-    This function returns the Black-Scholes call value for an options contract
-    """
-    return Option.__call_value(contract.underlyingPrice, contract.strikePrice, contract.interestRate / 100, contract.daysToExpiration / 365, contract.volatility / 100)
+    if len(contracts) == 0:
+      return None
+
+    columns = {field : [contract.get(field) for contract in contracts] for field in Option.JSON_FIELDS}
+
+    for field in Option.__numeric_json_fields:
+      columns[field] = np.array(columns[field], dtype=float)
+
+    columns['IsCall'] = np.array(columns.pop('putCall')) == Option.OptionType.Call.value
+
+    return {
+      **columns,
+      'CompanySymbol' : chain['symbol'],
+      'underlyingPrice' : float(chain['underlyingPrice']),
+      'interestRate' : float(chain['interestRate']),
+      'volatility' : float(chain['volatility'])
+    }
 
   @staticmethod
-  def PutValue(contract : 'Contract') -> float:
+  def __price_chain(chain_columns : Dict[str, Any], get_valuable = True) -> Optional[Dict[str, List[Any]]]:
     """
-    This function returns the Black-Scholes put value for an options contract
+    Values every contract of a chain read by ParseChain() at once. Returns the chain as columns of the
+    Options table, only keeping the valuable contracts if get_valuable. Returns None if no contract is left
     """
-    return Option.__put_value(contract.underlyingPrice, contract.strikePrice, contract.interestRate / 100, contract.daysToExpiration / 365, contract.volatility / 100) 
+
+    keep = chain_columns['daysToExpiration'] > 0
+    is_call = chain_columns['IsCall'][keep]
+    strikes = chain_columns['strikePrice'][keep]
+    days_to_expiration = chain_columns['daysToExpiration'][keep]
+    asks = chain_columns['ask'][keep]
+    marks = chain_columns['mark'][keep]
+    theoretical_values = chain_columns['theoreticalOptionValue'][keep]
+
+    underlying_price = chain_columns['underlyingPrice']
+    interest_rate = chain_columns['interestRate'] / 100
+
+    # Calls and puts are priced together, each taking its own value
+    with metrics.Timer('pricing.black_scholes'):
+      pricing = BlackScholes(underlying_price, strikes, interest_rate, days_to_expiration / 365, chain_columns['volatility'] / 100)
+    black_scholes = np.where(is_call, pricing['CallValue'], pricing['PutValue'])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+      no_theoretical_value = np.isnan(theoretical_values) | (theoretical_values == -999.0)
+
+      contract_ratings = np.where(no_theoretical_value,
+                                  (black_scholes - asks) / black_scholes * 100,
+                                  100 * ((black_scholes + theoretical_values) / (2 * asks) - 1))
+      contract_ratings = np.where(np.isfinite(contract_ratings), np.round(contract_ratings, 2), black_scholes - asks)
+
+      is_valuable = (black_scholes > asks) | (theoretical_values > asks)
+
+    # Solve for the volatility the market is pricing each contract at, using the mark when there is one
+    market_prices = np.where(np.nan_to_num(marks) > 0, marks, asks)
+    with metrics.Timer('pricing.implied_volatility'):
+      implied_volatilities = np.round(ImpliedVolatility(market_prices, underlying_price, strikes, interest_rate, days_to_expiration / 365, is_call) * 100, 2)
+
+    # Expiration timestamps are in milliseconds, days to expiration is used when there is none
+    expiration_days = np.where(np.isnan(chain_columns['expirationDate'][keep]),
+                               np.datetime64(dt.date.today(), 'D').astype(np.int64) + days_to_expiration.astype(np.int64),
+                               np.floor_divide(chain_columns['expirationDate'][keep], 24 * 60 * 60 * 1000))
+
+    selected = is_valuable if get_valuable else np.full(len(is_call), True)
+    rows = keep.nonzero()[0][selected]
+
+    if len(rows) == 0:
+      return None
+
+    pick_text = lambda field: [chain_columns[field][row] for row in rows.tolist()]
+    pick = lambda values: values[selected]
+
+    return {
+      'CompanySymbol' : [chain_columns['CompanySymbol']] * len(rows),
+      'Type' : np.where(pick(is_call), Option.OptionType.Call.value, Option.OptionType.Put.value).tolist(),
+      'Description' : pick_text('description'),
+      'Symbol' : pick_text('symbol'),
+      'BlackScholesValue' : pick(black_scholes).tolist(),
+      'TDAmeritrade' : pick(theoretical_values).tolist(),
+      'Premium' : pick(asks).tolist(),
+      'ContractRating' : pick(contract_ratings).tolist(),
+      'ImpliedVolatility' : np.where(np.isfinite(pick(implied_volatilities)), pick(implied_volatilities), None).tolist(),
+      'ExpirationDate' : pick(expiration_days).astype(np.int64).astype('datetime64[D]').astype(str).tolist(),
+      'Strike' : pick(strikes).tolist()
+    }
 
   @staticmethod
-  def GetOptions(td_ameritrade_api_key : str, symbol : str, to_date : str) -> List['Option']:
+  def GetOptionColumns(td_ameritrade_api_key : str, symbol : str, to_date : str, get_valuable = True) -> Optional[Dict[str, List[Any]]]:
     """
-    This function will use the TD Ameritrade API to retrieve Option(s) for the symbol available
-    up to the specified to_date
+    This function will use the TD Ameritrade API to retrieve the option(s) for the symbol available up to the
+    specified to_date, as one list per column of the Options table (see SecurityDatabaseWrapper.AddNewColumns()).
+    Returns None if the symbol has no options worth saving
     """
 
     options_url = 'https://api.tdameritrade.com/v1/marketdata/chains'
-    request = requests.get(url = options_url, params = {
+    request = GetSession(Provider.TDAmeritrade).get(url = options_url, params = {
       'apikey' : td_ameritrade_api_key,
       'symbol' : symbol,
       'contractType' : "ALL",
@@ -364,26 +802,42 @@ class Option:
     })
 
     if request.status_code != 200:
+      metrics.IncrementCounter(f'provider.{Provider.TDAmeritrade.value}.http_{request.status_code}')
+      return None
+
+    chain_columns = Option.ParseChain(request.content)
+
+    if chain_columns == None:
+      return None
+
+    return Option.__price_chain(chain_columns, get_valuable)
+
+  @staticmethod
+  def GetOptions(td_ameritrade_api_key : str, symbol : str, to_date : str) -> List['Option']:
+    """
+    Same as GetOptionColumns(), but as an Option per contract
+    """
+
+    option_columns = Option.GetOptionColumns(td_ameritrade_api_key, symbol, to_date)
+
+    if option_columns == None:
       return []
-    
-    json = request.json()
 
-    contracts =  Option.__json_to_options(Option.OptionType.Call, json) + Option.__json_to_options(Option.OptionType.Put, json)
-    
-    options = []
-    for contract in contracts:
-      options.append(Option(
-        contract.CompanySymbol,
-        contract.putCall,
-        contract.description,
-        contract.symbol,
-        contract.BlackScholes,
-        contract.theoreticalOptionValue,
-        contract.ask,
-        contract.ContractRating
-        ))
-        
-    return options
+    return [Option(**dict(zip(option_columns.keys(), values))) for values in zip(*option_columns.values())]
+
+class Backtest(Record):
+  """
+  The Backtest class holds the results of one DCA backtest from Equity.SweepDollarCostAveraging().
+  YearlyReturn is the percent of the money spent that was made as profit per year of investing
+  """
+
+  _properties = ('Symbol', 'StartRange', 'Principal', 'PeriodicInvestment', 'Period', 'StartDate', 'InvestmentYears',
+                 'MoneySpent', 'SharesPurchased', 'MarketValue', 'NetProfit', 'YearlyReturn', 'InvestmentRating', 'LastUpdated')
+
+  # Columns that identify a backtest; running the same backtest again replaces its results
+  KEY_COLUMNS = ('Symbol', 'StartRange', 'Principal', 'PeriodicInvestment', 'Period')
+
+  __slots__ = ()
 
 class RelationalOperator(enum.Enum):
   EqualTo = '='
@@ -395,64 +849,32 @@ class RelationalOperator(enum.Enum):
   Between = 'BETWEEN'
   Like = 'LIKE'
   In = 'IN'
+  Is = 'IS'
+  IsNot = 'IS NOT'
 
 class Ordering(enum.Enum):
   Ascending = 'ASC'
   Descending = 'DESC'
 
 class SecurityDatabaseWrapper:
-  def __init__(self, database_path):
-    self.__conn = sqlite3.connect(database_path)
+  DATABASE_LOCK_TIMEOUT = 60
+
+  # Most parameters one statement may bind in SQLite versions before 3.32
+  MAX_BOUND_PARAMETERS = 999
+
+  def __init__(self, database_path, batch_size = 1000):
+    # Writers wait up to DATABASE_LOCK_TIMEOUT seconds for each other, and with WAL journaling
+    # readers are never blocked by a writer (ex. viewing tables while a background update runs)
+    self.__conn = sqlite3.connect(database_path, timeout=SecurityDatabaseWrapper.DATABASE_LOCK_TIMEOUT)
+    self.__conn.execute("PRAGMA journal_mode=WAL")
     self.__conn.row_factory = sqlite3.Row     
+    self.__batch_size = batch_size
 
     self.__cursor = self.__conn.cursor()
-    self.__cursor.execute("""CREATE TABLE IF NOT EXISTS ListedEquities (
-                              Symbol CHAR(10),
-                              CompanyName CHAR(255))""")
-
-    self.__cursor.execute("""CREATE TABLE IF NOT EXISTS Equities (
-                              Symbol CHAR(10),
-                              CompanyName CHAR(255),
-                              '1D' FLOAT(5),
-                              '1W' FLOAT(5),
-                              '1M' FLOAT(5),
-                              '3M' FLOAT(5),
-                              '1Y' FLOAT(5),
-                              '5Y' FLOAT(5),
-                              '10Y' FLOAT(5),
-                              Max FLOAT(5),
-                              LastUpdated DATETIME DEFAULT CURRENT_TIMESTAMP)""")
-
-    self.__cursor.execute("""CREATE TABLE IF NOT EXISTS Options (
-                              CompanySymbol CHAR(10),
-                              Type CHAR(4),
-                              Description CHAR(255),
-                              Symbol CHAR(255),
-                              BlackScholesValue FLOAT(10),
-                              TDAmeritrade FLOAT(10),
-                              Premium FLOAT(10),
-                              ContractRating FLOAT(20),
-                              LastUpdated DATETIME DEFAULT CURRENT_TIMESTAMP)""")
-
-    self.__cursor.execute("""SELECT * FROM sqlite_master
-                             WHERE type = 'trigger'""")
-    trigger_list = self.__cursor.fetchall()
-                             
-    if len(trigger_list) != 2:
-      self.__cursor.execute("""CREATE TRIGGER Update_Equities_LastUpdated
-                              AFTER UPDATE ON Equities
-                              FOR EACH ROW
-                              BEGIN
-                                  UPDATE Equities SET LastUpdated = CURRENT_TIMESTAMP WHERE Symbol=old.Symbol;
-                              END""")
-
-      self.__cursor.execute("""CREATE TRIGGER Update_Options_LastUpdated
-                              AFTER UPDATE ON Options
-                              FOR EACH ROW
-                              BEGIN
-                                  UPDATE Options SET LastUpdated = CURRENT_TIMESTAMP WHERE Symbol=old.Symbol;
-                              END""")      
-  
+
+    # Creates the tables, or upgrades ones made by an older version of this program
+    Migrate(self.__conn)
+
   @staticmethod
   def __get_table_name(security : Union[Equity, Option, SecurityType]) -> str:
     """
@@ -468,6 +890,9 @@ class SecurityDatabaseWrapper:
     elif isinstance(security, EquityListing):
       return "ListedEquities"
 
+    elif isinstance(security, Backtest):
+      return 'Backtests'
+
     elif isinstance(security, SecurityType):
       if security == SecurityType.Equity:
         return 'Equities'
@@ -477,6 +902,9 @@ class SecurityDatabaseWrapper:
 
       elif security == SecurityType.EquityListing:
         return 'ListedEquities'
+
+      elif security == SecurityType.Backtest:
+        return 'Backtests'
       else:
         ValueError("Literally impossible for this to happen")
     else: 
@@ -497,6 +925,8 @@ class SecurityDatabaseWrapper:
     """
     Assure that the value is SQL valid
     """
+    if value == None:
+      return "NULL"
     if isinstance(value, str):
       value = value.replace("'", "''")
       return f'"{value}"'
@@ -526,18 +956,237 @@ class SecurityDatabaseWrapper:
     where_clause_section = ' AND '.join([f'{col_name} {relation.value} {value}' for col_name, relation, value in formatted_identifiers])
     return f"({where_clause_section})"
 
+  @staticmethod
+  def __split_into_batches(items : Iterable[Any], batch_size : int) -> Iterator[List[Any]]:
+    """
+    Splits any iterable into lists of batch_size items without loading all of it at once
+    """
+
+    batch = []
+
+    for item in items:
+      batch.append(item)
+
+      if len(batch) == batch_size:
+        yield batch
+        batch = []
+
+    if len(batch) > 0:
+      yield batch
+
+  @staticmethod
+  def __group_by_table(securities : List[Union[Equity, Option, EquityListing, Backtest]]) -> Dict[Tuple[str, Tuple[str, ...]], List[Tuple[Any, ...]]]:
+    """
+    Groups the securities' values by the table and the columns they are written to
+    """
+
+    groups = {}
+
+    for security in securities:
+      values = security.to_dict()
+      key = (SecurityDatabaseWrapper.__get_table_name(security), tuple(values.keys()))
+      groups.setdefault(key, []).append(tuple(values.values()))
+
+    return groups
+
+  def __insert_many(self, table_name : str, columns : Iterable[str], rows : List[Tuple[Any, ...]]) -> None:
+    columns_clause = ", ".join([self._validate_column_name(col_name) for col_name in columns])
+    values_clause = ", ".join(['?'] * len(rows[0]))
+
+    self.__cursor.executemany(f"""INSERT INTO {table_name} ({columns_clause})
+                                  VALUES ({values_clause})""", rows)
+
   def CloseConnection(self):
     self.__conn.close()
 
-  def AddNewSecurity(self, security : Union[Equity, Option, EquityListing]) -> None:
+  @metrics.Timed('db.AddNewSecurity')
+  def AddNewSecurity(self, security : Union[Equity, Option, EquityListing, Backtest]) -> None:
     """
     Adds security to corresponding table in database
     """
     
     table_name = self.__get_table_name(security)
     
-    self.Insert(table_name, security.__dict__.keys(), security.__dict__.values())
+    values = security.to_dict()
+    
+    self.Insert(table_name, values.keys(), values.values())
+
+  def AddNewSecurities(self, securities : Iterable[Union[Equity, Option, EquityListing, Backtest]], batch_size : Optional[int] = None) -> int:
+    """
+    Adds every security to its corresponding table in the database. The securities are inserted and saved
+    in batches of batch_size, so securities can be a generator that is still producing them. Returns the
+    number of securities added
+    """
+
+    added_count = 0
+
+    for batch in self.__split_into_batches(securities, batch_size or self.__batch_size):
+      with metrics.Timer('db.AddNewSecurities.batch'), self.__conn:
+        for ((table_name, columns), rows) in self.__group_by_table(batch).items():
+          self.__insert_many(table_name, columns, rows)
+
+      added_count += len(batch)
+      metrics.IncrementCounter('db.AddNewSecurities.rows', len(batch))
+
+    return added_count
+
+  def AddNewColumns(self, security_type : SecurityType, column_sets : Iterable[Dict[str, Sequence[Any]]], batch_size : Optional[int] = None) -> int:
+    """
+    Adds rows given as columns (ex. from Option.GetOptionColumns()) to the security type's table. Each column set
+    is a dictionary of equally long sequences by column name. Like AddNewSecurities(), the rows are saved in batches
+    of about batch_size rows, so column_sets can be a generator that is still producing them. Returns the number of rows added
+    """
+
+    table_name = self.__get_table_name(security_type)
+    batch_size = batch_size or self.__batch_size
+    added_count = 0
+    batch = []
+    batch_row_count = 0
+
+    def save_batch() -> None:
+      with metrics.Timer('db.AddNewColumns.batch'), self.__conn:
+        for columns in batch:
+          self.__insert_many(table_name, columns.keys(), list(zip(*columns.values())))
+
+      metrics.IncrementCounter('db.AddNewColumns.rows', batch_row_count)
+
+    for columns in column_sets:
+      row_count = len(next(iter(columns.values()), []))
+
+      if row_count == 0:
+        continue
+
+      batch.append(columns)
+      batch_row_count += row_count
+      added_count += row_count
+
+      if batch_row_count >= batch_size:
+        save_batch()
+        batch = []
+        batch_row_count = 0
+
+    if len(batch) > 0:
+      save_batch()
+
+    return added_count
+
+  def UpsertSecurities(self, securities : Iterable[Union[Equity, Option, EquityListing, Backtest]],
+                             key_col_names : Union[str, Sequence[str]] = 'Symbol', batch_size : Optional[int] = None) -> int:
+    """
+    Updates the entries of every security whose key column value(s) are already in its table and adds the rest.
+    Like AddNewSecurities(), the securities are saved in batches of batch_size. Returns the number of rows written, which
+    leaves out securities replaced by a later one with the same key in the same batch
+    """
+
+    if isinstance(key_col_names, str):
+      key_col_names = [key_col_names]
+
+    written_count = 0
+    key_cols = [self._validate_column_name(col_name) for col_name in key_col_names]
+
+    for batch in self.__split_into_batches(securities, batch_size or self.__batch_size):
+      batch_written_count = 0
+
+      with metrics.Timer('db.UpsertSecurities.batch'), self.__conn:
+        for ((table_name, columns), rows) in self.__group_by_table(batch).items():
+          key_indices = [columns.index(col_name) for col_name in key_col_names]
+          get_key = lambda row: tuple(row[index] for index in key_indices)
+
+          # Only the last entry of a key in the batch matters
+          rows = list({get_key(row) : row for row in rows}.values())
+          existing_keys = set()
+
+          # The first key column narrows down the search, the rest are matched here
+          for first_key_values in self.__split_into_batches(set(row[key_indices[0]] for row in rows), self.MAX_BOUND_PARAMETERS):
+            self.__cursor.execute(f"""SELECT {", ".join(key_cols)} FROM {table_name}
+                                      WHERE {key_cols[0]} IN ({", ".join(['?'] * len(first_key_values))})""", first_key_values)
+            existing_keys.update(tuple(row) for row in self.__cursor.fetchall())
+
+          rows_to_update = [row + get_key(row) for row in rows if get_key(row) in existing_keys]
+          rows_to_insert = [row for row in rows if get_key(row) not in existing_keys]
+
+          if len(rows_to_update) > 0:
+            set_clause = ", ".join([f"{self._validate_column_name(col_name)} = ?" for col_name in columns])
+            key_clause = " AND ".join([f"{key_col} = ?" for key_col in key_cols])
+
+            self.__cursor.executemany(f"""UPDATE {table_name}
+                                          SET {set_clause}
+                                          WHERE {key_clause}""", rows_to_update)
+
+          if len(rows_to_insert) > 0:
+            self.__insert_many(table_name, columns, rows_to_insert)
+
+          batch_written_count += len(rows)
+
+      written_count += batch_written_count
+      metrics.IncrementCounter('db.UpsertSecurities.rows', batch_written_count)
+
+    return written_count
   
+  @metrics.Timed('db.SyncListedEquities')
+  def SyncListedEquities(self, equity_listings : Iterable[EquityListing], flag_delisted = False) -> Dict[str, int]:
+    """
+    Brings the ListedEquities table in line with a fresh scrape. Symbols that are new are added, symbols whose
+    company name changed (or were delisted and are listed again) are updated, and everything else is left alone.
+    When flag_delisted is True, symbols missing from the scrape are marked as delisted. Returns the number of
+    symbols that were 'Added', 'Changed' and 'Delisted'
+    """
+
+    self.__cursor.execute("SELECT Symbol, CompanyName, Delisted FROM ListedEquities")
+    existing_listings = {row['Symbol'] : (row['CompanyName'], row['Delisted']) for row in self.__cursor.fetchall()}
+
+    # A symbol can be scraped as both a stock and an ETF, the last one is kept
+    scraped_listings = {equity_listing.Symbol : equity_listing.CompanyName for equity_listing in equity_listings}
+
+    new_rows = [(symbol, company_name) for (symbol, company_name) in scraped_listings.items() if symbol not in existing_listings]
+    changed_rows = [(symbol, company_name) for (symbol, company_name) in scraped_listings.items()
+                    if symbol in existing_listings and existing_listings[symbol] != (company_name, 0)]
+    delisted_symbols = [(symbol,) for (symbol, (_, delisted)) in existing_listings.items()
+                        if flag_delisted and symbol not in scraped_listings and delisted != 1]
+
+    with self.__conn:
+      self.__cursor.executemany("""INSERT INTO ListedEquities (Symbol, CompanyName, Delisted)
+                                   VALUES (?, ?, 0)
+                                   ON CONFLICT (Symbol) DO UPDATE SET CompanyName = excluded.CompanyName, Delisted = 0""", new_rows + changed_rows)
+
+      self.__cursor.executemany("UPDATE ListedEquities SET Delisted = 1 WHERE Symbol = ?", delisted_symbols)
+
+    return { 'Added' : len(new_rows), 'Changed' : len(changed_rows), 'Delisted' : len(delisted_symbols) }
+
+  @metrics.Timed('db.DeleteExpiredOptions')
+  def DeleteExpiredOptions(self, expired_before : dt.date) -> int:
+    """
+    Deletes every option that expires before the date. Options whose expiration date could not be read from
+    their description when it was backfilled have none, and are deleted too. Returns the number of options deleted
+    """
+
+    is_expired = "ExpirationDate < ? OR ExpirationDate IS NULL"
+
+    with self.__conn:
+      # Taking the expired options off the boards first keeps the delete triggers from refilling a board once per
+      # option, with options the same statement is about to delete. The boards are refilled once each at the end
+      self.__cursor.execute(f"""DELETE FROM Leaderboards
+                                WHERE Board IN (SELECT Board FROM LeaderboardDefinitions WHERE TableName = 'Options')
+                                  AND SourceRowId IN (SELECT rowid FROM Options WHERE {is_expired})""", (expired_before.isoformat(),))
+
+      self.__cursor.execute(f"DELETE FROM Options WHERE {is_expired}", (expired_before.isoformat(),))
+      deleted_count = self.__cursor.rowcount
+
+      RefillLeaderboards(self.__cursor, 'Options')
+
+    return deleted_count
+
+  @metrics.Timed('db.GetOptionCompanySymbols')
+  def GetOptionCompanySymbols(self) -> Set[str]:
+    """
+    Finds the symbol of every company that has options in the database
+    """
+
+    self.__cursor.execute("SELECT DISTINCT CompanySymbol FROM Options")
+
+    return set(row['CompanySymbol'] for row in self.__cursor.fetchall())
+
+  @metrics.Timed('db.ModifySecurities')
   def ModifySecurities(self, new_security : Union[Equity, Option],
                               condition : Tuple[Any, RelationalOperator, Any]) -> None:
     """
@@ -546,13 +1195,16 @@ class SecurityDatabaseWrapper:
     """
     table_name = self.__get_table_name(new_security)
 
-    set_clause  = ", ".join([f"{self._validate_column_name(key)} = '{value}'" for key, value in new_security.__dict__.items()])
+    # Values are bound rather than quoted so numbers are stored as numbers and None as NULL
+    values = new_security.to_dict()
+    set_clause  = ", ".join([f"{self._validate_column_name(key)} = ?" for key in values.keys()])
     where_clause = self.__convert_to_sql_where([condition])
 
     self.__cursor.execute(f"""UPDATE {table_name}
                               SET {set_clause}
-                              WHERE {where_clause}""")
+                              WHERE {where_clause}""", list(values.values()))
 
+  @metrics.Timed('db.DeleteSecurity')
   def DeleteSecurity(self, security : Union[Equity, Option]) -> None:
     """
     Delete security from the database.
@@ -561,11 +1213,12 @@ class SecurityDatabaseWrapper:
     table_name = self.__get_table_name(security)
 
     # Query for the security with all matching key, value pairs
-    where_clause = self.__convert_to_sql_where([(key, RelationalOperator.EqualTo, value) for key, value in security.__dict__.items()])
+    where_clause = self.__convert_to_sql_where([(key, RelationalOperator.EqualTo, value) for key, value in security.to_dict().items()])
   
     self.__cursor.execute(f"""DELETE FROM {table_name}
                               WHERE {where_clause}""")
 
+  @metrics.Timed('db.DeleteSecuritiesConditional')
   def DeleteSecuritiesConditional(self, security_type : SecurityType, conditions : List[Tuple[Any, RelationalOperator, Any]] = None) -> None:
     """
     Deletes securities from database according to the conditions provided
@@ -578,35 +1231,154 @@ class SecurityDatabaseWrapper:
     self.__cursor.execute(f"""DELETE FROM {table_name}
                               WHERE {where_clause}""")
 
-  def GetSecurities(self, security_type : SecurityType,
-                          conditions : Optional[List[Tuple[Any, RelationalOperator, Any]]] = None,
-                          order_by_cols : Optional[List[Tuple[str, Ordering]]] = None) -> List[Union[Equity, Option]]:
+  def __build_where_and_order(self, conditions : Optional[List[Tuple[Any, RelationalOperator, Any]]],
+                                    order_by_cols : Optional[List[Tuple[str, Ordering]]]) -> Tuple[str, str]:
+    where_clause = f"WHERE {self.__convert_to_sql_where(conditions)} " if conditions != None else ""
+    order_by_clause = ""
+
+    if order_by_cols != None:
+      order_by_clause = "ORDER BY " + ", ".join([f"{self._validate_column_name(col_name)} {ordering_type.value}" for (col_name, ordering_type) in order_by_cols]) + " "
+
+    return where_clause, order_by_clause
+
+  def __slice_to_limit_and_offset(self, sel_slice : slice, table_name : str, where_clause : str) -> Tuple[Optional[int], int, slice]:
     """
-    Finds all securities of type security_type with the specified conditions and ordering by columns
+    Converts a Python slice of the query's results to a LIMIT and OFFSET, along with the slice that still
+    has to be applied to the rows that come back. The rows are only counted when the slice has a negative
+    start or stop. Negative steps are applied to all rows in Python
     """
-    table_name = self.__get_table_name(security_type)
 
-    select_clause = f"SELECT * FROM {table_name} "
+    if sel_slice.step != None and sel_slice.step < 0:
+      return None, 0, sel_slice
 
-    if conditions != None:
-      where_clause = self.__convert_to_sql_where(conditions)
-      select_clause += f"WHERE {where_clause} "
-    if order_by_cols != None:
-      order_by_clause = ", ".join([f"{self._validate_column_name(col_name)} {ordering_type.value}" for (col_name, ordering_type) in order_by_cols])
-      select_clause += f"ORDER BY {order_by_clause} "
+    start, stop = sel_slice.start, sel_slice.stop
 
-    self.__cursor.execute(select_clause + ';')
-    results = self.__cursor.fetchall()
-    
+    if (start != None and start < 0) or (stop != None and stop < 0):
+      self.__cursor.execute(f"SELECT COUNT(*) FROM {table_name} {where_clause}")
+      start, stop, _ = sel_slice.indices(self.__cursor.fetchone()[0])
+
+    offset = start or 0
+    limit = max(stop - offset, 0) if stop != None else None
+
+    return limit, offset, slice(None, None, sel_slice.step)
+
+  @staticmethod
+  def __get_record_class(security_type : SecurityType) -> Type[Record]:
     if security_type == SecurityType.Equity:
-      return [Equity(*equity) for equity in results]
+      return Equity
 
-    elif security_type == security_type.Option:
-      return [Option(*option) for option in results]
+    elif security_type == SecurityType.Option:
+      return Option
       
     elif security_type == SecurityType.EquityListing:
-      return [EquityListing(*equityListing) for equityListing in results]
+      return EquityListing
+
+    elif security_type == SecurityType.Backtest:
+      return Backtest
+
+  def IterateSecurities(self, security_type : SecurityType,
+                              conditions : Optional[List[Tuple[Any, RelationalOperator, Any]]] = None,
+                              order_by_cols : Optional[List[Tuple[str, Ordering]]] = None,
+                              limit : Optional[int] = None, offset = 0, sel_slice : Optional[slice] = None,
+                              chunk_size : Optional[int] = None) -> Iterator[Union[Equity, Option, EquityListing, Backtest]]:
+    """
+    Same as GetSecurities(), except the securities are yielded as they are read from the database, chunk_size rows at a time
+    """
+
+    table_name = self.__get_table_name(security_type)
+    where_clause, order_by_clause = self.__build_where_and_order(conditions, order_by_cols)
+    remaining_slice = slice(None)
+
+    if sel_slice != None:
+      limit, offset, remaining_slice = self.__slice_to_limit_and_offset(sel_slice, table_name, where_clause)
+
+    # Columns are selected in the order of the record's properties so rows can be used as they are
+    record_class = self.__get_record_class(security_type)
+    columns_clause = ", ".join([self._validate_column_name(col_name) for col_name in record_class._properties])
+
+    select_clause = f"SELECT {columns_clause} FROM {table_name} {where_clause}{order_by_clause}"
+
+    # A LIMIT of -1 is no limit in SQLite
+    if limit != None or offset > 0:
+      select_clause += f"LIMIT {int(limit) if limit != None else -1} OFFSET {int(offset)}"
+
+    # The rows are read with their own cursor so other queries can run while they are being yielded,
+    # and as plain tuples since records keep their values in one
+    cursor = self.__conn.cursor()
+    cursor.row_factory = None
+
+    with metrics.Timer('db.IterateSecurities.query'):
+      cursor.execute(select_clause + ';')
+
+    def read_rows():
+      rows = cursor.fetchmany(chunk_size or self.__batch_size)
+
+      while len(rows) > 0:
+        yield from rows
+        rows = cursor.fetchmany(chunk_size or self.__batch_size)
+
+    if remaining_slice.step != None and remaining_slice.step < 0:
+      rows = list(read_rows())[remaining_slice]
+    else:
+      rows = itertools.islice(read_rows(), 0, None, remaining_slice.step)
+
+    for row in rows:
+      yield record_class.FromRow(row)
+
+  @metrics.Timed('db.GetLeaderboards')
+  def GetLeaderboards(self) -> List[Dict[str, Any]]:
+    """
+    Describes every leaderboard the database keeps (see db_migrations.__create_leaderboards())
+    """
+
+    rows = self.__conn.execute("""SELECT Board, TableName AS 'Table', ColumnName AS 'Column',
+                                         CASE WHEN Descending THEN 'Highest' ELSE 'Lowest' END AS 'Order',
+                                         TypeFilter AS 'Type', Entries
+                                  FROM LeaderboardDefinitions
+                                  ORDER BY rowid""").fetchall()
+
+    return [dict(row) for row in rows]
+
+  @metrics.Timed('db.GetLeaderboard')
+  def GetLeaderboard(self, board : str, count : Optional[int] = None) -> List[Union[Equity, Option]]:
+    """
+    Returns the securities on the board (ex. '1Y', '-1Y', 'Calls'), best first. Only the board's entries are
+    read, so this takes the same time however many securities the table has. Raises KeyError for an unknown board
+    """
+
+    definition = self.__conn.execute("""SELECT Board, TableName, Descending FROM LeaderboardDefinitions
+                                        WHERE Board = ? COLLATE NOCASE""", (board,)).fetchone()
+
+    if definition == None:
+      raise KeyError(f"No leaderboard named '{board}'")
+
+    table_name = definition['TableName']
+    record_class = Equity if table_name == 'Equities' else Option
+    columns_clause = ", ".join([f"{table_name}.{self._validate_column_name(col_name)}" for col_name in record_class._properties])
+
+    cursor = self.__conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(f"""SELECT {columns_clause}
+                       FROM Leaderboards JOIN {table_name} ON {table_name}.rowid = Leaderboards.SourceRowId
+                       WHERE Leaderboards.Board = ?
+                       ORDER BY Leaderboards.Value {'DESC' if definition['Descending'] else 'ASC'}
+                       LIMIT ?""", (definition['Board'], -1 if count == None else int(count)))
+
+    return [record_class.FromRow(row) for row in cursor.fetchall()]
+
+  @metrics.Timed('db.GetSecurities')
+  def GetSecurities(self, security_type : SecurityType,
+                          conditions : Optional[List[Tuple[Any, RelationalOperator, Any]]] = None,
+                          order_by_cols : Optional[List[Tuple[str, Ordering]]] = None,
+                          limit : Optional[int] = None, offset = 0, sel_slice : Optional[slice] = None) -> List[Union[Equity, Option]]:
+    """
+    Finds all securities of type security_type with the specified conditions and ordering by columns. Only limit
+    securities starting from offset are read, or the ones in sel_slice, a Python slice of the results (ex. slice(None, 10))
+    """
+
+    return list(self.IterateSecurities(security_type, conditions, order_by_cols, limit, offset, sel_slice))
 
+  @metrics.Timed('db.ExecuteSQLStatement')
   def ExecuteSQLStatement(self, sql : str) -> Optional[List[Any]]:
     """
     Execute some SQL statement to the database and return any results if applicable.
@@ -618,14 +1390,18 @@ class SecurityDatabaseWrapper:
 
     return results
 
+  @metrics.Timed('db.Insert')
   def Insert(self, table, columns : List, values : List) -> None:
     columns_clause = ", ".join([self._validate_column_name(col_name) for col_name in columns])
-    values_clause = ", ".join([self._validate_value(value) for value in values])
+    values = list(values)
 
+    # The values are bound rather than written into the statement, so inserting into the same columns again
+    # reuses the compiled statement (and the leaderboard triggers compiled into it)
     sql_statement = f"""INSERT INTO {table} ({columns_clause})
-                        VALUES ({values_clause});"""
-    self.__cursor.execute(sql_statement)
+                        VALUES ({", ".join(['?'] * len(values))});"""
+    self.__cursor.execute(sql_statement, values)
 
+  @metrics.Timed('db.Save')
   def Save(self) -> None:
     """
     Saves the changes made to the database
@@ -0,0 +1,36 @@
+import os, sys, pytest
+
+TESTS_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+REPO_DIRECTORY = os.path.dirname(TESTS_DIRECTORY)
+
+# The modules import each other from the repository's directory like analyze.py does, and the
+# benchmarks' synthetic market data is shared with the tests
+sys.path.insert(0, REPO_DIRECTORY)
+sys.path.insert(0, os.path.join(REPO_DIRECTORY, 'benchmarks'))
+
+import fixtures, security_db_wrapper as sdw
+
+from providers import Provider, SetRateLimit, SetConcurrencyLimit
+
+@pytest.fixture(autouse=True, scope='session')
+def lift_rate_limits():
+  """
+  The providers' real rate limits would make the tests wait, and no test sends a real request
+  """
+
+  for provider in Provider:
+    SetRateLimit(provider, 10 ** 9, 10 ** 9)
+    SetConcurrencyLimit(provider, 10 ** 6)
+
+@pytest.fixture
+def fake_data_reader(monkeypatch) -> fixtures.FakeDataReader:
+  """
+  Serves generated Yahoo histories instead of downloading them, without a price store
+  """
+
+  data_reader = fixtures.FakeDataReader(pool_size=4)
+
+  monkeypatch.setattr(sdw, 'DataReader', data_reader)
+  monkeypatch.setattr(sdw.Equity, 'price_store', None)
+
+  return data_reader
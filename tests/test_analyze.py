@@ -0,0 +1,177 @@
+import os, time, json, pytest, threading, analyze, metrics
+
+def test_concurrent_map_yields_every_result():
+  results = dict(analyze.ConcurrentMap(lambda item: item * item, range(100), 4))
+
+  assert results == {item : item * item for item in range(100)}
+
+def test_concurrent_map_only_queues_a_window_of_items():
+  pulled_count = 0
+
+  def items():
+    nonlocal pulled_count
+
+    for item in range(1000):
+      pulled_count += 1
+      yield item
+
+  results = analyze.ConcurrentMap(lambda item: item, items(), 4)
+  next(results)
+
+  # One item replaces the first that finished
+  assert pulled_count <= 2 * 4 + 1
+
+  results.close()
+  assert pulled_count <= 2 * 4 + 1
+
+def test_concurrent_map_stops_queueing_when_func_raises():
+  started_items = []
+  lock = threading.Lock()
+
+  def func(item):
+    with lock:
+      started_items.append(item)
+
+    if item == 0:
+      raise ValueError(item)
+
+    time.sleep(0.01)
+    return item
+
+  with pytest.raises(ValueError):
+    for _ in analyze.ConcurrentMap(func, range(1000), 2):
+      pass
+
+  assert len(started_items) < 20
+
+@pytest.fixture(autouse=True)
+def metrics_directory(tmp_path, monkeypatch) -> str:
+  """
+  Saves the metrics summaries written at the end of every update to a temporary directory
+  """
+
+  (tmp_path / 'assets').mkdir()
+  monkeypatch.setattr(analyze, 'CURRENT_DIRECTORY', str(tmp_path))
+
+  return str(tmp_path / 'assets')
+
+def run_commands(monkeypatch, commands):
+  user_inputs = iter(commands + ['quit'])
+  monkeypatch.setattr('builtins.input', lambda prompt='': next(user_inputs))
+
+  analyze.CommandReader()
+
+def test_update_worker_count_applies_to_every_update(monkeypatch):
+  worker_counts = []
+
+  monkeypatch.setattr(analyze, 'UpdateEquitiesData', lambda worker_count, **kwargs: worker_counts.append(('equities', worker_count)))
+  monkeypatch.setattr(analyze, 'UpdateOptionsData', lambda worker_count, **kwargs: worker_counts.append(('options', worker_count)))
+
+  run_commands(monkeypatch, ['update -e -o -w 3', 'update -w 5', 'update -o -w x'])
+
+  assert worker_counts == [('equities', 3), ('options', 3), ('equities', 5), ('options', 5)]
+
+class CountedItems:
+  def __init__(self, count : int):
+    self.PulledCount = 0
+    self.__count = count
+
+  def __iter__(self):
+    for index in range(self.__count):
+      self.PulledCount += 1
+      yield {'Symbol' : f'S{index:03d}', 'Change' : float(index) if index % 3 else None}
+
+@pytest.fixture
+def terminal(monkeypatch):
+  """
+  Makes DisplayItems() prompt for pages like it does in a terminal, answering with the returned list of inputs
+  """
+
+  answers = []
+  monkeypatch.setattr(analyze.sys.stdin, 'isatty', lambda: True)
+  monkeypatch.setattr('builtins.input', lambda prompt='': answers.pop(0))
+
+  return answers
+
+def test_display_items_only_reads_the_pages_shown(terminal, capsys):
+  items = CountedItems(1000)
+  terminal.extend(['', 'q'])
+
+  assert analyze.DisplayItems(items, page_size=10) == False
+
+  # The page after the last one shown is read before asking for it
+  assert items.PulledCount == 30
+  assert capsys.readouterr().out.count('S0') == 20
+
+def test_display_items_prints_every_page_without_a_terminal(monkeypatch, capsys):
+  monkeypatch.setattr(analyze.sys.stdin, 'isatty', lambda: False)
+  items = CountedItems(25)
+
+  assert analyze.DisplayItems(items, page_size=10) == True
+
+  lines = capsys.readouterr().out.splitlines()
+  rows = [line for line in lines if line.startswith('S0')]
+
+  assert items.PulledCount == 25 and len(rows) == 25
+  # Numbers are aligned on the right and missing values on the left
+  assert 'S001         1' in rows and 'S003    N/A' in rows
+
+def test_display_items_prints_nothing_without_items(capsys):
+  assert analyze.DisplayItems([], page_size=10) == True
+  assert capsys.readouterr().out == ''
+
+def read_summaries(directory_path : str) -> list:
+  summaries = []
+
+  for file_name in sorted(os.listdir(directory_path), key=lambda file_name: (len(file_name), file_name)):
+    if not file_name.endswith('.json'):
+      continue
+
+    with open(os.path.join(directory_path, file_name)) as summary_file:
+      summaries.append(json.load(summary_file))
+
+  return summaries
+
+def test_every_update_writes_and_resets_its_metrics(monkeypatch, metrics_directory):
+  def update_equities(worker_count, **kwargs):
+    metrics.IncrementCounter('test.equities_updated', 3)
+
+  monkeypatch.setattr(analyze, 'UpdateEquitiesData', update_equities)
+  metrics.IncrementCounter('test.before_update')
+
+  run_commands(monkeypatch, ['update -e', 'update -e'])
+
+  summaries = read_summaries(metrics_directory)
+
+  assert len(summaries) == 2
+  assert summaries[0]['Counters'] == {'test.before_update' : 1, 'test.equities_updated' : 3}
+  assert summaries[1]['Counters'] == {'test.equities_updated' : 3}
+  assert not metrics.HasMeasurements()
+
+def test_background_update_writes_its_metrics(monkeypatch, metrics_directory):
+  def update_equities(worker_count, db, **kwargs):
+    metrics.IncrementCounter('test.equities_updated')
+
+  monkeypatch.setattr(analyze, 'UpdateEquitiesData', update_equities)
+  monkeypatch.setattr(analyze, 'DATABASE_FILE_PATH', '/assets/securities.db')
+  metrics.Reset()
+
+  run_commands(monkeypatch, ['update -e -bg'])
+
+  for job in analyze.background_jobs.values():
+    job.Join(5)
+
+  summaries = read_summaries(metrics_directory)
+  assert [summary['Counters'] for summary in summaries] == [{'test.equities_updated' : 1}]
+
+def test_run_summary_is_only_written_when_something_was_measured(monkeypatch, metrics_directory):
+  monkeypatch.setattr(analyze, 'CloseLog', lambda: None)
+  metrics.Reset()
+
+  analyze.WriteRunSummary()
+  assert read_summaries(metrics_directory) == []
+
+  metrics.IncrementCounter('test.after_update')
+  analyze.WriteRunSummary()
+
+  assert [summary['Counters'] for summary in read_summaries(metrics_directory)] == [{'test.after_update' : 1}]
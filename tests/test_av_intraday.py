@@ -0,0 +1,59 @@
+import pytest, datetime as dt, av_intraday, fixtures
+
+def weighted_daily_investment(data, capital : float):
+  """
+  The model as it was first written, walking through the bars one at a time
+  """
+
+  get_date = lambda bar_time: dt.datetime.strptime(bar_time, av_intraday.TIME_FORMAT).date()
+  get_weight = lambda n, i: (2 * (n - i + 1)) / (n * (n + 1))
+
+  available_times = list(reversed(list(data.keys())))
+  trading_days = []
+  date_history = []
+  start_date = current_date = get_date(available_times[0])
+
+  # A day is only traded once the next day starts
+  for bar_time in available_times:
+    if get_date(bar_time) != current_date:
+      current_date = get_date(bar_time)
+      trading_days.append(date_history)
+      date_history = []
+
+    date_history.append(data[bar_time])
+
+  uninvested_cash = 0
+
+  for (day_number, day) in enumerate(trading_days, start=1):
+    uninvested_cash += capital * get_weight(len(trading_days), day_number)
+    shares_outstanding = sum(uninvested_cash / len(day) / float(bar['1. open']) for bar in day)
+    uninvested_cash = shares_outstanding * float(day[-1]['4. close'])
+
+  return start_date, current_date, uninvested_cash
+
+@pytest.mark.parametrize('trading_day_count, interval_minutes, seed', [(2, 15, 0), (5, 60, 1), (20, 15, 2), (20, 1, 3)])
+def test_intraday_performance_matches_walking_through_the_bars(trading_day_count, interval_minutes, seed):
+  data = fixtures.MakeIntradayBars(trading_day_count, interval_minutes, seed)
+
+  ticker, start_date, stop_date, portfolio_value, shares_outstanding, cagr = av_intraday.GetIntradayPerformance('AAAA', data, 1000)
+  expected_start_date, expected_stop_date, expected_value = weighted_daily_investment(data, 1000)
+
+  assert (ticker, start_date, stop_date, shares_outstanding) == ('AAAA', expected_start_date, expected_stop_date, 0)
+  assert portfolio_value == pytest.approx(expected_value, rel=1e-11)
+  assert cagr == round(av_intraday.GetCAGR(1000, expected_value, expected_start_date, expected_stop_date), 3)
+
+def test_unfinished_last_day_is_not_traded():
+  data = fixtures.MakeIntradayBars(10, 15, 0)
+  last_day = next(iter(data))[:10]
+
+  # Only the newest day's bars change
+  changed_data = {bar_time : ({**bar, '4. close' : '1.0', '1. open' : '1.0'} if bar_time.startswith(last_day) else bar) for (bar_time, bar) in data.items()}
+
+  assert av_intraday.GetIntradayPerformance('AAAA', changed_data, 1000)[3] == av_intraday.GetIntradayPerformance('AAAA', data, 1000)[3]
+
+def test_get_performance_uses_the_downloaded_bars(monkeypatch):
+  monkeypatch.setattr(av_intraday, 'TimeSeries', fixtures.FakeTimeSeries)
+
+  data, _ = fixtures.FakeTimeSeries().get_intraday('AAAA', interval='15min')
+
+  assert av_intraday.GetPerformance('AAAA', 1000, '15min', api_key='key') == av_intraday.GetIntradayPerformance('AAAA', data, 1000)
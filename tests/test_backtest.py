@@ -0,0 +1,94 @@
+import pytest, datetime as dt, security_db_wrapper as sdw
+
+from dateutil.relativedelta import relativedelta
+
+@pytest.fixture(autouse=True)
+def plain_currency(monkeypatch):
+  # The C locale used by the tests cannot format currency
+  monkeypatch.setattr(sdw.locale, 'currency', lambda value, grouping=False: f'{value:.6f}')
+
+def day_by_day_dca(df, start_date : dt.datetime, principal : float, periodic_investment : float, period : float):
+  """
+  The DCA strategy as it was first written, stepping through the calendar one investment at a time
+  """
+
+  shares_purchased = principal / df['Adj Close'].iloc[0]
+  money_spent = principal
+  current_date = start_date
+
+  while current_date < dt.datetime.now():
+    current_date += relativedelta(days=period)
+
+    try:
+      shares_purchased += periodic_investment / float(df.loc[current_date.strftime('%Y-%m-%d'), 'Adj Close'])
+      money_spent += periodic_investment
+    except KeyError:
+      current_date += relativedelta(days=1)
+
+  return money_spent, shares_purchased
+
+@pytest.mark.parametrize('years, period', [(1, 30), (5, 7), (10, 1), (3, 7.5), (2, 45)])
+def test_dca_buys_on_the_same_days_as_stepping_through_the_calendar(fake_data_reader, years, period):
+  results = sdw.Equity.BacktestDollarCostAveraging('AAAA', f'{years}y', 1000, 100, period)
+
+  df = sdw.Equity.GetHistoricalData('AAAA', f'{years}y')
+  money_spent, shares_purchased = day_by_day_dca(df, dt.datetime.now() + relativedelta(years=-years), 1000, 100, period)
+
+  assert float(results['Money Spent']) == pytest.approx(money_spent)
+  assert results['Shares Purchased'] == round(shares_purchased, 2)
+  assert float(results['Market Value']) == pytest.approx(shares_purchased * df['Adj Close'].iloc[-1])
+
+def test_unknown_symbol_has_no_backtest(monkeypatch):
+  def unknown_symbol(symbol, **kwargs):
+    raise KeyError(symbol)
+
+  monkeypatch.setattr(sdw, 'DataReader', unknown_symbol)
+  monkeypatch.setattr(sdw.Equity, 'price_store', None)
+
+  assert sdw.Equity.BacktestDollarCostAveraging('NOPE', '1y', 1000, 100, 30) == None
+
+def test_sweep_on_prices_matches_each_backtest(fake_data_reader):
+  start_dates, principals, periodic_investments, periods = ['1y', '5y'], [0, 1000], [100], [7, 30]
+  prices = sdw.Equity.GetPricesOverTimeRanges('AAAA', start_dates)
+
+  backtests = sdw.Equity.SweepDollarCostAveragingOnPrices('AAAA', start_dates, prices, principals, periodic_investments, periods)
+
+  assert len(backtests) == 2 * 2 * 2
+
+  for backtest in backtests:
+    results = sdw.Equity.BacktestDollarCostAveraging('AAAA', backtest.StartRange, backtest.Principal, backtest.PeriodicInvestment, backtest.Period)
+
+    assert backtest.StartDate == results['Start Date'].strftime('%Y-%m-%d')
+    assert results['Investment Time'] == f'{backtest.InvestmentYears} years'
+    assert backtest.SharesPurchased == results['Shares Purchased']
+    assert backtest.MarketValue == pytest.approx(float(results['Market Value']), abs=0.01)
+
+def test_sweep_on_prices_does_not_download(fake_data_reader, monkeypatch):
+  prices = sdw.Equity.GetPricesOverTimeRanges('AAAA', ['1y', '5y'])
+
+  def no_downloads(*args, **kwargs):
+    raise AssertionError('downloaded prices')
+
+  monkeypatch.setattr(sdw, 'DataReader', no_downloads)
+
+  # Start dates without prices are skipped
+  backtests = sdw.Equity.SweepDollarCostAveragingOnPrices('AAAA', ['1y', '5y'], [prices[0], None], [1000], [100], [30])
+
+  assert [backtest.StartRange for backtest in backtests] == ['1Y']
+
+def test_backtest_sweep_downloads_in_this_process(fake_data_reader, tmp_path, monkeypatch):
+  import analyze
+
+  db = sdw.SecurityDatabaseWrapper(str(tmp_path / 'securities.db'))
+  monkeypatch.setattr(analyze, 'security_db', db)
+  monkeypatch.setattr(analyze, 'ProgressBar', lambda *args, **kwargs: None)
+
+  symbols = ['AAAA', 'AAAB', 'AAAC', 'AAAD', 'AAAE']
+  analyze.BacktestSweep(symbols, ['1y'], [1000], [100], [7, 30], worker_count=2)
+
+  backtests = db.GetSecurities(sdw.SecurityType.Backtest)
+  db.CloseConnection()
+
+  # Every history was downloaded once by the fake on this process, not by the backtesting processes
+  assert fake_data_reader.CallCount == len(symbols)
+  assert sorted((backtest.Symbol, backtest.Period) for backtest in backtests) == [(symbol, period) for symbol in symbols for period in (7.0, 30.0)]
@@ -0,0 +1,56 @@
+import pytest, json as js, fixtures, av_intraday, run_benchmarks, security_db_wrapper as sdw
+
+@pytest.fixture
+def fake_providers(monkeypatch) -> fixtures.FakeDataReader:
+  """
+  Same as run_benchmarks.UseFakeProviders(), undone after the test
+  """
+
+  data_reader = fixtures.FakeDataReader()
+
+  monkeypatch.setattr(sdw, 'DataReader', data_reader)
+  monkeypatch.setattr(av_intraday, 'TimeSeries', fixtures.FakeTimeSeries)
+  monkeypatch.setattr(sdw.locale, 'currency', lambda value, grouping=False: f'${value:.2f}')
+
+  return data_reader
+
+def test_prepared_histories_are_not_generated_again(monkeypatch):
+  data_reader = fixtures.FakeDataReader(pool_size=2)
+  data_reader.Prepare(['AAAA', 'AAAB', 'AAAC'])
+
+  def no_generating(*args, **kwargs):
+    raise AssertionError('generated a history while timing')
+
+  monkeypatch.setattr(fixtures, 'MakePriceHistory', no_generating)
+
+  assert len(data_reader('AAAB', start='2020-01-01', end='2020-12-31')) > 0
+  assert data_reader.CallCount == 1
+
+def test_prepared_intraday_bars_are_not_generated_again(monkeypatch):
+  fixtures.FakeTimeSeries.Prepare(['AAAA', 'AAAB'], pool_size=2)
+  monkeypatch.setattr(fixtures, 'MakeIntradayBars', lambda *args, **kwargs: pytest.fail('generated bars while timing'))
+
+  assert len(fixtures.FakeTimeSeries(pool_size=2).get_intraday('AAAB')[0]) > 0
+
+def test_parse_chain_benchmark_only_parses(monkeypatch):
+  chain = fixtures.MakeOptionChain('AAAA', strike_count=5, expiration_count=2)
+  monkeypatch.setattr(sdw, 'BlackScholes', lambda *args, **kwargs: pytest.fail('valued the contracts'))
+
+  assert run_benchmarks.BenchmarkParseChains([js.dumps(chain).encode()])() == 2 * 5 * 2
+
+def test_option_benchmarks_use_the_public_api(fake_providers):
+  results = run_benchmarks.RunBenchmarks(scale=0.001, repeat=1, only='option.')
+
+  contract_count = 2 * run_benchmarks.STRIKE_COUNT * run_benchmarks.EXPIRATION_COUNT
+
+  assert set(results) == {'option.parse_chain', 'option.get_option_columns.replay', 'option.get_options.replay'}
+  assert results['option.parse_chain']['Items'] == contract_count
+
+  # Contracts that expire today are left out
+  assert 0 < results['option.get_option_columns.replay']['Items'] <= contract_count
+
+def test_every_benchmark_runs(fake_providers):
+  results = run_benchmarks.RunBenchmarks(scale=0.001, repeat=1)
+
+  assert len(results) == 14 and 'option.get_option_columns.replay' in results
+  assert all(result['Items'] > 0 for result in results.values())
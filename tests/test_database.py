@@ -0,0 +1,152 @@
+import sqlite3, pytest, security_db_wrapper as sdw
+
+from security_db_wrapper import SecurityDatabaseWrapper, SecurityType, RelationalOperator, EquityListing, Equity, Backtest
+
+@pytest.fixture
+def db(tmp_path, monkeypatch) -> SecurityDatabaseWrapper:
+  connect = sqlite3.connect
+
+  # Binds no more parameters per statement than SQLite versions before 3.32 allow
+  def connect_with_old_limits(*args, **kwargs):
+    connection = connect(*args, **kwargs)
+    connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, SecurityDatabaseWrapper.MAX_BOUND_PARAMETERS)
+    return connection
+
+  monkeypatch.setattr(sdw.sqlite3, 'connect', connect_with_old_limits)
+
+  database = SecurityDatabaseWrapper(str(tmp_path / 'securities.db'))
+  yield database
+  database.CloseConnection()
+
+def make_equity(index : int, change : float) -> Equity:
+  return Equity(f'S{index:05d}', f'Company {index}', change, change, change, change, change, change, change, change)
+
+def test_add_new_securities_in_batches(db):
+  added_count = db.AddNewSecurities((make_equity(index, float(index)) for index in range(2500)), batch_size=1000)
+
+  assert added_count == 2500
+  assert len(db.GetSecurities(SecurityType.Equity)) == 2500
+
+def test_upsert_updates_existing_and_adds_new(db):
+  db.AddNewSecurities([make_equity(index, 1.0) for index in range(1500)])
+
+  written_count = db.UpsertSecurities([make_equity(index, 2.0) for index in range(1000, 3000)], batch_size=2500)
+
+  assert written_count == 2000
+
+  equities = {equity.Symbol : equity for equity in db.GetSecurities(SecurityType.Equity)}
+  assert len(equities) == 3000
+  assert getattr(equities['S00999'], '1Y') == 1.0
+  assert getattr(equities['S01000'], '1Y') == 2.0 and getattr(equities['S02999'], '1Y') == 2.0
+
+def test_upsert_keeps_the_last_duplicate_and_counts_it_once(db):
+  securities = [make_equity(index % 1200, float(index)) for index in range(2400)]
+
+  assert db.UpsertSecurities(securities, batch_size=2400) == 1200
+
+  equities = db.GetSecurities(SecurityType.Equity, [('Symbol', RelationalOperator.EqualTo, 'S00005')])
+  assert len(equities) == 1 and getattr(equities[0], '1D') == 1205.0
+
+def test_upsert_matches_every_key_column(db):
+  make_backtest = lambda period, rating: Backtest('MSFT', '1Y', 1000.0, 100.0, period, '2020-01-02', 1.0, 2200.0, 10.0, 2500.0, 300.0, 13.6, rating)
+
+  db.UpsertSecurities([make_backtest(7.0, 'A'), make_backtest(30.0, 'B')], Backtest.KEY_COLUMNS)
+  db.UpsertSecurities([make_backtest(30.0, 'C')], Backtest.KEY_COLUMNS)
+
+  backtests = db.GetSecurities(SecurityType.Backtest, order_by_cols=[('Period', sdw.Ordering.Ascending)])
+  assert [(backtest.Period, backtest.InvestmentRating) for backtest in backtests] == [(7.0, 'A'), (30.0, 'C')]
+
+def get_listings(db) -> dict:
+  return {listing.Symbol : (listing.CompanyName, listing.Delisted) for listing in db.GetSecurities(SecurityType.EquityListing)}
+
+def test_sync_listed_equities_only_writes_changes(db):
+  assert db.SyncListedEquities([EquityListing('AAAA', 'A Inc'), EquityListing('BBBB', 'B Inc')]) == {'Added' : 2, 'Changed' : 0, 'Delisted' : 0}
+
+  # Scraping the same listings again changes nothing
+  assert db.SyncListedEquities([EquityListing('AAAA', 'A Inc'), EquityListing('BBBB', 'B Inc')]) == {'Added' : 0, 'Changed' : 0, 'Delisted' : 0}
+
+  counts = db.SyncListedEquities([EquityListing('AAAA', 'A Corp'), EquityListing('CCCC', 'C Inc'), EquityListing('CCCC', 'C Corp')])
+
+  assert counts == {'Added' : 1, 'Changed' : 1, 'Delisted' : 0}
+  assert get_listings(db) == {'AAAA' : ('A Corp', 0), 'BBBB' : ('B Inc', 0), 'CCCC' : ('C Corp', 0)}
+
+def test_sync_listed_equities_flags_and_relists_delisted_symbols(db):
+  db.SyncListedEquities([EquityListing('AAAA', 'A Inc'), EquityListing('BBBB', 'B Inc')])
+
+  assert db.SyncListedEquities([EquityListing('AAAA', 'A Inc')], flag_delisted=True)['Delisted'] == 1
+  assert db.SyncListedEquities([EquityListing('AAAA', 'A Inc')], flag_delisted=True)['Delisted'] == 0
+  assert get_listings(db)['BBBB'] == ('B Inc', 1)
+
+  assert db.SyncListedEquities([EquityListing('AAAA', 'A Inc'), EquityListing('BBBB', 'B Inc')]) == {'Added' : 0, 'Changed' : 1, 'Delisted' : 0}
+  assert get_listings(db)['BBBB'] == ('B Inc', 0)
+
+def test_update_skips_delisted_equities(db, fake_data_reader):
+  import analyze
+
+  db.SyncListedEquities([EquityListing('AAAA', 'A Inc'), EquityListing('BBBB', 'B Inc')])
+  db.SyncListedEquities([EquityListing('AAAA', 'A Inc')], flag_delisted=True)
+
+  analyze.UpdateEquitiesData(db=db, worker_count=2, status_func=lambda message: None, progress_func=lambda *args, **kwargs: None)
+
+  assert [equity.Symbol for equity in db.GetSecurities(SecurityType.Equity)] == ['AAAA']
+
+def test_missing_performance_is_stored_as_null(db):
+  db.AddNewSecurities([make_equity(0, 1.0)])
+  db.ModifySecurities(Equity('S00000', 'Company 0', 2.5, None, 10, None, None, None, None, -1.25), ('Symbol', RelationalOperator.EqualTo, 'S00000'))
+
+  stored_types = db.ExecuteSQLStatement("""SELECT typeof("1D") AS "1D", typeof("1W") AS "1W", typeof("1M") AS "1M", typeof(Max) AS Max FROM Equities""")
+  assert stored_types == [{'1D' : 'real', '1W' : 'null', '1M' : 'real', 'Max' : 'real'}]
+
+def test_performance_sorts_as_numbers_without_nulls(db):
+  changes = [10.0, 9.0, None, -2.5, 100.0, None, 0.5]
+  db.AddNewSecurities([make_equity(index, change) for (index, change) in enumerate(changes, start=0)])
+
+  equities = db.GetSecurities(SecurityType.Equity, [('1Y', RelationalOperator.IsNot, None)], [('1Y', sdw.Ordering.Descending)])
+
+  assert [getattr(equity, '1Y') for equity in equities] == [100.0, 10.0, 9.0, 0.5, -2.5]
+
+def test_update_single_equity_stores_numbers(db, fake_data_reader):
+  import analyze
+
+  db.AddNewSecurities([Equity('AAAA', 'A Inc', None, None, None, None, None, None, None, None)])
+  analyze.UpdateSingleEquity('AAAA', db=db)
+
+  equity = db.GetSecurities(SecurityType.Equity)[0]
+  stored_types = db.ExecuteSQLStatement("""SELECT DISTINCT typeof("1D") AS type FROM Equities UNION SELECT DISTINCT typeof(Max) FROM Equities""")
+
+  assert getattr(equity, '1D') == sdw.Equity.GetPercentChangeOverTimeRanges('AAAA', ['1D'])[0]
+  assert stored_types == [{'type' : 'real'}]
+
+SLICES = [slice(None), slice(None, 10), slice(5, 15), slice(-7, None), slice(None, -3), slice(-12, -4), slice(3, None, 4),
+          slice(None, None, -1), slice(15, 2, -3), slice(40, 50), slice(-100, 5), slice(8, 3), slice(2, 20, 7)]
+
+@pytest.mark.parametrize('sel_slice', SLICES, ids=str)
+def test_slices_read_the_same_rows_as_python_slicing(db, sel_slice):
+  db.AddNewSecurities([make_equity(index, float(index)) for index in range(25)])
+  ordering = [('1Y', sdw.Ordering.Descending)]
+
+  all_symbols = [equity.Symbol for equity in db.GetSecurities(SecurityType.Equity, order_by_cols=ordering)]
+  sliced_symbols = [equity.Symbol for equity in db.GetSecurities(SecurityType.Equity, order_by_cols=ordering, sel_slice=sel_slice)]
+
+  assert sliced_symbols == all_symbols[sel_slice]
+
+def test_limit_and_offset_page_through_the_rows(db):
+  db.AddNewSecurities([make_equity(index, float(index)) for index in range(25)])
+  ordering = [('1Y', sdw.Ordering.Ascending)]
+
+  pages = [db.GetSecurities(SecurityType.Equity, order_by_cols=ordering, limit=10, offset=offset) for offset in range(0, 25, 10)]
+
+  assert [len(page) for page in pages] == [10, 10, 5]
+  assert [equity.Symbol for page in pages for equity in page] == [f'S{index:05d}' for index in range(25)]
+
+def test_iterate_securities_streams_rows(db):
+  db.AddNewSecurities([make_equity(index, float(index)) for index in range(2500)])
+
+  securities = db.IterateSecurities(SecurityType.Equity)
+  first_equity = next(securities)
+
+  # Other statements can run while the rows are still being read
+  db.AddNewSecurities([make_equity(2500, 0.0)])
+
+  assert first_equity.Symbol == 'S00000'
+  assert len(list(securities)) >= 2499
@@ -0,0 +1,32 @@
+import pandas as pd, security_db_wrapper as sdw
+
+TIME_RANGES = ['1D', '1W', '1M', '3M', '1Y', '5Y', '10Y', 'Max']
+
+def test_time_ranges_are_sliced_from_one_download(fake_data_reader):
+  historical_data = sdw.Equity.GetHistoricalDataOverTimeRanges('AAAA', TIME_RANGES)
+
+  assert fake_data_reader.CallCount == 1
+
+  for (time_range, df) in zip(TIME_RANGES, historical_data):
+    expected_df = sdw.Equity.GetHistoricalData('AAAA', time_range)
+
+    if expected_df is None:
+      assert df is None
+    else:
+      pd.testing.assert_frame_equal(df, expected_df)
+
+def test_percent_changes_match_one_download_per_time_range(fake_data_reader):
+  single_fetch = sdw.Equity.GetPercentChangeOverTimeRanges('AAAB', TIME_RANGES)
+  fetch_per_time_range = sdw.Equity.GetPercentChangeOverTimeRanges('AAAB', TIME_RANGES, single_fetch=False)
+
+  assert single_fetch == fetch_per_time_range
+  assert fake_data_reader.CallCount == 1 + len(TIME_RANGES)
+
+def test_unknown_symbol_has_no_percent_changes(monkeypatch):
+  def unknown_symbol(symbol, **kwargs):
+    raise KeyError(symbol)
+
+  monkeypatch.setattr(sdw, 'DataReader', unknown_symbol)
+  monkeypatch.setattr(sdw.Equity, 'price_store', None)
+
+  assert sdw.Equity.GetPercentChangeOverTimeRanges('NOPE', TIME_RANGES) == [None] * len(TIME_RANGES)
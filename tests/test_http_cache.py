@@ -0,0 +1,201 @@
+import os, time, pytest, requests, contextlib, datetime as dt, http_cache
+
+from providers import Provider
+from http_cache import ResponseCache, CacheMode, CachedSession, GetCacheKey
+
+class CountingAdapter(requests.adapters.BaseAdapter):
+  """
+  Answers every request with its URL as the body, or the given status code, and counts the requests sent
+  """
+
+  def __init__(self, status_code = 200):
+    super().__init__()
+    self.SentCount = 0
+    self.StatusCode = status_code
+
+  def send(self, request, **kwargs):
+    self.SentCount += 1
+
+    response = requests.Response()
+    response.url = request.url
+    response.request = request
+    response.status_code = self.StatusCode
+    response._content = request.url.encode() * 10
+    response.headers['Content-Type'] = 'text/plain'
+
+    return response
+
+  def close(self):
+    pass
+
+@pytest.fixture
+def cache(tmp_path) -> ResponseCache:
+  response_cache = ResponseCache(str(tmp_path / 'http_cache'))
+  http_cache.SetCache(response_cache)
+
+  yield response_cache
+
+  http_cache.SetCache(None)
+
+@pytest.fixture
+def throttled(monkeypatch) -> list:
+  """
+  Records the provider of every request that waited on a provider's limits
+  """
+
+  throttled_providers = []
+
+  @contextlib.contextmanager
+  def record_throttle(provider):
+    throttled_providers.append(provider)
+    yield
+
+  monkeypatch.setattr(http_cache, 'Throttle', record_throttle)
+
+  return throttled_providers
+
+def make_session(provider = Provider.Yahoo, status_code = 200):
+  adapter = CountingAdapter(status_code)
+  session = CachedSession(provider)
+  session.mount('https://', adapter)
+
+  return session, adapter
+
+def test_cache_key_ignores_param_order_and_credentials():
+  key = GetCacheKey('GET', 'https://api.example.com/chains?symbol=MSFT', {'apikey' : 'a', 'strikeCount' : 50})
+
+  assert key == GetCacheKey('get', 'https://API.example.com/chains', {'strikeCount' : '50', 'symbol' : 'MSFT', 'apikey' : 'b'})
+  assert key != GetCacheKey('GET', 'https://api.example.com/chains', {'strikeCount' : 50, 'symbol' : 'AAPL'})
+  assert key != GetCacheKey('POST', 'https://api.example.com/chains?symbol=MSFT', {'strikeCount' : 50})
+
+def test_cache_key_compares_date_params_by_day():
+  morning, evening = dt.datetime(2020, 5, 1, 9, 30), dt.datetime(2020, 5, 1, 16, 0)
+
+  assert GetCacheKey('GET', 'https://x.com/a', {'fromDate' : morning}) == GetCacheKey('GET', 'https://x.com/a', {'fromDate' : evening})
+  assert GetCacheKey('GET', 'https://x.com/a', {'period1' : 1588325400}) == GetCacheKey('GET', 'https://x.com/a', {'period1' : 1588348800})
+  assert GetCacheKey('GET', 'https://x.com/a', {'fromDate' : morning}) != GetCacheKey('GET', 'https://x.com/a', {'fromDate' : morning + dt.timedelta(days=1)})
+
+def test_ttl_is_found_by_url_pattern(cache):
+  assert cache.GetTTL('https://api.tdameritrade.com/v1/marketdata/chains?symbol=MSFT') == 15 * 60
+  assert cache.GetTTL('https://query1.finance.yahoo.com/v7/finance/download/MSFT') == 6 * 60 * 60
+  assert cache.GetTTL('https://example.com/') == http_cache.DEFAULT_TTL
+
+def test_daily_prices_ending_today_are_never_used_from_the_cache(cache):
+  session, adapter = make_session()
+  url = 'https://query1.finance.yahoo.com/v7/finance/download/MSFT'
+  now = dt.datetime.now(dt.timezone.utc)
+
+  # Downloaded while the day's prices could still change, then asked for again later in the day
+  for _ in range(2):
+    session.get(url, params={'period1' : int((now - dt.timedelta(days=30)).timestamp()), 'period2' : int(now.timestamp())})
+
+  assert adapter.SentCount == 2
+  assert cache.GetTTL(url, {'period2' : int(now.timestamp())}) == 0
+
+  # Ranges that ended before today do not change
+  for _ in range(2):
+    session.get(url, params={'period1' : int((now - dt.timedelta(days=30)).timestamp()), 'period2' : int((now - dt.timedelta(days=3)).timestamp())})
+
+  assert adapter.SentCount == 3
+
+def test_responses_ending_today_are_still_replayed(cache):
+  session, adapter = make_session()
+  url = f'https://query1.finance.yahoo.com/v7/finance/download/MSFT?period2={int(time.time())}'
+
+  session.get(url)
+  cache.Mode = CacheMode.Replay
+
+  assert session.get(url).status_code == 200 and adapter.SentCount == 1
+
+def test_end_dates_are_compared_by_day():
+  today = dt.date.today()
+
+  assert http_cache.EndsToday('https://x.com/a', {'toDate' : dt.datetime.now() + dt.timedelta(days=90)})
+  assert http_cache.EndsToday(f'https://x.com/a?period2={int(time.time())}')
+  assert not http_cache.EndsToday('https://x.com/a', {'toDate' : today - dt.timedelta(days=2), 'fromDate' : today})
+  assert not http_cache.EndsToday('https://x.com/a')
+
+def test_cached_responses_are_used_until_they_expire(cache):
+  session, adapter = make_session()
+  cache.TTLs = {r'example\.com' : 60}
+
+  first_response = session.get('https://example.com/a', params={'x' : 1})
+  second_response = session.get('https://example.com/a', params={'x' : 1})
+
+  assert adapter.SentCount == 1 and second_response.content == first_response.content
+
+  cache.TTLs = {r'example\.com' : 0}
+  time.sleep(0.01)
+  session.get('https://example.com/a', params={'x' : 1})
+
+  assert adapter.SentCount == 2
+
+def test_cache_hits_do_not_wait_on_the_provider(cache, throttled):
+  session, adapter = make_session(Provider.TDAmeritrade)
+  cache.TTLs = {r'example\.com' : 60}
+
+  for _ in range(5):
+    session.get('https://example.com/chains', params={'symbol' : 'MSFT'})
+
+  assert adapter.SentCount == 1
+  assert throttled == [Provider.TDAmeritrade]
+
+def test_replayed_requests_are_never_sent_or_throttled(cache, throttled):
+  session, adapter = make_session()
+
+  cache.Mode = CacheMode.Record
+  session.get('https://example.com/a')
+  session.get('https://example.com/a')
+
+  cache.Mode = CacheMode.Replay
+  assert session.get('https://example.com/a').status_code == 200
+  assert session.get('https://example.com/b').status_code == 504
+
+  assert adapter.SentCount == 2 and len(throttled) == 2
+
+def test_sessions_without_a_provider_are_not_throttled(cache, throttled):
+  session, adapter = make_session(provider=None)
+
+  session.get('https://example.com/a')
+
+  assert adapter.SentCount == 1 and throttled == []
+
+def test_only_successful_responses_are_cached(cache, throttled, monkeypatch):
+  monkeypatch.setattr(http_cache, 'PauseIfRateLimited', lambda provider, response: None)
+  session, adapter = make_session(status_code=429)
+  cache.TTLs = {r'example\.com' : 60}
+
+  session.get('https://example.com/a')
+  session.get('https://example.com/a')
+
+  assert adapter.SentCount == 2
+
+def test_least_recently_used_responses_are_evicted(cache):
+  session, adapter = make_session(provider=None)
+  cache.TTLs = {r'example\.com' : 60}
+
+  session.get('https://example.com/a')
+  cache.MaxSize = 2.5 * os.path.getsize(next(os.scandir(cache.Summary()['Location'])).path)
+
+  session.get('https://example.com/b')
+  session.get('https://example.com/a')
+  session.get('https://example.com/c')
+
+  # 'b' was used least recently, so it is the one evicted
+  assert cache.Summary()['Responses'] == 2
+  session.get('https://example.com/a')
+  session.get('https://example.com/c')
+  assert adapter.SentCount == 3
+
+  session.get('https://example.com/b')
+  assert adapter.SentCount == 4
+
+def test_cache_is_reloaded_from_disk(cache):
+  session, adapter = make_session(provider=None)
+  cache.TTLs = {r'example\.com' : 60}
+  session.get('https://example.com/a')
+
+  http_cache.SetCache(ResponseCache(cache.Summary()['Location'], ttls={r'example\.com' : 60}))
+  session.get('https://example.com/a')
+
+  assert adapter.SentCount == 1
@@ -0,0 +1,86 @@
+import time, pytest, threading, datetime as dt
+
+from jobs import BackgroundJob
+from security_db_wrapper import SecurityDatabaseWrapper, SecurityType, Equity
+
+def make_equity(index : int) -> Equity:
+  return Equity(f'S{index:05d}', f'Company {index}', 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0)
+
+def test_finished_job_summary():
+  def update(job):
+    job.UpdateStatus('Updating...')
+    job.UpdateProgress(5, 10, dt.datetime.now(), message='Processing MSFT')
+
+  job = BackgroundJob('update -e', update)
+  job.Join(5)
+
+  summary = job.Summary()
+  assert (summary['Command'], summary['State'], summary['Status']) == ('update -e', 'Finished', 'Updating... Processing MSFT')
+
+  # Progress is only shown while the job runs
+  assert summary['Progress'] == ''
+
+def test_failed_job_keeps_its_error():
+  def update(job):
+    raise ValueError('no connection')
+
+  job = BackgroundJob('update -o', update)
+  job.Join(5)
+
+  assert job.GetState() == 'Failed'
+  assert job.Summary()['Status'] == 'ValueError: no connection'
+
+def test_cancelled_job_stops_at_its_next_check():
+  started = threading.Event()
+  checked_count = 0
+
+  def update(job):
+    nonlocal checked_count
+    started.set()
+
+    while not job.cancel_event.is_set():
+      checked_count += 1
+      job.UpdateProgress(checked_count, 10 ** 9, dt.datetime.now())
+      time.sleep(0.01)
+
+    time.sleep(0.1)
+
+  job = BackgroundJob('update -e', update)
+  started.wait(5)
+
+  assert job.GetState() == 'Running' and job.Summary()['Progress'] != ''
+
+  job.Cancel()
+  assert job.GetState() == 'Cancelling'
+
+  job.Join(5)
+  assert job.GetState() == 'Cancelled'
+
+def test_job_ids_are_unique():
+  jobs = [BackgroundJob('jobs', lambda job: None) for _ in range(3)]
+
+  assert len(set(job.Id for job in jobs)) == 3
+
+def test_reads_are_not_blocked_by_a_write_in_progress(tmp_path):
+  database_path = str(tmp_path / 'securities.db')
+  writer, reader = SecurityDatabaseWrapper(database_path), SecurityDatabaseWrapper(database_path)
+
+  writer.AddNewSecurities([make_equity(index) for index in range(10)])
+
+  # A background update's batch that is not committed yet
+  writer.ExecuteSQLStatement("BEGIN IMMEDIATE")
+  writer.ExecuteSQLStatement("INSERT INTO Equities (Symbol, CompanyName) VALUES ('NEW', 'New Company')")
+
+  start_time = time.monotonic()
+  equities = reader.GetSecurities(SecurityType.Equity)
+
+  assert time.monotonic() - start_time < 1
+  assert len(equities) == 10
+
+  writer.Save()
+  assert len(reader.GetSecurities(SecurityType.Equity)) == 11
+
+  assert reader.ExecuteSQLStatement("PRAGMA journal_mode") == [{'journal_mode' : 'wal'}]
+
+  writer.CloseConnection()
+  reader.CloseConnection()
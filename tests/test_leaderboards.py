@@ -0,0 +1,141 @@
+import pytest, numpy as np, datetime as dt
+
+from security_db_wrapper import SecurityDatabaseWrapper, SecurityType, RelationalOperator, Equity, Option
+
+@pytest.fixture
+def db(tmp_path) -> SecurityDatabaseWrapper:
+  database = SecurityDatabaseWrapper(str(tmp_path / 'securities.db'))
+  yield database
+  database.CloseConnection()
+
+def ranked_symbols(db, table_name : str, col_name : str, descending = True, type_filter = None, count = 100) -> list:
+  """
+  The symbols a board should hold, by sorting the whole table
+  """
+
+  table_filter = f"AND Type = '{type_filter}'" if type_filter != None else ''
+  rows = db.ExecuteSQLStatement(f"""SELECT Symbol FROM {table_name} WHERE "{col_name}" IS NOT NULL {table_filter}
+                                    ORDER BY "{col_name}" {'DESC' if descending else 'ASC'} LIMIT {count}""")
+
+  return [row['Symbol'] for row in rows]
+
+def board_entries(db) -> dict:
+  return {board['Board'] : board['Entries'] for board in db.GetLeaderboards()}
+
+def make_options(count : int, seed = 0) -> list:
+  rng = np.random.default_rng(seed)
+  today = dt.date.today()
+
+  # Ratings are unique so every board has one right order
+  ratings = rng.permutation(count) / 10
+  expiration_days = rng.integers(-20, 60, count)
+
+  options = []
+  for index in range(count):
+    expiration_date = None if index % 17 == 0 else (today + dt.timedelta(days=int(expiration_days[index]))).isoformat()
+    options.append(Option(CompanySymbol='AAAA', Type='CALL' if index % 2 else 'PUT', Description=f'Option {index}', Symbol=f'O{index:05d}',
+                          BlackScholesValue=1.0, TDAmeritrade=1.0, Premium=1.0, ContractRating=float(ratings[index]),
+                          ExpirationDate=expiration_date, Strike=100.0))
+
+  return options
+
+def test_boards_hold_the_best_rows_of_their_table(db):
+  db.AddNewSecurities([Equity(f'S{index:05d}', f'Company {index}', *([float((index * 37) % 500)] * 8)) for index in range(500)])
+  db.AddNewSecurities(make_options(600))
+
+  assert [equity.Symbol for equity in db.GetLeaderboard('1Y')] == ranked_symbols(db, 'Equities', '1Y')
+  assert [equity.Symbol for equity in db.GetLeaderboard('-1Y')] == ranked_symbols(db, 'Equities', '1Y', descending=False)
+  assert [option.Symbol for option in db.GetLeaderboard('Calls')] == ranked_symbols(db, 'Options', 'ContractRating', type_filter='CALL')
+  assert [option.Symbol for option in db.GetLeaderboard('Puts', count=10)] == ranked_symbols(db, 'Options', 'ContractRating', type_filter='PUT', count=10)
+
+  assert set(board_entries(db).values()) == {100}
+
+def test_boards_follow_updates_and_deletes(db):
+  db.AddNewSecurities([Equity(f'S{index:05d}', f'Company {index}', *([float(index)] * 8)) for index in range(300)])
+
+  # The best rows leave the board, and one from below the board takes the lead
+  db.DeleteSecuritiesConditional(SecurityType.Equity, [('1Y', RelationalOperator.GreaterThan, 280.0)])
+  db.ModifySecurities(Equity('S00010', 'Company 10', *([1000.0] * 8)), ('Symbol', RelationalOperator.EqualTo, 'S00010'))
+
+  assert [equity.Symbol for equity in db.GetLeaderboard('1D')] == ranked_symbols(db, 'Equities', '1D')
+  assert [equity.Symbol for equity in db.GetLeaderboard('-1D')] == ranked_symbols(db, 'Equities', '1D', descending=False)
+
+def test_deleting_expired_options_refills_the_boards(db):
+  db.AddNewSecurities(make_options(1000))
+  expired_before = dt.date.today()
+
+  expired_symbols = {row['Symbol'] for row in db.ExecuteSQLStatement(f"""SELECT Symbol FROM Options
+                                                                          WHERE ExpirationDate < '{expired_before.isoformat()}' OR ExpirationDate IS NULL""")}
+
+  # Most of the boards are expired options, so the purge has to refill them from deeper in the table
+  assert len(expired_symbols & {option.Symbol for option in db.GetLeaderboard('Calls')}) > 10
+
+  assert db.DeleteExpiredOptions(expired_before) == len(expired_symbols)
+
+  for (board, type_filter) in [('Calls', 'CALL'), ('Puts', 'PUT')]:
+    symbols = [option.Symbol for option in db.GetLeaderboard(board)]
+
+    assert symbols == ranked_symbols(db, 'Options', 'ContractRating', type_filter=type_filter)
+    assert not expired_symbols & set(symbols)
+
+  assert board_entries(db)['Calls'] == 100 and board_entries(db)['Puts'] == 100
+
+def test_deleting_every_option_empties_the_boards(db):
+  db.AddNewSecurities(make_options(50))
+
+  db.DeleteExpiredOptions(dt.date.today() + dt.timedelta(days=365))
+
+  assert db.GetLeaderboard('Calls') == [] and db.GetLeaderboard('Puts') == []
+  assert board_entries(db)['Calls'] == 0 and board_entries(db)['Puts'] == 0
+  assert db.ExecuteSQLStatement("SELECT COUNT(*) AS count FROM Leaderboards WHERE Board IN ('Calls', 'Puts')") == [{'count' : 0}]
+
+def delete_every_third_equity(db) -> None:
+  # Gaps in the rowids are what VACUUM closes up by renumbering the rows of a table without an INTEGER PRIMARY KEY
+  db.ExecuteSQLStatement('DELETE FROM Equities WHERE CAST(substr(Symbol, 2) AS INTEGER) % 3 = 0')
+  db.Save()
+
+def vacuum(db) -> None:
+  # SQLite happens to keep the rowids of tables with an index, but not those of tables without one
+  for row in db.ExecuteSQLStatement("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'Equities' AND sql IS NOT NULL"):
+    db.ExecuteSQLStatement(f'DROP INDEX "{row["name"]}"')
+
+  db.Save()
+  db.ExecuteSQLStatement('VACUUM')
+
+def test_boards_survive_vacuum(db):
+  db.AddNewSecurities([Equity(f'S{index:05d}', f'Company {index}', *([float((index * 37) % 500)] * 8)) for index in range(500)])
+  db.AddNewSecurities(make_options(600))
+  delete_every_third_equity(db)
+  db.DeleteExpiredOptions(dt.date.today())
+
+  vacuum(db)
+
+  assert [equity.Symbol for equity in db.GetLeaderboard('1Y')] == ranked_symbols(db, 'Equities', '1Y')
+  assert [equity.Symbol for equity in db.GetLeaderboard('-Max')] == ranked_symbols(db, 'Equities', 'Max', descending=False)
+  assert [option.Symbol for option in db.GetLeaderboard('Calls')] == ranked_symbols(db, 'Options', 'ContractRating', type_filter='CALL')
+
+def test_boards_made_before_the_tables_were_keyed_survive_vacuum(tmp_path, monkeypatch):
+  import db_migrations
+
+  database_path = str(tmp_path / 'securities.db')
+  all_migrations = db_migrations.MIGRATIONS
+
+  # Boards made by the version before the tables had an INTEGER PRIMARY KEY
+  monkeypatch.setattr(db_migrations, 'MIGRATIONS', all_migrations[:all_migrations.index(db_migrations.__key_leaderboard_tables)])
+  db = SecurityDatabaseWrapper(database_path)
+  db.AddNewSecurities([Equity(f'S{index:05d}', f'Company {index}', *([float((index * 37) % 500)] * 8)) for index in range(500)])
+  delete_every_third_equity(db)
+  db.CloseConnection()
+
+  monkeypatch.setattr(db_migrations, 'MIGRATIONS', all_migrations)
+  db = SecurityDatabaseWrapper(database_path)
+  vacuum(db)
+
+  assert [equity.Symbol for equity in db.GetLeaderboard('1D')] == ranked_symbols(db, 'Equities', '1D')
+
+  # The boards still follow changes after the tables were rebuilt
+  db.ModifySecurities(Equity('S00010', 'Company 10', *([1000.0] * 8)), ('Symbol', RelationalOperator.EqualTo, 'S00010'))
+  assert [equity.Symbol for equity in db.GetLeaderboard('1D', count=3)] == ranked_symbols(db, 'Equities', '1D', count=3)
+  assert board_entries(db)['1D'] == 100
+
+  db.CloseConnection()
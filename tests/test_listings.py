@@ -0,0 +1,88 @@
+import time, pytest, requests, threading, json as js, security_db_wrapper as sdw
+
+from urllib.parse import urlsplit, parse_qsl
+from security_db_wrapper import EquityListing
+
+class NasdaqAdapter(requests.adapters.BaseAdapter):
+  """
+  Answers NASDAQ's stock and ETF screeners with made up listings. Later pages answer sooner, so pages
+  finish out of order. Every URL requested is recorded
+  """
+
+  def __init__(self, stock_count : int, etf_count : int):
+    super().__init__()
+    self.StockCount = stock_count
+    self.EtfCount = etf_count
+    self.Urls = []
+    self.__lock = threading.Lock()
+
+  def send(self, request, **kwargs):
+    with self.__lock:
+      self.Urls.append(request.url)
+
+    split_url = urlsplit(request.url)
+    query = dict(parse_qsl(split_url.query))
+
+    if split_url.path.endswith('/etf'):
+      offset = int(query['offset'])
+      rows = [{'symbol' : f'E{index:04d}', 'companyName' : None if index % 7 == 0 else f'ETF {index}'} for index in range(offset, min(offset + 50, self.EtfCount))]
+      body = {'data' : {'records' : {'totalrecords' : self.EtfCount, 'data' : {'rows' : rows}}}}
+      delay = 0.02 / (1 + offset // 50)
+    else:
+      page, page_size = int(query['page']), int(query['pageSize'])
+      rows = [{'ticker' : f'S{index:04d}', 'company' : f'Stock {index}'} for index in range((page - 1) * page_size, min(page * page_size, self.StockCount))]
+      body = {'count' : self.StockCount, 'data' : rows}
+      delay = 0.02 / page
+
+    time.sleep(delay)
+
+    response = requests.Response()
+    response.url = request.url
+    response.request = request
+    response.status_code = 200
+    response._content = js.dumps(body).encode()
+
+    return response
+
+  def close(self):
+    pass
+
+@pytest.fixture
+def nasdaq(monkeypatch) -> NasdaqAdapter:
+  adapter = NasdaqAdapter(stock_count=1150, etf_count=420)
+  monkeypatch.setattr(sdw.requests.adapters, 'HTTPAdapter', lambda **kwargs: adapter)
+
+  return adapter
+
+def test_pages_are_merged_in_page_order(nasdaq):
+  listings = EquityListing.GetListedEquities()
+
+  # The last page of each is not requested, as it never was
+  stock_page_count, etf_page_count = int(1150 / 200 + 0.9) - 1, int(420 / 50 + 0.9) - 1
+  expected_symbols = [f'S{index:04d}' for index in range(stock_page_count * 200)] + [f'E{index:04d}' for index in range(etf_page_count * 50)]
+
+  assert [listing.Symbol for listing in listings] == expected_symbols
+  assert all(listing.CompanyName == 'N/A' for listing in listings if listing.Symbol.startswith('E') and int(listing.Symbol[1:]) % 7 == 0)
+
+def test_every_page_is_requested_once(nasdaq):
+  EquityListing.GetListedEquities()
+
+  stock_urls = ['https://www.nasdaq.com/api/v1/screener?page=1&pageSize=1'] + [f'https://www.nasdaq.com/api/v1/screener?page={page}&pageSize=200' for page in range(1, 6)]
+  # The ETFs' first page is requested again for its listings, as it always was
+  etf_urls = ['https://api.nasdaq.com/api/screener/etf?offset=0'] + [f'https://api.nasdaq.com/api/screener/etf?offset={offset}' for offset in range(0, 400, 50)]
+
+  assert sorted(nasdaq.Urls) == sorted(stock_urls + etf_urls)
+
+def test_progress_counts_every_page(nasdaq):
+  progress = []
+  lock = threading.Lock()
+
+  def progress_func(done, total, start_time):
+    with lock:
+      progress.append((done, total))
+
+  EquityListing.GetListedEquities(progress_func=progress_func)
+
+  assert sorted(done for (done, _) in progress) == list(range(1, 5 + 8 + 1))
+  assert max(progress) == (13, 13)
+  assert all(done <= total for (done, total) in progress)
@@ -0,0 +1,101 @@
+import sqlite3, pytest, db_migrations
+
+from security_db_wrapper import SecurityDatabaseWrapper
+
+LEGACY_LAST_UPDATED = '2020-01-02 03:04:05'
+
+@pytest.fixture
+def legacy_db_path(tmp_path) -> str:
+  """
+  A database as this program made it before the schema was versioned, with the duplicate rows and
+  'N/A' text that versions before then left behind
+  """
+
+  database_path = str(tmp_path / 'legacy.db')
+  connection = sqlite3.connect(database_path)
+
+  connection.executescript("""
+    CREATE TABLE ListedEquities (Symbol CHAR(10), CompanyName CHAR(255));
+    CREATE TABLE Equities (Symbol CHAR(10), CompanyName CHAR(255), '1D' FLOAT(5), '1W' FLOAT(5), '1M' FLOAT(5), '3M' FLOAT(5),
+                           '1Y' FLOAT(5), '5Y' FLOAT(5), '10Y' FLOAT(5), Max FLOAT(5), LastUpdated DATETIME DEFAULT CURRENT_TIMESTAMP);
+    CREATE TABLE Options (CompanySymbol CHAR(10), Type CHAR(4), Description CHAR(255), Symbol CHAR(255), BlackScholesValue FLOAT(10),
+                          TDAmeritrade FLOAT(10), Premium FLOAT(10), ContractRating FLOAT(20), LastUpdated DATETIME DEFAULT CURRENT_TIMESTAMP);
+  """)
+
+  connection.executemany("INSERT INTO ListedEquities VALUES (?, ?)", [('MSFT', 'Microsoft'), ('AAPL', 'Apple'), ('MSFT', 'Microsoft Corp')])
+  connection.executemany("INSERT INTO Equities VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+    ('MSFT', 'Microsoft', 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, LEGACY_LAST_UPDATED),
+    ('MSFT', 'Microsoft', '1.5', 'N/A', 3.0, 4.0, 5.0, 6.0, 'N/A', 8.0, LEGACY_LAST_UPDATED),
+    ('AAPL', 'Apple', -1.0, 'N/A', 'N/A', 'N/A', 'N/A', 'N/A', 'N/A', 'N/A', LEGACY_LAST_UPDATED)
+  ])
+  connection.executemany("INSERT INTO Options VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+    ('MSFT', 'CALL', 'MSFT May 22 2020 162.5 Call (Weekly)', 'MSFT_052220C162.5', 1.0, 1.1, 0.1, 3.0, LEGACY_LAST_UPDATED),
+    ('MSFT', 'PUT', 'MSFT Jan 15 2021 100 Put', 'MSFT_011521P100', 2.0, 2.1, 0.2, 1.0, LEGACY_LAST_UPDATED)
+  ])
+
+  connection.commit()
+  connection.close()
+
+  return database_path
+
+def test_legacy_database_is_migrated_in_place(legacy_db_path):
+  SecurityDatabaseWrapper(legacy_db_path).CloseConnection()
+
+  connection = sqlite3.connect(legacy_db_path)
+
+  assert db_migrations.GetSchemaVersion(connection) == len(db_migrations.MIGRATIONS)
+  assert connection.execute("SELECT Symbol, CompanyName, Delisted FROM ListedEquities ORDER BY Symbol").fetchall() == [('AAPL', 'Apple', 0), ('MSFT', 'Microsoft Corp', 0)]
+
+  # The most recent duplicate is kept, with its missing data as NULL and its text as numbers
+  assert connection.execute("""SELECT Symbol, "1D", "1W", "10Y", LastUpdated FROM Equities ORDER BY Symbol""").fetchall() == [
+    ('AAPL', -1.0, None, None, LEGACY_LAST_UPDATED), ('MSFT', 1.5, None, None, LEGACY_LAST_UPDATED)]
+
+  assert connection.execute("SELECT ExpirationDate, Strike, ImpliedVolatility, LastUpdated FROM Options ORDER BY rowid").fetchall() == [
+    ('2020-05-22', 162.5, None, LEGACY_LAST_UPDATED), ('2021-01-15', 100.0, None, LEGACY_LAST_UPDATED)]
+
+  index_names = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+  assert {'ListedEquities_Symbol', 'Equities_Symbol', 'Equities_LastUpdated', 'Options_CompanySymbol', 'Options_Symbol',
+          'Backtests_Key', 'Options_ExpirationDate', 'Equities_1Y', 'Options_ContractRating'} <= index_names
+
+  connection.close()
+
+def test_migrated_database_runs_no_steps_again(legacy_db_path):
+  SecurityDatabaseWrapper(legacy_db_path).CloseConnection()
+
+  connection = sqlite3.connect(legacy_db_path)
+  assert db_migrations.Migrate(connection) == 0
+  connection.close()
+
+def test_new_database_runs_every_step(tmp_path):
+  connection = sqlite3.connect(str(tmp_path / 'new.db'))
+
+  assert db_migrations.Migrate(connection) == len(db_migrations.MIGRATIONS)
+  assert db_migrations.GetSchemaVersion(connection) == len(db_migrations.MIGRATIONS)
+
+  connection.close()
+
+def test_failed_step_leaves_the_previous_version(legacy_db_path, monkeypatch):
+  def failing_step(cursor):
+    cursor.execute("DELETE FROM Equities")
+    raise sqlite3.OperationalError('step failed')
+
+  monkeypatch.setattr(db_migrations, 'MIGRATIONS', db_migrations.MIGRATIONS + [failing_step])
+
+  with pytest.raises(sqlite3.OperationalError):
+    SecurityDatabaseWrapper(legacy_db_path)
+
+  connection = sqlite3.connect(legacy_db_path)
+
+  assert db_migrations.GetSchemaVersion(connection) == len(db_migrations.MIGRATIONS) - 1
+  assert connection.execute("SELECT COUNT(*) FROM Equities").fetchone()[0] == 2
+
+  connection.close()
+
+def test_database_from_a_newer_version_is_refused(tmp_path):
+  connection = sqlite3.connect(str(tmp_path / 'newer.db'))
+  connection.execute(f"PRAGMA user_version = {len(db_migrations.MIGRATIONS) + 1}")
+
+  with pytest.raises(RuntimeError):
+    db_migrations.Migrate(connection)
+
+  connection.close()
@@ -0,0 +1,84 @@
+import math, numpy as np
+
+from scipy.stats import norm
+from option_pricing import BlackScholes, ImpliedVolatility
+
+def scalar_call_value(s : float, x : float, r : float, t : float, o : float) -> float:
+  d1 = (math.log(s / x) + t * (r + o ** 2 * 0.5)) / (o * math.sqrt(t))
+  d2 = d1 - o * math.sqrt(t)
+
+  return s * norm.cdf(d1) - x * math.exp(-r * t) * norm.cdf(d2)
+
+rng = np.random.default_rng(5)
+CONTRACT_COUNT = 500
+UNDERLYING_PRICES = rng.uniform(5, 500, CONTRACT_COUNT)
+STRIKES = UNDERLYING_PRICES * rng.uniform(0.5, 1.5, CONTRACT_COUNT)
+INTEREST_RATES = rng.uniform(0, 0.08, CONTRACT_COUNT)
+TIMES = rng.uniform(1 / 365, 2, CONTRACT_COUNT)
+VOLATILITIES = rng.uniform(0.05, 1.5, CONTRACT_COUNT)
+
+def test_values_match_one_contract_at_a_time():
+  pricing = BlackScholes(UNDERLYING_PRICES, STRIKES, INTEREST_RATES, TIMES, VOLATILITIES)
+
+  for index in range(CONTRACT_COUNT):
+    # Values are rounded to 3 decimals the way they always have been, puts from the rounded call value
+    call_value = round(scalar_call_value(UNDERLYING_PRICES[index], STRIKES[index], INTEREST_RATES[index], TIMES[index], VOLATILITIES[index]), 3)
+    put_value = round(call_value + STRIKES[index] * math.exp(-INTEREST_RATES[index] * TIMES[index]) - UNDERLYING_PRICES[index], 3)
+
+    assert abs(pricing['CallValue'][index] - call_value) < 0.0011
+    assert abs(pricing['PutValue'][index] - put_value) < 0.0011
+
+def test_single_values_are_shared_by_every_contract():
+  shared_pricing = BlackScholes(100.0, STRIKES[:10], 0.02, 0.5, 0.3)
+  full_pricing = BlackScholes(np.full(10, 100.0), STRIKES[:10], np.full(10, 0.02), np.full(10, 0.5), np.full(10, 0.3))
+
+  for (name, values) in full_pricing.items():
+    np.testing.assert_array_equal(shared_pricing[name], values)
+
+def test_greeks_match_finite_differences():
+  step = 1e-4
+  pricing = BlackScholes(UNDERLYING_PRICES, STRIKES, INTEREST_RATES, TIMES, VOLATILITIES)
+
+  call_value = lambda s = UNDERLYING_PRICES, r = INTEREST_RATES, t = TIMES, o = VOLATILITIES: \
+    np.array([scalar_call_value(*args) for args in zip(np.broadcast_to(s, (CONTRACT_COUNT,)), STRIKES, r, t, o)])
+
+  np.testing.assert_allclose(pricing['CallDelta'], (call_value(s=UNDERLYING_PRICES + step) - call_value(s=UNDERLYING_PRICES - step)) / (2 * step), atol=1e-5)
+  np.testing.assert_allclose(pricing['Vega'], (call_value(o=VOLATILITIES + step) - call_value(o=VOLATILITIES - step)) / (2 * step), rtol=1e-4, atol=1e-4)
+  np.testing.assert_allclose(pricing['CallRho'], (call_value(r=INTEREST_RATES + step) - call_value(r=INTEREST_RATES - step)) / (2 * step), rtol=1e-4, atol=1e-4)
+
+  # Theta is the change as time passes, so as the time left shrinks
+  np.testing.assert_allclose(pricing['CallTheta'], -(call_value(t=TIMES + step) - call_value(t=TIMES - step)) / (2 * step), rtol=1e-3, atol=1e-3)
+  np.testing.assert_allclose(pricing['PutDelta'], pricing['CallDelta'] - 1)
+
+def test_expired_contracts_are_not_priced():
+  pricing = BlackScholes(100.0, 90.0, 0.02, 0.0, 0.3)
+
+  assert not np.isfinite(pricing['Gamma'][()])
+
+def test_implied_volatility_recovers_the_pricing_volatility():
+  pricing = BlackScholes(UNDERLYING_PRICES, STRIKES, INTEREST_RATES, TIMES, VOLATILITIES)
+  is_call = rng.random(CONTRACT_COUNT) < 0.5
+
+  # Unrounded prices, so every contract can be solved exactly
+  call_values = np.array([scalar_call_value(*args) for args in zip(UNDERLYING_PRICES, STRIKES, INTEREST_RATES, TIMES, VOLATILITIES)])
+  prices = np.where(is_call, call_values, call_values + STRIKES * np.exp(-INTEREST_RATES * TIMES) - UNDERLYING_PRICES)
+
+  volatilities = ImpliedVolatility(prices, UNDERLYING_PRICES, STRIKES, INTEREST_RATES, TIMES, is_call)
+
+  # Contracts worth little more than their intrinsic value barely change with volatility, so only priced ones are checked
+  has_time_value = pricing['Vega'] > 0.1
+  assert has_time_value.sum() > CONTRACT_COUNT / 2
+  np.testing.assert_allclose(volatilities[has_time_value], VOLATILITIES[has_time_value], atol=1e-4)
+
+def test_implied_volatility_is_nan_when_no_volatility_gives_the_price():
+  # Below intrinsic value, above the underlying price, and already expired
+  volatilities = ImpliedVolatility([5.0, 150.0, 12.0], 100.0, [90.0, 90.0, 90.0], 0.01, [0.5, 0.5, 0.0], True)
+
+  assert np.isnan(volatilities).all()
+
+def test_implied_volatility_of_one_contract():
+  price = scalar_call_value(100.0, 105.0, 0.03, 0.25, 0.4)
+  put_price = price + 105.0 * math.exp(-0.03 * 0.25) - 100.0
+
+  assert abs(ImpliedVolatility(price, 100.0, 105.0, 0.03, 0.25, True)[0] - 0.4) < 1e-6
+  assert abs(ImpliedVolatility(put_price, 100.0, 105.0, 0.03, 0.25, False)[0] - 0.4) < 1e-6
@@ -0,0 +1,153 @@
+import math, json, sqlite3, pytest, numpy as np, datetime as dt, http_cache, fixtures, security_db_wrapper as sdw
+
+from scipy.stats import norm
+from providers import Provider
+from security_db_wrapper import SecurityDatabaseWrapper, SecurityType, RelationalOperator, Option
+
+@pytest.fixture
+def option_chains(monkeypatch) -> dict:
+  """
+  Serves a generated TD Ameritrade option chain for each symbol in it instead of requesting one
+  """
+
+  chains = {symbol : fixtures.MakeOptionChain(symbol, strike_count=10, expiration_count=4, seed=seed) for (seed, symbol) in enumerate(['AAAA', 'BBBB'])}
+
+  session = http_cache.CachedSession(Provider.TDAmeritrade)
+  session.mount('https://api.tdameritrade.com/', fixtures.FakeOptionChainAdapter(list(chains.values())))
+  monkeypatch.setattr(sdw, 'GetSession', lambda provider: session)
+
+  return chains
+
+@pytest.fixture
+def db(tmp_path) -> SecurityDatabaseWrapper:
+  database = SecurityDatabaseWrapper(str(tmp_path / 'securities.db'))
+  yield database
+  database.CloseConnection()
+
+def get_contracts(chain : dict) -> list:
+  return [contracts[0] for exp_date_map in ['callExpDateMap', 'putExpDateMap'] for expiration in chain[exp_date_map].values() for contracts in expiration.values()]
+
+def test_options_store_their_expiration_date_and_strike(db, option_chains):
+  db.AddNewColumns(SecurityType.Option, [Option.GetOptionColumns('key', symbol, '3m', get_valuable=False) for symbol in option_chains])
+
+  contracts = {contract['symbol'] : contract for chain in option_chains.values() for contract in get_contracts(chain)}
+  options = db.GetSecurities(SecurityType.Option)
+
+  assert len(options) == len(contracts)
+
+  for option in options:
+    contract = contracts[option.Symbol]
+
+    assert option.ExpirationDate == dt.datetime.fromtimestamp(contract['expirationDate'] / 1000, dt.timezone.utc).date().isoformat()
+    assert option.Strike == contract['strikePrice']
+
+  assert db.GetOptionCompanySymbols() == set(option_chains)
+
+def test_expired_options_are_deleted(db, option_chains):
+  db.AddNewColumns(SecurityType.Option, [Option.GetOptionColumns('key', symbol, '3m', get_valuable=False) for symbol in option_chains])
+
+  options = db.GetSecurities(SecurityType.Option)
+  expired_before = dt.date.today() + dt.timedelta(days=10)
+  expired_count = sum(1 for option in options if option.ExpirationDate < expired_before.isoformat())
+
+  assert 0 < expired_count < len(options)
+  assert db.DeleteExpiredOptions(expired_before) == expired_count
+  assert all(option.ExpirationDate >= expired_before.isoformat() for option in db.GetSecurities(SecurityType.Option))
+
+def test_options_without_a_readable_expiration_are_deleted(tmp_path):
+  database_path = str(tmp_path / 'legacy.db')
+
+  # Options saved before the expiration date had a column only have it in their description
+  connection = sqlite3.connect(database_path)
+  connection.execute("""CREATE TABLE Options (CompanySymbol CHAR(10), Type CHAR(4), Description CHAR(255), Symbol CHAR(255), BlackScholesValue FLOAT(10),
+                                              TDAmeritrade FLOAT(10), Premium FLOAT(10), ContractRating FLOAT(20), LastUpdated DATETIME DEFAULT CURRENT_TIMESTAMP)""")
+  connection.executemany("INSERT INTO Options (CompanySymbol, Type, Description, Symbol) VALUES (?, ?, ?, ?)", [
+    ('MSFT', 'CALL', 'MSFT Jan 15 2099 100 Call', 'MSFT_011599C100'),
+    ('MSFT', 'CALL', 'MSFT weekly mini', 'MSFT_MINI'),
+    ('MSFT', 'PUT', None, 'MSFT_NONE')
+  ])
+  connection.commit()
+  connection.close()
+
+  db = SecurityDatabaseWrapper(database_path)
+
+  assert db.DeleteExpiredOptions(dt.date.today()) == 2
+  assert [option.Symbol for option in db.GetSecurities(SecurityType.Option)] == ['MSFT_011599C100']
+
+  db.CloseConnection()
+
+def baseline_black_scholes(contract : dict, chain : dict) -> float:
+  """
+  A contract's value the way each one was priced before chains were read into columns
+  """
+
+  s, x = chain['underlyingPrice'], contract['strikePrice']
+  r, t, o = chain['interestRate'] / 100, contract['daysToExpiration'] / 365, chain['volatility'] / 100
+
+  d1 = (math.log(s / x) + t * (r + o ** 2 * 0.5)) / (o * math.sqrt(t))
+  d2 = d1 - o * math.sqrt(t)
+  call_value = round(s * norm.cdf(d1) - x / math.exp(r * t) * norm.cdf(d2), 3)
+
+  return call_value if contract['putCall'] == 'CALL' else round(call_value + x / math.exp(r * t) - s, 3)
+
+def baseline_rating(black_scholes : float, contract : dict) -> float:
+  # Contracts worth nothing were rated by their value less their premium
+  if contract['theoreticalOptionValue'] == -999.0:
+    if black_scholes == 0:
+      return black_scholes - contract['ask']
+
+    return round((black_scholes - contract['ask']) / black_scholes * 100, 2)
+
+  return round(100 * ((black_scholes + contract['theoreticalOptionValue']) / (2 * contract['ask']) - 1), 2)
+
+@pytest.mark.parametrize('get_valuable', [True, False])
+def test_option_columns_rate_contracts_like_one_at_a_time(option_chains, get_valuable):
+  for (symbol, chain) in option_chains.items():
+    columns = Option.GetOptionColumns('key', symbol, '3m', get_valuable=get_valuable)
+    rows = {contract_symbol : index for (index, contract_symbol) in enumerate(columns['Symbol'])}
+
+    expected_symbols = set()
+
+    for contract in get_contracts(chain):
+      black_scholes = baseline_black_scholes(contract, chain)
+      is_valuable = black_scholes > contract['ask'] or contract['theoreticalOptionValue'] > contract['ask']
+
+      if get_valuable and not is_valuable:
+        continue
+
+      expected_symbols.add(contract['symbol'])
+      index = rows[contract['symbol']]
+
+      assert columns['Type'][index] == contract['putCall']
+      assert columns['Premium'][index] == contract['ask'] and columns['TDAmeritrade'][index] == contract['theoreticalOptionValue']
+      assert columns['BlackScholesValue'][index] == pytest.approx(black_scholes, abs=0.0011)
+      assert columns['ContractRating'][index] == pytest.approx(baseline_rating(black_scholes, contract), abs=0.01)
+
+    assert set(columns['Symbol']) == expected_symbols
+
+@pytest.fixture(params=['orjson', 'json'])
+def json_decoder(request, monkeypatch) -> str:
+  """
+  Parses option chains with orjson when it is installed, then with the json module it falls back to
+  """
+
+  if request.param == 'orjson':
+    monkeypatch.setattr(sdw, 'orjson', pytest.importorskip('orjson'))
+  else:
+    monkeypatch.setattr(sdw, 'orjson', None)
+
+  return request.param
+
+def test_both_json_decoders_parse_chains_the_same(json_decoder):
+  chain = fixtures.MakeOptionChain('AAAA', strike_count=10, expiration_count=4)
+  content = json.dumps(chain).encode()
+
+  columns = Option.ParseChain(content)
+  contracts = get_contracts(chain)
+
+  assert columns['CompanySymbol'] == 'AAAA' and columns['underlyingPrice'] == chain['underlyingPrice']
+  assert columns['symbol'] == [contract['symbol'] for contract in contracts]
+  assert columns['IsCall'].tolist() == [contract['putCall'] == 'CALL' for contract in contracts]
+  np.testing.assert_array_equal(columns['theoreticalOptionValue'], [contract['theoreticalOptionValue'] for contract in contracts])
+
+  assert Option.ParseChain(json.dumps({'symbol' : 'AAAA', 'underlyingPrice' : 0}).encode()) == None
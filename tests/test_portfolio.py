@@ -0,0 +1,101 @@
+import math, pytest, numpy as np, pandas as pd, analyze, portfolio
+
+from portfolio import BuildPriceMatrix, BacktestPortfolio, ValidateSchedule, ParseWeights
+
+def make_prices(symbol_count = 2, day_count = 400, seed = 0):
+  rng = np.random.default_rng(seed)
+  dates = np.arange(np.datetime64('2020-01-01'), np.datetime64('2020-01-01') + np.timedelta64(day_count, 'D'))
+  prices = 50 * np.exp(np.cumsum(rng.normal(0, 0.01, (day_count, symbol_count)), axis=0))
+
+  return dates, [f'S{index}' for index in range(symbol_count)], prices
+
+def test_price_matrix_carries_prices_forward():
+  price_history = {
+    'A' : pd.Series([1.0, 2.0, 3.0], index=pd.to_datetime(['2020-01-01', '2020-01-02', '2020-01-06'])),
+    'B' : pd.Series([10.0, 20.0], index=pd.to_datetime(['2020-01-02', '2020-01-03']))
+  }
+
+  dates, symbols, prices = BuildPriceMatrix(price_history, chunk_column_count=1)
+
+  assert symbols == ['A', 'B']
+  assert list(dates.astype(str)) == ['2020-01-01', '2020-01-02', '2020-01-03', '2020-01-06']
+  np.testing.assert_array_equal(prices, [[1, np.nan], [2, 10], [2, 20], [3, 20]])
+
+@pytest.mark.parametrize('period', [1, 7, 30, 7.5, 2.25])
+def test_periodic_investments_land_on_every_multiple_of_the_period(period):
+  dates, symbols, prices = make_prices(symbol_count=1)
+
+  results = BacktestPortfolio(dates, symbols, prices, {'S0' : 1}, 1000, 100, period)
+
+  investment_rows = sorted(set(math.floor(k * period) for k in range(1, int((len(dates) - 1) / period) + 1)))
+  expected_shares = 1000 / prices[0, 0] + sum(100 / prices[row, 0] for row in investment_rows)
+
+  assert results['Money Spent'] == 1000 + 100 * len(investment_rows)
+  assert results['Holdings']['S0'] == pytest.approx(expected_shares)
+
+def test_rebalancing_restores_the_target_weights():
+  dates, symbols, prices = make_prices()
+
+  results = BacktestPortfolio(dates, symbols, prices, {'S0' : 3, 'S1' : 1}, 1000, rebalance='m')
+
+  last_rebalance_row = np.flatnonzero(dates.astype('datetime64[D]') == np.datetime64('2021-02-01'))[0]
+  values = np.array([results['Holdings'][symbol] for symbol in symbols]) * prices[last_rebalance_row]
+
+  np.testing.assert_allclose(values / values.sum(), [0.75, 0.25])
+  assert results['Daily Values'][-1] == pytest.approx(results['Market Value'])
+
+@pytest.mark.parametrize('rebalance', [None, 30])
+def test_withdrawals_stop_when_the_portfolio_is_empty(rebalance):
+  dates, symbols, prices = make_prices()
+
+  results = BacktestPortfolio(dates, symbols, prices, {'S0' : 1, 'S1' : 1}, 1000, -150, 30, rebalance)
+
+  assert all(shares >= 0 and shares == pytest.approx(0) for shares in results['Holdings'].values())
+  assert np.all(results['Daily Values'] >= 0)
+  assert results['Market Value'] == pytest.approx(0)
+
+def test_withdrawals_sell_every_holding_evenly():
+  dates, symbols, prices = make_prices()
+
+  results = BacktestPortfolio(dates, symbols, prices, {'S0' : 1, 'S1' : 1}, 1000, -150, 30)
+
+  # Withdraw at most what the portfolio is worth, selling the same share of every holding
+  shares = 500 / prices[0]
+  money_spent = 1000.0
+
+  for row in range(30, len(dates), 30):
+    value = np.dot(shares, prices[row])
+    withdrawal = min(150, value)
+    shares = shares * (1 - withdrawal / value) if value > 0 else shares
+    money_spent -= withdrawal
+
+    np.testing.assert_allclose(results['Daily Values'][row], np.dot(shares, prices[row]), atol=1e-9)
+
+  assert results['Money Spent'] == pytest.approx(money_spent)
+  assert 0 < money_spent < 1000 - 150 * 5
+
+@pytest.mark.parametrize('schedule', [0, -7, float('nan'), float('inf'), 'd'])
+def test_invalid_schedules_are_rejected(schedule):
+  with pytest.raises(ValueError):
+    ValidateSchedule(schedule)
+
+  dates, symbols, prices = make_prices()
+
+  with pytest.raises(ValueError):
+    BacktestPortfolio(dates, symbols, prices, {'S0' : 1}, 1000, 100, schedule)
+
+  with pytest.raises(ValueError):
+    BacktestPortfolio(dates, symbols, prices, {'S0' : 1}, 1000, rebalance=schedule)
+
+def test_backtest_portfolio_command_rejects_invalid_periods(fake_data_reader, monkeypatch):
+  messages = []
+  monkeypatch.setattr(analyze, 'ProgramStatusUpdate', lambda message, log=False: messages.append(message))
+
+  analyze.__dict__['__handle_backtest_portfolio_command'](iter(['AAAA,AAAB', '1y', '1000', '100', '0']))
+  analyze.__dict__['__handle_backtest_portfolio_command'](iter(['AAAA,AAAB', '1y', '1000', '100', '30', 'x']))
+
+  assert len(messages) == 2 and all(message.startswith('Invalid portfolio backtest parameters') for message in messages)
+  assert fake_data_reader.CallCount == 0
+
+def test_parse_weights():
+  assert ParseWeights('msft:2,AAPL:0.5,spy') == {'MSFT' : 2.0, 'AAPL' : 0.5, 'SPY' : 1.0}
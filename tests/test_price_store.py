@@ -0,0 +1,166 @@
+import os, pytest, fixtures, pandas as pd, datetime as dt, security_db_wrapper as sdw
+
+from price_store import PriceStore
+
+class ServedHistory:
+  """
+  Stand-in for pandas_datareader.DataReader that serves one history, which the test can replace as Yahoo would
+  """
+
+  def __init__(self, df : pd.DataFrame):
+    self.History = df
+    self.Calls = []
+
+  def __call__(self, symbol, data_source='yahoo', start=None, end=None, session=None):
+    self.Calls.append(pd.Timestamp(start).normalize())
+    return self.History.loc[pd.Timestamp(start).strftime('%Y-%m-%d'):pd.Timestamp(end).strftime('%Y-%m-%d')]
+
+@pytest.fixture
+def price_store(tmp_path, monkeypatch) -> PriceStore:
+  store = PriceStore(str(tmp_path))
+  monkeypatch.setattr(sdw.Equity, 'price_store', store)
+
+  return store
+
+def get_market_date() -> dt.date:
+  return dt.datetime.now(sdw.Equity.MARKET_TIME_ZONE).date()
+
+def make_history(last_date : dt.date) -> pd.DataFrame:
+  return fixtures.MakePriceHistory(7, start_date=dt.date(2015, 1, 2), end_date=last_date)
+
+def set_write_time(directory_path : str, symbol : str, day : dt.date, time_of_day : dt.time) -> None:
+  written_time = dt.datetime.combine(day, time_of_day, tzinfo=sdw.Equity.MARKET_TIME_ZONE).timestamp()
+  os.utime(os.path.join(directory_path, f'{symbol}.npy'), (written_time, written_time))
+
+def read_max(symbol : str) -> pd.DataFrame:
+  return sdw.Equity.GetHistoricalDataOverTimeRanges(symbol, ['Max'])[0]
+
+def test_write_and_read_round_trip(price_store):
+  df = make_history(dt.date(2020, 6, 30))
+  price_store.Write('BRK.B', df)
+
+  pd.testing.assert_frame_equal(price_store.Read('BRK.B'), df, check_freq=False, check_index_type=False)
+  assert price_store.GetLastDate('BRK.B') == dt.datetime(2020, 6, 30)
+  assert price_store.Read('NONE') is None and price_store.GetLastWriteTime('NONE') is None
+
+def test_append_overwrites_overlapping_days(price_store):
+  df = make_history(dt.date(2020, 6, 30))
+  price_store.Write('AAAA', df.iloc[:-5])
+
+  newer_df = df.iloc[-7:].copy()
+  newer_df['Close'] += 1
+  price_store.Append('AAAA', newer_df)
+
+  stored_df = price_store.Read('AAAA')
+  assert len(stored_df.index) == len(df.index)
+  pd.testing.assert_frame_equal(stored_df.iloc[-7:], newer_df, check_freq=False, check_index_type=False)
+  pd.testing.assert_frame_equal(stored_df.iloc[:-7], df.iloc[:-7], check_freq=False, check_index_type=False)
+
+def test_only_new_days_are_downloaded(price_store, monkeypatch):
+  history = make_history(get_market_date())
+  served_history = ServedHistory(history)
+  monkeypatch.setattr(sdw, 'DataReader', served_history)
+
+  price_store.Write('AAAA', history.iloc[:-3])
+  df = read_max('AAAA')
+
+  # The last two stored days are downloaded again to check that they have not been adjusted
+  assert served_history.Calls == [history.index[-5]]
+  pd.testing.assert_frame_equal(df, history, check_freq=False, check_index_type=False)
+
+def test_readjusted_history_is_downloaded_again(price_store, monkeypatch):
+  history = make_history(get_market_date())
+  price_store.Write('AAAA', history.iloc[:-3])
+
+  # A dividend lowers the adjusted close of every day before it
+  readjusted_history = history.copy()
+  readjusted_history.iloc[:-2, readjusted_history.columns.get_loc('Adj Close')] *= 0.98
+  served_history = ServedHistory(readjusted_history)
+  monkeypatch.setattr(sdw, 'DataReader', served_history)
+
+  df = read_max('AAAA')
+
+  assert served_history.Calls == [history.index[-5], pd.Timestamp(1900, 1, 1)]
+  pd.testing.assert_frame_equal(df, readjusted_history, check_freq=False, check_index_type=False)
+
+def test_split_is_downloaded_again(price_store, monkeypatch):
+  history = make_history(get_market_date())
+  price_store.Write('AAAA', history.iloc[:-3])
+
+  # Yahoo's close is adjusted for splits too
+  split_history = history.copy()
+  split_history.iloc[:-2, [split_history.columns.get_loc('Close'), split_history.columns.get_loc('Adj Close')]] /= 2
+  monkeypatch.setattr(sdw, 'DataReader', ServedHistory(split_history))
+
+  pd.testing.assert_frame_equal(read_max('AAAA'), split_history, check_freq=False, check_index_type=False)
+
+def test_day_stored_before_the_close_is_refreshed(price_store, tmp_path, monkeypatch):
+  history = make_history(get_market_date() - dt.timedelta(days=1))
+  last_date = history.index[-1].date()
+
+  intraday_history = history.copy()
+  intraday_history.iloc[-1, intraday_history.columns.get_loc('Close')] *= 1.05
+  price_store.Write('AAAA', intraday_history)
+  set_write_time(tmp_path, 'AAAA', last_date, dt.time(11, 0))
+
+  served_history = ServedHistory(history)
+  monkeypatch.setattr(sdw, 'DataReader', served_history)
+
+  read_max('AAAA')
+
+  # The stored day that changed was not final, so it is replaced without downloading the full history
+  assert served_history.Calls == [history.index[-2]]
+  pd.testing.assert_frame_equal(price_store.Read('AAAA'), history, check_freq=False, check_index_type=False)
+
+def test_day_stored_after_the_close_is_not_downloaded_again(price_store, tmp_path, monkeypatch):
+  market_date = get_market_date()
+  history = make_history(market_date)
+  history = history.rename(index={history.index[-1] : pd.Timestamp(market_date)})
+
+  price_store.Write('AAAA', history)
+  set_write_time(tmp_path, 'AAAA', market_date, dt.time(16, 30))
+
+  served_history = ServedHistory(history)
+  monkeypatch.setattr(sdw, 'DataReader', served_history)
+
+  read_max('AAAA')
+  assert served_history.Calls == []
+
+  # Stored before the close of the same day, it is downloaded again
+  set_write_time(tmp_path, 'AAAA', market_date, dt.time(12, 0))
+  read_max('AAAA')
+  assert len(served_history.Calls) == 1
+
+@pytest.mark.parametrize('now, session_date', [
+  (dt.datetime(2026, 10, 16, 12, 0), dt.date(2026, 10, 16)),   # During Friday's session
+  (dt.datetime(2026, 10, 17, 12, 0), dt.date(2026, 10, 16)),   # Saturday
+  (dt.datetime(2026, 10, 19, 8, 0), dt.date(2026, 10, 16)),    # Monday before the open
+  (dt.datetime(2026, 10, 19, 9, 30), dt.date(2026, 10, 19)),
+  (dt.datetime(2026, 11, 27, 9, 0), dt.date(2026, 11, 25)),    # Before the open the day after Thanksgiving
+  (dt.datetime(2026, 7, 3, 17, 0), dt.date(2026, 7, 2)),       # Independence Day on a Saturday is observed on Friday
+  (dt.datetime(2026, 4, 3, 12, 0), dt.date(2026, 4, 2)),       # Good Friday
+  (dt.datetime(2027, 1, 1, 12, 0), dt.date(2026, 12, 31))
+], ids=str)
+def test_last_session_date_skips_weekends_and_holidays(now, session_date):
+  assert sdw.Equity.GetLastSessionDate(now.replace(tzinfo=sdw.Equity.MARKET_TIME_ZONE)) == session_date
+
+def test_final_last_session_is_not_downloaded_again_until_the_next_one(price_store, tmp_path, monkeypatch):
+  friday = dt.date(2026, 10, 16)
+  history = make_history(friday)
+
+  price_store.Write('AAAA', history)
+  set_write_time(tmp_path, 'AAAA', friday, dt.time(16, 30))
+
+  served_history = ServedHistory(history)
+  monkeypatch.setattr(sdw, 'DataReader', served_history)
+
+  # Over the weekend, Friday is still the last session
+  monkeypatch.setattr(sdw.Equity, 'GetLastSessionDate', staticmethod(lambda now=None: friday))
+  read_max('AAAA')
+  read_max('AAAA')
+  assert served_history.Calls == []
+
+  # Once Monday's session opens, its prices are downloaded
+  monkeypatch.setattr(sdw.Equity, 'GetLastSessionDate', staticmethod(lambda now=None: dt.date(2026, 10, 19)))
+  read_max('AAAA')
+  assert served_history.Calls == [history.index[-2]]
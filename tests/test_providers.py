@@ -0,0 +1,163 @@
+import time, pytest, requests, threading, email.utils, datetime as dt, providers, http_cache, fixtures, security_db_wrapper as sdw
+
+from providers import Provider, TokenBucket, ParseRetryAfter
+from pandas_datareader.base import _BaseReader
+
+class RateLimitedAdapter(requests.adapters.BaseAdapter):
+  """
+  Answers every request with an HTTP 429 response and the given Retry-After header
+  """
+
+  def __init__(self, retry_after : str):
+    super().__init__()
+    self.__retry_after = retry_after
+
+  def send(self, request, **kwargs):
+    response = requests.Response()
+    response.url = request.url
+    response.request = request
+    response.status_code = 429
+    response.headers['Retry-After'] = self.__retry_after
+    response._content = b''
+
+    return response
+
+  def close(self):
+    pass
+
+@pytest.fixture
+def pauses(monkeypatch):
+  pauses = []
+  monkeypatch.setattr(providers, 'PauseProvider', lambda provider, seconds: pauses.append((provider, seconds)))
+
+  return pauses
+
+def test_token_bucket_allows_a_burst_then_the_rate():
+  bucket = TokenBucket(600, 3)
+
+  start_time = time.monotonic()
+  for _ in range(3):
+    bucket.Acquire()
+  burst_time = time.monotonic() - start_time
+
+  for _ in range(3):
+    bucket.Acquire()
+
+  assert burst_time < 0.05
+  assert time.monotonic() - start_time == pytest.approx(0.3, abs=0.05)
+
+def test_pause_holds_back_callers_that_already_have_a_token():
+  bucket = TokenBucket(600, 1)
+  bucket.Acquire()
+
+  # The next token is reserved at once and is the thread's after 0.1 seconds
+  acquired_time = []
+  thread = threading.Thread(target=lambda: (bucket.Acquire(), acquired_time.append(time.monotonic())))
+  start_time = time.monotonic()
+  thread.start()
+
+  time.sleep(0.05)
+  bucket.Pause(0.4)
+  thread.join()
+
+  assert acquired_time[0] - start_time >= 0.45
+
+def test_retry_after_is_read_as_seconds_or_a_date():
+  retry_time = dt.datetime.now(dt.timezone.utc) + dt.timedelta(seconds=120)
+
+  assert ParseRetryAfter('30') == 30
+  assert ParseRetryAfter(email.utils.format_datetime(retry_time, usegmt=True)) == pytest.approx(120, abs=2)
+  assert ParseRetryAfter('Wed, 21 Oct 2015 07:28:00 GMT') == 0
+  assert ParseRetryAfter(None) == 60 and ParseRetryAfter('soon', default=5) == 5
+
+@pytest.mark.parametrize('provider', list(Provider))
+def test_rate_limited_responses_pause_the_session_provider(pauses, provider):
+  session = http_cache.CachedSession(provider)
+  session.mount('https://', RateLimitedAdapter('Wed, 21 Oct 2099 07:28:00 GMT'))
+
+  assert session.get('https://example.com/').status_code == 429
+  assert len(pauses) == 1 and pauses[0][0] == provider and pauses[0][1] > 60
+
+def test_sessions_without_a_provider_do_not_pause(pauses):
+  session = http_cache.CachedSession()
+  session.mount('https://', RateLimitedAdapter('10'))
+
+  session.get('https://example.com/')
+
+  assert pauses == []
+
+def test_yahoo_downloads_use_the_yahoo_session(monkeypatch):
+  sessions = []
+  data_reader = fixtures.FakeDataReader(pool_size=1)
+
+  def data_reader_with_session(symbol, session=None, **kwargs):
+    sessions.append(session)
+    return data_reader(symbol, session=session, **kwargs)
+
+  monkeypatch.setattr(sdw, 'DataReader', data_reader_with_session)
+  monkeypatch.setattr(sdw.Equity, 'price_store', None)
+
+  sdw.Equity.GetHistoricalData('AAAA', '1m')
+
+  assert sessions[0] is http_cache.GetSession(Provider.Yahoo) and sessions[0].Provider == Provider.Yahoo
+
+def test_rate_limited_option_chains_pause_td_ameritrade(pauses, monkeypatch):
+  session = http_cache.CachedSession(Provider.TDAmeritrade)
+  session.mount('https://', RateLimitedAdapter('15'))
+  monkeypatch.setattr(sdw, 'GetSession', lambda provider: session)
+
+  assert sdw.Option.GetOptionColumns('key', 'AAAA', '1m') == None
+  assert pauses == [(Provider.TDAmeritrade, 15)]
+
+class PooledAdapter(requests.adapters.HTTPAdapter):
+  """
+  Takes a connection pool from its pool manager for every request like HTTPAdapter does, then answers without sending anything
+  """
+
+  def __init__(self):
+    super().__init__()
+    self.Pools = []
+
+  def send(self, request, **kwargs):
+    self.Pools.append(self.poolmanager.connection_from_url(request.url))
+
+    response = requests.Response()
+    response.url = request.url
+    response.request = request
+    response.status_code = 200
+    response._content = b''
+
+    return response
+
+class ClosingReader(_BaseReader):
+  """
+  A pandas_datareader reader, which closes the session it is given once it has read the data
+  """
+
+  @property
+  def url(self):
+    return f'https://query1.finance.yahoo.com/v7/finance/download/{self.symbols}'
+
+  def _read_one_data(self, url, params):
+    self.session.get(url, params=params)
+    return fixtures.MakePriceHistory(0, start_date=dt.date(2020, 1, 2), end_date=dt.date(2020, 2, 3))
+
+@pytest.fixture
+def yahoo_adapter(monkeypatch) -> PooledAdapter:
+  adapter = PooledAdapter()
+  session = http_cache.GetSession(Provider.Yahoo)
+  session.mount('https://query1.finance.yahoo.com/', adapter)
+  monkeypatch.setattr(sdw, 'DataReader', lambda symbol, data_source, start, end, session: ClosingReader(symbol, start, end, session=session).read())
+
+  yield adapter
+
+  session.adapters.pop('https://query1.finance.yahoo.com/')
+
+def test_downloads_keep_the_shared_session_open(yahoo_adapter):
+  for _ in range(2):
+    df = sdw.Equity._Equity__download_historical_data('MSFT', dt.datetime(2020, 1, 2), dt.datetime(2020, 2, 3))
+    assert len(df.index) > 0
+
+  # Closing the session would have cleared the pool manager, so the second download would have opened a new pool
+  assert len(yahoo_adapter.Pools) == 2 and yahoo_adapter.Pools[0] is yahoo_adapter.Pools[1]
+  assert http_cache.GetSession(Provider.Yahoo).get_adapter('https://query1.finance.yahoo.com/') is yahoo_adapter
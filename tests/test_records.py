@@ -0,0 +1,51 @@
+import pickle, pytest
+
+from security_db_wrapper import Equity, EquityListing, Backtest
+
+def test_properties_are_read_and_set_as_attributes():
+  equity = Equity('MSFT', 'Microsoft', 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0)
+
+  setattr(equity, '1Y', 50.0)
+  equity.CompanyName = 'Microsoft Corp'
+
+  assert (equity.Symbol, equity.CompanyName, getattr(equity, '1Y'), equity.Max) == ('MSFT', 'Microsoft Corp', 50.0, 8.0)
+
+def test_unset_properties_are_left_out():
+  listing = EquityListing(Symbol='MSFT', CompanyName='Microsoft')
+
+  with pytest.raises(AttributeError):
+    listing.Delisted
+
+  assert listing.to_dict() == {'Symbol' : 'MSFT', 'CompanyName' : 'Microsoft'}
+
+  listing.Delisted = 0
+  assert listing.to_dict() == {'Symbol' : 'MSFT', 'CompanyName' : 'Microsoft', 'Delisted' : 0}
+
+def test_records_from_the_same_row_are_independent():
+  row = ('MSFT', 'Microsoft', 0)
+  first_listing, second_listing = EquityListing.FromRow(row), EquityListing.FromRow(row)
+
+  first_listing.Delisted = 1
+
+  assert second_listing.Delisted == 0 and row == ('MSFT', 'Microsoft', 0)
+  assert first_listing.to_dict() == {'Symbol' : 'MSFT', 'CompanyName' : 'Microsoft', 'Delisted' : 1}
+
+def test_every_property_can_be_set_in_turn():
+  backtest = Backtest.FromRow([None] * len(Backtest._properties))
+
+  for (index, name) in enumerate(Backtest._properties, start=0):
+    setattr(backtest, name, index)
+
+  assert backtest.to_dict() == {name : index for (index, name) in enumerate(Backtest._properties, start=0)}
+
+def test_records_have_no_instance_dict():
+  with pytest.raises(AttributeError):
+    Equity('MSFT', 'Microsoft').Price = 1.0
+
+def test_pickled_records_keep_unset_properties():
+  backtest = pickle.loads(pickle.dumps(Backtest('MSFT', '1Y', 1000.0, 100.0, 7.0)))
+
+  assert backtest.to_dict() == {'Symbol' : 'MSFT', 'StartRange' : '1Y', 'Principal' : 1000.0, 'PeriodicInvestment' : 100.0, 'Period' : 7.0}
+
+  with pytest.raises(AttributeError):
+    backtest.LastUpdated